@@ -9,6 +9,66 @@ class Settings(BaseSettings):
     database_path: str = "data/diane.db"
     # aceita OPENAI_API_KEY no .env mas não usa (evita "Extra inputs" se só tiver essa chave)
     openai_api_key: str = ""
+    # backend do LLM: "gemini" ou "fake" (local, para benchmark/teste de carga sem rede nem cota)
+    llm_provider: str = "gemini"
+    fake_llm_latency_ms: float = 300.0
+    fake_llm_error_rate: float = 0.0
+    fake_llm_quota_error_rate: float = 0.0
+    fake_llm_responses_path: str = ""
+    fake_llm_seed: int = 0
+    # timeout (s) de cada chamada de extração; a que estourar é cancelada e ignorada
+    llm_extract_timeout: float = 20.0
+    # "separate": 3 prompts de extração por mensagem; "unified": 1 prompt que classifica e extrai
+    extraction_mode: str = "separate"
+    # parser local (app/fastpath.py) antes do LLM para mensagens de formato comum
+    fastpath_enabled: bool = True
+    # cache LRU dos resultados de extração (0 desliga) e idade máxima das entradas em segundos
+    extraction_cache_size: int = 1024
+    extraction_cache_ttl: float = 3600.0
+    # máximo de chamadas simultâneas ao Gemini (tamanho do pool de threads do LLM)
+    llm_max_concurrency: int = 8
+    # rate limit local das chamadas ao Gemini, retries com backoff e circuit breaker de cota.
+    # Cada mensagem do chat faz até 4 chamadas (3 extrações no modo "separate" ou 1 no "unified",
+    # nenhuma quando o parser local resolve, + a resposta) e, a cada chat_summary_every_turns
+    # turnos, mais uma para o resumo. 0 desliga o limite local (default: fica só o backoff/breaker
+    # sobre o 429 do Gemini); ao ligar, usar a cota do projeto em RPM, ex. 15 no gratuito do
+    # gemini-flash, que dá ~4 mensagens/min.
+    llm_rate_per_minute: float = 0.0
+    llm_rate_burst: int = 10
+    llm_rate_max_wait: float = 10.0
+    llm_max_retries: int = 2
+    llm_backoff_base: float = 1.0
+    llm_backoff_max: float = 8.0
+    llm_breaker_threshold: int = 3
+    llm_breaker_cooldown: float = 60.0
+    # prompt logs gravados em lote por uma task de fundo (tamanho máx. da fila, do lote e intervalo em s)
+    prompt_log_queue_size: int = 1000
+    prompt_log_batch_size: int = 100
+    prompt_log_flush_interval: float = 1.0
+    # memória do chat: resumo refeito a cada N turnos (pergunta + resposta) + janela recente por tokens
+    chat_summary_every_turns: int = 5
+    chat_history_token_budget: int = 1500
+    chat_history_max_messages: int = 20
+    # pool de conexões SQLite (aberto no lifespan) e PRAGMAs aplicados a cada conexão
+    db_pool_size: int = 4
+    db_health_check_interval: float = 30.0
+    db_busy_timeout_ms: int = 5000
+    db_synchronous: str = "NORMAL"
+    db_cache_size_kb: int = 20000
+    db_mmap_size: int = 256 * 1024 * 1024
+    db_write_batch_size: int = 64  # sessões de escrita por group commit
+    # POST /chat/batch: máximo de mensagens por requisição e extrações em paralelo. Modo de extração
+    # do lote: vazio segue extraction_mode (mesma extração do chat); "unified" gasta 1 chamada por
+    # mensagem em vez de 3, para importar muitas mensagens com menos cota.
+    chat_batch_max_messages: int = 200
+    chat_batch_concurrency: int = 8
+    chat_batch_extraction_mode: str = ""
+    # exportação em stream (/api/export): linhas lidas do SQLite por fetchmany. Cada exportação usa
+    # uma conexão de leitura própria (fora do pool), aberta durante o download inteiro; no máximo
+    # export_max_concurrent ao mesmo tempo (as demais esperam a vez), porque leitor longo segura o
+    # checkpoint do WAL e o arquivo -wal cresce enquanto ele dura.
+    export_batch_size: int = 1000
+    export_max_concurrent: int = 2
 
     model_config = {
         "env_file": ".env",
@@ -1,107 +1,408 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Optional
+
 import aiosqlite
 from contextlib import asynccontextmanager
 from pathlib import Path
 
-from app.config import get_db_path
+from app.config import get_db_path, settings
+from app.migrations import migrate
+
+logger = logging.getLogger(__name__)
 
 
 DB_PATH = str(get_db_path())
 
 
 async def init_db() -> None:
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS accounts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                balance REAL NOT NULL DEFAULT 0,
-                created_at TEXT NOT NULL DEFAULT (datetime('now'))
-            )
-        """)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS categories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                created_at TEXT NOT NULL DEFAULT (datetime('now'))
-            )
-        """)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                amount REAL NOT NULL,
-                description TEXT NOT NULL,
-                category_id INTEGER NOT NULL REFERENCES categories(id),
-                account_id INTEGER REFERENCES accounts(id),
-                tx_date TEXT NOT NULL,
-                created_at TEXT NOT NULL DEFAULT (datetime('now'))
-            )
-        """)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS chat_messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                created_at TEXT NOT NULL DEFAULT (datetime('now'))
-            )
-        """)
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_tx_date ON transactions(tx_date)")
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_tx_account ON transactions(account_id)")
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_tx_category ON transactions(category_id)")
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS shopping_lists (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                active INTEGER NOT NULL DEFAULT 0,
-                created_at TEXT NOT NULL DEFAULT (datetime('now')),
-                updated_at TEXT NOT NULL DEFAULT (datetime('now'))
-            )
-        """)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS shopping_list_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                list_id INTEGER NOT NULL REFERENCES shopping_lists(id) ON DELETE CASCADE,
-                name TEXT NOT NULL,
-                checked INTEGER NOT NULL DEFAULT 0,
-                created_at TEXT NOT NULL DEFAULT (datetime('now'))
-            )
-        """)
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_shopping_items_list ON shopping_list_items(list_id)")
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS prompt_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                kind TEXT NOT NULL,
-                prompt_text TEXT NOT NULL,
-                response_text TEXT NOT NULL,
-                model TEXT NOT NULL,
-                created_at TEXT NOT NULL DEFAULT (datetime('now'))
-            )
-        """)
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_prompt_logs_created ON prompt_logs(created_at)")
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_prompt_logs_kind ON prompt_logs(kind)")
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS product_prices (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_name TEXT NOT NULL,
-                market_name TEXT NOT NULL,
-                price REAL NOT NULL,
-                recorded_at TEXT NOT NULL DEFAULT (datetime('now'))
-            )
-        """)
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_product_prices_product ON product_prices(product_name)")
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_product_prices_recorded ON product_prices(recorded_at)")
-        default_cats = [
-            "Alimentação", "Transporte", "Moradia", "Saúde", "Educação",
-            "Lazer", "Compras", "Serviços", "Salário", "Investimentos", "Outros",
-        ]
-        for name in default_cats:
-            await db.execute(
-                "INSERT OR IGNORE INTO categories (name) VALUES (?)", (name,)
-            )
-        await db.commit()
+    """Deixa o schema na última versão (app/migrations.py); com o banco em dia, só confere a versão."""
+    version = await migrate(DB_PATH)
+    logger.debug("schema na versão %d", version)
+
+
+_savepoint_ids = itertools.count(1)
+
+
+@asynccontextmanager
+async def transaction(conn: aiosqlite.Connection):
+    """Unidade de trabalho: as escritas dos repositórios feitas dentro do bloco entram juntas,
+    com um commit só no fim, ou são todas desfeitas se o bloco levantar exceção.
+
+    Aninhado (já dentro de uma transação), vira um SAVEPOINT: um erro desfaz só o bloco interno
+    e a exceção sobe para quem chamou, que pode tratá-la e seguir com a transação de fora.
+
+    A transação de fora usa BEGIN IMMEDIATE, que reserva a escrita já no início: sem isso, uma
+    leitura seguida de escrita pode esbarrar em outra conexão escrevendo e falhar com
+    "database is locked"."""
+    if conn.in_transaction:
+        name = f"sp_{next(_savepoint_ids)}"
+        await conn.execute(f"SAVEPOINT {name}")
+        try:
+            yield conn
+        except BaseException:
+            await conn.execute(f"ROLLBACK TO {name}")
+            await conn.execute(f"RELEASE {name}")
+            raise
+        await conn.execute(f"RELEASE {name}")
+        return
+    await conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        await conn.rollback()
+        raise
+    await conn.commit()
+
+
+async def _connect(read_only: bool = False) -> aiosqlite.Connection:
+    """Nova conexão com row_factory e os PRAGMAs de desempenho (valem por conexão).
+    Em autocommit (isolation_level=None): fora de transaction(), cada escrita vale sozinha.
+    read_only liga o query_only: as conexões de leitura do pool recusam qualquer escrita."""
+    conn = await aiosqlite.connect(DB_PATH, isolation_level=None)
+    conn.row_factory = aiosqlite.Row
+    await conn.execute(f"PRAGMA busy_timeout = {int(settings.db_busy_timeout_ms)}")
+    await conn.execute(f"PRAGMA synchronous = {settings.db_synchronous}")
+    await conn.execute(f"PRAGMA cache_size = {-int(settings.db_cache_size_kb)}")
+    await conn.execute(f"PRAGMA mmap_size = {int(settings.db_mmap_size)}")
+    await conn.execute("PRAGMA temp_store = MEMORY")
+    if read_only:
+        await conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+class ConnectionPool:
+    """Conexões de leitura abertas uma vez e reaproveitadas entre requests (cada uma com sua thread
+    do aiosqlite e seu cache de páginas); em WAL, leem em paralelo com o writer. Na devolução, transação deixada aberta é desfeita; conexão
+    parada há mais de db_health_check_interval passa por um SELECT 1 antes de ser entregue, e
+    conexão com erro é trocada por uma nova."""
+
+    def __init__(self, size: int) -> None:
+        self.size = max(1, size)
+        self._idle: asyncio.Queue[tuple[aiosqlite.Connection, float]] = asyncio.Queue()
+        self._stats = {"checkouts": 0, "waits": 0, "replaced": 0, "rollbacks": 0}
+
+    async def open(self) -> None:
+        for _ in range(self.size):
+            self._idle.put_nowait((await _connect(read_only=True), time.monotonic()))
+
+    async def close(self) -> None:
+        while not self._idle.empty():
+            conn, _ = self._idle.get_nowait()
+            await conn.close()
+
+    async def _replace(self, conn: aiosqlite.Connection) -> aiosqlite.Connection:
+        self._stats["replaced"] += 1
+        try:
+            await conn.close()
+        except Exception:
+            pass
+        return await _connect(read_only=True)
+
+    async def _checkout(self) -> aiosqlite.Connection:
+        if self._idle.empty():
+            self._stats["waits"] += 1
+        conn, idle_since = await self._idle.get()
+        self._stats["checkouts"] += 1
+        if time.monotonic() - idle_since > settings.db_health_check_interval:
+            try:
+                await conn.execute("SELECT 1")
+            except Exception:
+                logger.warning("conexão do pool com erro; abrindo outra")
+                try:
+                    conn = await self._replace(conn)
+                except BaseException:
+                    self._idle.put_nowait((conn, 0.0))  # não perde a vaga; tenta de novo na próxima
+                    raise
+        return conn
+
+    async def _release(self, conn: aiosqlite.Connection) -> None:
+        try:
+            if conn.in_transaction:
+                self._stats["rollbacks"] += 1
+                await conn.rollback()
+        except Exception:
+            logger.warning("falha ao limpar conexão do pool; abrindo outra")
+            try:
+                conn = await self._replace(conn)
+            except Exception:
+                logger.exception("não foi possível reabrir conexão do pool")
+                self.size -= 1
+                return
+        self._idle.put_nowait((conn, time.monotonic()))
+
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self._checkout()
+        try:
+            yield conn
+        finally:
+            await self._release(conn)
+
+    def stats(self) -> dict[str, Any]:
+        return {**self._stats, "size": self.size, "idle": self._idle.qsize()}
+
+
+class _WriteJob:
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.granted: asyncio.Future = loop.create_future()    # writer entrega a conexão
+        self.finished: asyncio.Future = loop.create_future()   # sessão terminou o bloco (ok?)
+        self.committed: asyncio.Future = loop.create_future()  # commit do grupo saiu
+
+
+class Writer:
+    """Conexão única de escrita, dona de todas as escritas do app. As sessões (write_session) entram
+    numa fila; a task do writer abre uma transação, entrega a conexão a uma sessão de cada vez
+    (cada uma num SAVEPOINT, então um erro desfaz só aquela sessão) e, quando a fila esvazia ou o
+    grupo chega a db_write_batch_size sessões, faz um commit só para o grupo todo (group commit).
+
+    Como só essa conexão escreve, as escritas não disputam o lock do SQLite entre si: com mais
+    requests simultâneos os grupos ficam maiores e o custo do commit se divide entre eles, em vez
+    de virar "database is locked"."""
+
+    # espera entre tentativas de reabrir a conexão de escrita (dobra a cada falha, até o teto)
+    REOPEN_BACKOFF = (0.05, 2.0)
+
+    def __init__(self, batch_size: int) -> None:
+        self.batch_size = max(1, batch_size)
+        self._queue: asyncio.Queue[Optional[_WriteJob]] = asyncio.Queue()
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: list[_WriteJob] = []  # sessões já tiradas da fila, ainda sem commit
+        self._stopping = False
+        self._dead: Optional[BaseException] = None
+        self._stats = {
+            "sessions": 0, "commits": 0, "failed_commits": 0, "max_group": 0, "reopens": 0,
+        }
+
+    async def open(self) -> None:
+        self._conn = await _connect()
+        self._task = asyncio.create_task(self._run())
+        self._task.add_done_callback(self._on_done)
+
+    async def close(self) -> None:
+        """Termina as sessões já na fila e fecha a conexão."""
+        if self._task is not None:
+            await self._queue.put(None)
+            try:
+                await self._task
+            except BaseException:
+                pass  # já registrado em _on_done
+            self._task = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            job = await self._queue.get()
+            if job is None:
+                break
+            self._inflight = [job]
+            group: list[_WriteJob] = []
+            try:
+                await self._conn.execute("BEGIN IMMEDIATE")
+            except Exception as e:
+                await self._recover([job], e)
+                continue
+            while True:
+                if await self._serve(job):
+                    group.append(job)
+                if len(group) >= self.batch_size or self._queue.empty():
+                    break
+                job = self._queue.get_nowait()
+                if job is None:
+                    self._stopping = True
+                    break
+                self._inflight.append(job)
+            await self._commit(group)
+            self._inflight = []
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        """A task do writer só termina sozinha por erro inesperado: sem isso as sessões na fila
+        (e as próximas) ficariam esperando a vez para sempre. Falha todas e recusa as novas."""
+        if task.cancelled():
+            err: BaseException = RuntimeError("writer cancelado")
+        elif task.exception() is not None:
+            err = task.exception()
+            logger.error("writer parou com erro", exc_info=err)
+        else:
+            return
+        self._dead = err
+        e = RuntimeError("conexão de escrita indisponível")
+        e.__cause__ = err
+        self._fail(self._inflight, e)
+        self._inflight = []
+        self._fail_queued(e)
+
+    async def _serve(self, job: _WriteJob) -> bool:
+        """Passa a conexão para a sessão e espera ela terminar o bloco. False se a sessão desistiu
+        (cancelada antes de receber a conexão) ou levantou erro: não há o que confirmar."""
+        if job.granted.done():
+            return False
+        job.granted.set_result(self._conn)
+        return await job.finished
+
+    async def _commit(self, group: list[_WriteJob]) -> None:
+        try:
+            await self._conn.commit()
+        except Exception as e:
+            self._stats["failed_commits"] += 1
+            logger.exception("falha no commit de %d sessões de escrita", len(group))
+            try:
+                await self._conn.rollback()
+            except Exception:
+                await self._recover(group, e)
+                return
+            self._fail(group, e)
+            return
+        self._stats["commits"] += 1
+        self._stats["sessions"] += len(group)
+        self._stats["max_group"] = max(self._stats["max_group"], len(group))
+        for job in group:
+            if not job.committed.done():
+                job.committed.set_result(None)
+
+    async def _recover(self, group: list[_WriteJob], e: Exception) -> None:
+        """Falha as sessões do grupo e troca a conexão de escrita. Enquanto não conseguir abrir
+        outra (disco cheio, arquivo travado ou removido), falha também o que estiver na fila e
+        tenta de novo com backoff; para se o writer for fechado nesse meio-tempo."""
+        self._fail(group, e)
+        logger.warning("conexão de escrita com erro; abrindo outra")
+        if self._conn is not None:
+            try:
+                await self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+        delay, max_delay = self.REOPEN_BACKOFF
+        while not self._stopping:
+            try:
+                self._conn = await _connect()
+                self._stats["reopens"] += 1
+                return
+            except Exception as err:
+                logger.exception("não foi possível reabrir a conexão de escrita")
+                self._fail_queued(err)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+    def _fail_queued(self, e: BaseException) -> None:
+        """Falha as sessões que estão na fila; um None (close) na fila encerra o writer."""
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            if job is None:
+                self._stopping = True
+            else:
+                self._fail([job], e)
+
+    @staticmethod
+    def _fail(group: list[_WriteJob], e: BaseException) -> None:
+        for job in group:
+            for fut in (job.granted, job.committed):
+                if not fut.done():
+                    fut.set_exception(e)
+                    break
+
+    @asynccontextmanager
+    async def session(self):
+        if self._dead is not None:
+            raise RuntimeError("conexão de escrita indisponível") from self._dead
+        job = _WriteJob(asyncio.get_running_loop())
+        await self._queue.put(job)
+        try:
+            conn = await job.granted
+        except asyncio.CancelledError:
+            if job.granted.done() and not job.granted.cancelled():
+                job.finished.set_result(False)  # cancelada logo depois de receber a vez: devolve
+            raise
+        ok = False
+        try:
+            async with transaction(conn):  # SAVEPOINT dentro da transação do grupo
+                yield conn
+            ok = True
+        finally:
+            job.finished.set_result(ok)
+        await job.committed
+
+    def stats(self) -> dict[str, Any]:
+        commits = self._stats["commits"]
+        return {
+            **self._stats,
+            "queued": self._queue.qsize(),
+            "avg_group": round(self._stats["sessions"] / commits, 2) if commits else 0.0,
+        }
+
+
+_pool: Optional[ConnectionPool] = None
+_writer: Optional[Writer] = None
+
+
+async def open_pool() -> None:
+    """Abre o pool de leitura e o writer (lifespan). Sem eles, get_db e write_session abrem uma
+    conexão por uso (scripts)."""
+    global _pool, _writer
+    if _pool is None:
+        pool = ConnectionPool(settings.db_pool_size)
+        await pool.open()
+        _pool = pool
+    if _writer is None:
+        writer = Writer(settings.db_write_batch_size)
+        await writer.open()
+        _writer = writer
+
+
+async def close_pool() -> None:
+    global _pool, _writer
+    if _writer is not None:
+        writer, _writer = _writer, None
+        await writer.close()
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+
+def db_pool_stats() -> dict[str, Any]:
+    stats = _pool.stats() if _pool is not None else {"size": 0}
+    return {**stats, "writer": _writer.stats() if _writer is not None else None}
 
 
 @asynccontextmanager
 async def get_db():
-    async with aiosqlite.connect(DB_PATH) as conn:
-        conn.row_factory = aiosqlite.Row
+    """Conexão de leitura (somente leitura quando vem do pool). Escritas vão por write_session."""
+    if _pool is not None:
+        async with _pool.connection() as conn:
+            yield conn
+        return
+    conn = await _connect()
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
+@asynccontextmanager
+async def read_connection():
+    """Conexão somente leitura avulsa, fora do pool, fechada no fim do bloco. Para leituras longas
+    (exportação em stream), que prenderiam uma vaga do pool durante o download inteiro."""
+    conn = await _connect(read_only=True)
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
+@asynccontextmanager
+async def write_session():
+    """Bloco de escrita: as escritas feitas com a conexão recebida valem juntas e o bloco só sai
+    depois do commit. Com o writer aberto, a sessão entra na fila dele e é gravada no próximo group
+    commit; sem writer, vira uma transaction() numa conexão avulsa. A conexão é exclusiva da sessão
+    enquanto o bloco roda: nada de chamada ao LLM aqui dentro."""
+    if _writer is not None:
+        async with _writer.session() as conn:
+            yield conn
+        return
+    async with get_db() as conn, transaction(conn):
         yield conn
@@ -0,0 +1,270 @@
+"""Parser local (regras) para mensagens de formato comum.
+
+Cobre gastos/receitas simples ("gastei 50 no mercado ontem"), comandos de lista
+("peguei o leite", "coloca leite e pão na lista", "cria uma lista") e reporte de preço
+("leite piracanjuba guanabara 5,90"). Só responde quando a mensagem casa por inteiro
+com um padrão conhecido; qualquer sobra de texto devolve None e o fluxo segue pelo LLM.
+"""
+import re
+import unicodedata
+from datetime import date, timedelta
+from typing import Any, Collection, Iterable, Optional
+
+# Palavra-chave (sem acento, minúscula) -> (descrição, categoria)
+_TX_KEYWORDS: dict[str, tuple[str, str]] = {
+    "mercado": ("Mercado", "Alimentação"),
+    "supermercado": ("Supermercado", "Alimentação"),
+    "padaria": ("Padaria", "Alimentação"),
+    "feira": ("Feira", "Alimentação"),
+    "acougue": ("Açougue", "Alimentação"),
+    "restaurante": ("Restaurante", "Alimentação"),
+    "almoco": ("Almoço", "Alimentação"),
+    "jantar": ("Jantar", "Alimentação"),
+    "lanche": ("Lanche", "Alimentação"),
+    "cafe": ("Café", "Alimentação"),
+    "ifood": ("iFood", "Alimentação"),
+    "uber": ("Uber", "Transporte"),
+    "99": ("99", "Transporte"),
+    "taxi": ("Táxi", "Transporte"),
+    "onibus": ("Ônibus", "Transporte"),
+    "metro": ("Metrô", "Transporte"),
+    "gasolina": ("Gasolina", "Transporte"),
+    "combustivel": ("Combustível", "Transporte"),
+    "estacionamento": ("Estacionamento", "Transporte"),
+    "aluguel": ("Aluguel", "Moradia"),
+    "condominio": ("Condomínio", "Moradia"),
+    "luz": ("Luz", "Moradia"),
+    "agua": ("Água", "Moradia"),
+    "gas": ("Gás", "Moradia"),
+    "farmacia": ("Farmácia", "Saúde"),
+    "remedio": ("Remédio", "Saúde"),
+    "medico": ("Médico", "Saúde"),
+    "dentista": ("Dentista", "Saúde"),
+    "academia": ("Academia", "Saúde"),
+    "escola": ("Escola", "Educação"),
+    "faculdade": ("Faculdade", "Educação"),
+    "curso": ("Curso", "Educação"),
+    "livro": ("Livro", "Educação"),
+    "cinema": ("Cinema", "Lazer"),
+    "bar": ("Bar", "Lazer"),
+    "show": ("Show", "Lazer"),
+    "shopping": ("Shopping", "Compras"),
+    "roupa": ("Roupa", "Compras"),
+    "roupas": ("Roupas", "Compras"),
+    "internet": ("Internet", "Serviços"),
+    "celular": ("Celular", "Serviços"),
+    "netflix": ("Netflix", "Serviços"),
+    "spotify": ("Spotify", "Serviços"),
+    "salario": ("Salário", "Salário"),
+}
+
+# Mercados conhecidos, para separar produto de mercado em "leite piracanjuba guanabara 5,90"
+KNOWN_MARKETS = (
+    "guanabara", "assai", "atacadao", "carrefour", "extra", "pao de acucar", "prezunic",
+    "mundial", "sams club", "makro", "zona sul", "hortifruti", "tenda", "bretas", "condor",
+    "angeloni", "savegnago", "atacadista",
+)
+
+_DAY_WORDS = {"hoje": 0, "ontem": 1, "anteontem": 2}
+
+_MONEY = r"(?:r\$\s*)?(\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?|\d+(?:[.,]\d{1,2})?)(?:\s*(?:reais|real|conto|contos|pila))?"
+
+_TX_RE = re.compile(
+    r"^(?P<verb>gastei|paguei|recebi)\s+" + _MONEY
+    + r"\s+(?:(?:no|na|nos|nas|em|com|de|do|da|pro|pra|para\s+o|para\s+a)\s+)?(?P<what>[\w ]+?)"
+    + r"(?:\s+(?P<day>hoje|ontem|anteontem))?$"
+)
+# Comandos de lista. Sem "na/da lista" explícito, "peguei/comprei X" só conta com lista ativa e
+# todos os itens nela, e "adiciona X" só com lista ativa; "marca", "coloca", "põe" e "inclui"
+# sempre precisam de "na lista" ("marca reunião amanhã", "coloca o nubank como conta principal").
+_CHECK_RE = re.compile(
+    r"^(?P<verb>peguei|comprei|marquei|marca)\s+(?P<items>.+?)(?P<on_list>\s+(?:na|da)\s+lista)?$"
+)
+_ADD_RE = re.compile(
+    r"^(?P<verb>adiciona|adicionar|adicione|acrescenta|poe|coloca|coloque|inclui)\s+(?P<items>.+?)"
+    r"(?P<on_list>\s+(?:na|a)\s+lista)?$"
+)
+_CHECK_BARE = ("peguei", "comprei")
+_ADD_BARE = ("adiciona", "adicionar", "adicione", "acrescenta")
+_ARTICLE_RE = re.compile(r"^(?:o|a|os|as|um|uma)\s+", re.IGNORECASE)
+_CREATE_RE = re.compile(
+    r"^(?:cria|criar|crie|inicia|iniciar|comeca|nova)\s+(?:uma\s+)?(?:nova\s+)?lista"
+    r"(?:\s+(?P<prep>do|da|de)\s+(?P<name>[\w ]+?))?"
+    r"(?:\s+(?:com|e\s+(?:adiciona|poe|coloca))\s+(?P<items>.+))?$"
+)
+_PRICE_RE = re.compile(
+    r"^(?:(?:o\s+)?preco\s+(?:do|da|de)\s+)?(?P<product>[\w ]+?)\s+(?:(?:no|na|em)\s+)?(?P<market>[\w ]+?)"
+    r"\s+(?:(?:ta|esta|e|custa|por|a)\s+)?(?:(?:r\$\s*)?)(?P<price>\d+(?:[.,]\d{1,2})?)(?:\s*reais)?$"
+)
+
+_VERBS = re.compile(
+    r"^(?:gastei|paguei|recebi|peguei|comprei|marquei|adiciona|coloca|poe|cria|quanto|qual)\b"
+)
+
+_stats = {"messages": 0, "hits": 0, "llm_calls_saved": 0}
+
+
+def _fold(s: str) -> str:
+    """Minúsculas, sem acento, sem pontuação final e com espaços colapsados."""
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(c for c in s if not unicodedata.combining(c)).lower()
+    s = re.sub(r"[!?.;]+$", "", s.strip())
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def parse_brl(text: str) -> Optional[float]:
+    """Converte valores no formato brasileiro: "5,90", "R$ 1.234,56", "50 reais", "5.90"."""
+    t = text.strip().lower().replace("r$", "").replace("reais", "").strip()
+    if not re.fullmatch(r"\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?|\d+(?:[.,]\d{1,2})?", t):
+        return None
+    if "," in t:
+        t = t.replace(".", "").replace(",", ".")
+    elif re.fullmatch(r"\d{1,3}(?:\.\d{3})+", t):
+        t = t.replace(".", "")
+    try:
+        v = float(t)
+    except ValueError:
+        return None
+    return v if v > 0 else None
+
+
+def _split_items(text: str) -> list[str]:
+    """ "o leite, pão e café" -> ["leite", "pão", "café"] (texto original, sem artigos)."""
+    parts = re.split(r"\s*,\s*|\s+e\s+", text.strip())
+    out = []
+    for p in parts:
+        p = _ARTICLE_RE.sub("", p.strip()).strip()
+        if p:
+            out.append(p)
+    return out
+
+
+def _original_span(original: str, folded: str, span: tuple[int, int]) -> str:
+    """Recorta do texto original o trecho que corresponde ao span no texto normalizado.
+    Válido porque _fold preserva o número de caracteres-base (só remove acentos combinantes)."""
+    base = re.sub(r"\s+", " ", original.strip())
+    if len(base) >= len(folded):
+        return base[span[0]:span[1]].strip()
+    return folded[span[0]:span[1]].strip()
+
+
+def _parse_transaction(text: str, today: date) -> Optional[dict[str, Any]]:
+    m = _TX_RE.match(text)
+    if not m:
+        return None
+    amount = parse_brl(m.group(2))
+    if amount is None:
+        return None
+    what = m.group("what").strip()
+    kw = _TX_KEYWORDS.get(what)
+    if kw is None:
+        return None
+    description, category = kw
+    if m.group("verb") == "recebi" and category != "Salário":
+        return None
+    tx_date = today - timedelta(days=_DAY_WORDS.get(m.group("day") or "hoje", 0))
+    return {
+        "amount": amount,
+        "description": description,
+        "category": category,
+        "account": None,
+        "tx_date": tx_date.isoformat(),
+    }
+
+
+def _parse_shopping(
+    text: str, original: str, list_items: Optional[Collection[str]]
+) -> Optional[dict[str, Any]]:
+    m = _CREATE_RE.match(text)
+    if m:
+        name = _original_span(original, text, m.span("name")) if m.group("name") else None
+        items = _split_items(_original_span(original, text, m.span("items"))) if m.group("items") else []
+        list_name = f"Lista {m.group('prep')} {name}" if name else None
+        return {"action": "create_list", "list_name": list_name, "items": items}
+    for action, rx in (("check_items", _CHECK_RE), ("add_items", _ADD_RE)):
+        m = rx.match(text)
+        if m:
+            if re.search(r"\d", m.group("items")):
+                return None  # "comprei 3 kg..." / "peguei 50 reais" — deixa pro LLM
+            items = _split_items(_original_span(original, text, m.span("items")))
+            if not items:
+                return None
+            if not m.group("on_list"):
+                if list_items is None:
+                    return None
+                if action == "check_items" and (
+                    m.group("verb") not in _CHECK_BARE
+                    or not all(_fold(i) in list_items for i in items)
+                ):
+                    return None
+                if action == "add_items" and m.group("verb") not in _ADD_BARE:
+                    return None
+            return {"action": action, "list_name": None, "items": items}
+    return None
+
+
+def _parse_price(text: str, original: str) -> Optional[dict[str, Any]]:
+    m = _PRICE_RE.match(text)
+    if not m:
+        return None
+    price = parse_brl(m.group("price"))
+    if price is None:
+        return None
+    # O mercado precisa ser conhecido; o que sobra antes dele é o produto.
+    start = m.start("product")
+    head = text[start : m.end("market")]
+    if _VERBS.match(head) or re.search(r"\d", head):
+        return None
+    for market in sorted(KNOWN_MARKETS, key=len, reverse=True):
+        for sep in (" no ", " na ", " em ", " "):
+            suffix = f"{sep}{market}"
+            if head.endswith(suffix):
+                product_folded = head[: -len(suffix)].strip()
+                article = _ARTICLE_RE.match(product_folded)
+                pstart = start + (article.end() if article else 0)
+                product_folded = product_folded[pstart - start:]
+                if not product_folded or product_folded in _TX_KEYWORDS:
+                    return None
+                product = _original_span(original, text, (pstart, pstart + len(product_folded)))
+                mstart = start + len(head) - len(market)
+                market_name = _original_span(original, text, (mstart, mstart + len(market)))
+                return {"product": product, "market": market_name, "price": price}
+    return None
+
+
+def parse_message(
+    message: str,
+    today: Optional[date] = None,
+    list_items: Optional[Iterable[str]] = None,
+) -> Optional[tuple[str, dict[str, Any]]]:
+    """Classifica a mensagem por regras. Retorna ("transaction" | "shopping" | "product_price", payload)
+    no mesmo formato dos parsers do LLM, ou None se não tiver certeza.
+    list_items: nomes dos itens pendentes da lista ativa (None = sem lista ativa)."""
+    today = today or date.today()
+    if list_items is not None:
+        list_items = {_fold(i) for i in list_items}
+    text = _fold(message)
+    if not text or len(text) > 120:
+        return None
+    tx = _parse_transaction(text, today)
+    if tx:
+        return "transaction", tx
+    sh = _parse_shopping(text, message, list_items)
+    if sh:
+        return "shopping", sh
+    pp = _parse_price(text, message)
+    if pp:
+        return "product_price", pp
+    return None
+
+
+def record(hit: bool, llm_calls_saved: int = 0) -> None:
+    _stats["messages"] += 1
+    if hit:
+        _stats["hits"] += 1
+        _stats["llm_calls_saved"] += llm_calls_saved
+
+
+def fastpath_stats() -> dict[str, Any]:
+    n = _stats["messages"]
+    return {**_stats, "hit_rate": (_stats["hits"] / n) if n else 0.0}
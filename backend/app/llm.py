@@ -1,16 +1,125 @@
 import asyncio
 import json
+import logging
 import re
+import time
+from contextlib import AsyncExitStack
+from contextvars import ContextVar
 from datetime import date
-from typing import Any, Optional, Tuple
-
-import google.generativeai as genai
+from typing import Any, AsyncIterator, NamedTuple, Optional, Tuple
 
+from app import fastpath
+from app.cache import TTLCache
 from app.config import settings
+from app.llm_client import llm_slot, run_sync
+from app.llm_providers import LLMResult, get_provider, model_label
 from app.models import Transaction
+from app.prompt_log_writer import log_prompt, log_prompt_nowait
+from app.ratelimit import call_with_limits, is_quota_error
+
+logger = logging.getLogger(__name__)
+
+# Resultados de extração por (kind, modelo, data de hoje, mensagem normalizada).
+# A data entra na chave porque o prompt de transação usa "Data de hoje".
+_extraction_cache = TTLCache(settings.extraction_cache_size, settings.extraction_cache_ttl)
+
+
+def _normalize_message(message: str) -> str:
+    return " ".join(message.lower().split())
+
+
+async def _cached_extract(kind: str, extract, message: str) -> Tuple[Any, str, str]:
+    """Roda o extrator, consultando antes o cache de extrações.
+    Num acerto devolve prompt/resposta vazios: nada foi enviado ao modelo."""
+    key = (kind, settings.gemini_model, date.today().isoformat(), _normalize_message(message))
+    cached = _extraction_cache.get(key)
+    if cached is not TTLCache.MISS:
+        return cached, "", ""
+    parsed, prompt, text = await extract(message)
+    if text:
+        _extraction_cache.set(key, parsed)
+    return parsed, prompt, text
+
+
+def extraction_cache_stats() -> dict[str, Any]:
+    return _extraction_cache.stats()
+
+
+# Prazo (loop.time()) da extração em andamento, posto por _with_extract_timeout: o wait_for cancela a
+# chamada ao estourar, e _generate só vê CancelledError; com o prazo vencido, o log sai "timeout".
+_extract_deadline: ContextVar[Optional[float]] = ContextVar("_extract_deadline", default=None)
+
+
+async def _with_extract_timeout(extract, message: str):
+    loop = asyncio.get_running_loop()
+    token = _extract_deadline.set(loop.time() + settings.llm_extract_timeout)
+    try:
+        return await asyncio.wait_for(extract(message), timeout=settings.llm_extract_timeout)
+    finally:
+        _extract_deadline.reset(token)
+
+
+def _cancel_outcome() -> Tuple[str, Optional[str]]:
+    """(status, erro) de uma chamada cancelada: timeout da extração ou desistência de quem chamou."""
+    deadline = _extract_deadline.get()
+    if deadline is not None and asyncio.get_running_loop().time() >= deadline:
+        return "timeout", "TimeoutError"
+    return "cancelled", None
+
+
+def _outcome(e: BaseException) -> Tuple[str, str]:
+    """(status, classe do erro) gravados no prompt log de uma chamada que falhou."""
+    if is_quota_error(e):
+        status = "quota"
+    elif isinstance(e, asyncio.TimeoutError):
+        status = "timeout"
+    else:
+        status = "error"
+    return status, type(e).__name__
+
+
+def _call_fields(
+    t0: float, started: Optional[float], result: Optional[LLMResult], status: str, error: Optional[str]
+) -> dict[str, Any]:
+    """Tempo total da chamada e espera na fila (rate limit, vaga no llm_client e backoff dos retries,
+    até a última tentativa começar), em ms, mais tokens e resultado."""
+    end = time.perf_counter()
+    return {
+        "duration_ms": round((end - t0) * 1000, 3),
+        "queue_ms": round(((started or end) - t0) * 1000, 3),
+        "input_tokens": result.input_tokens if result else None,
+        "output_tokens": result.output_tokens if result else None,
+        "status": status,
+        "error": error,
+    }
+
+
+async def _generate(kind: str, prompt: str, temperature: float) -> str:
+    """Uma chamada ao modelo (executor do llm_client, com rate limit e retries), registrada em
+    prompt_logs com duração, espera na fila, tokens e resultado, inclusive quando falha."""
+    provider = get_provider()
+    t0 = time.perf_counter()
+    started: list[Optional[float]] = [None]
+
+    def call() -> LLMResult:
+        started[0] = time.perf_counter()
+        return provider.generate(kind, settings.gemini_model, prompt, temperature)
+
+    try:
+        result = await run_sync(call)
+    except asyncio.CancelledError:
+        # ex. timeout da extração (wait_for): não dá para esperar a fila aqui
+        fields = _call_fields(t0, started[0], None, *_cancel_outcome())
+        log_prompt_nowait(kind, prompt, "", model_label(), **fields)
+        raise
+    except Exception as e:
+        fields = _call_fields(t0, started[0], None, *_outcome(e))
+        await log_prompt(kind, prompt, "", model_label(), **fields)
+        raise
+    fields = _call_fields(t0, started[0], result, "ok", None)
+    await log_prompt(kind, prompt, result.text, model_label(), **fields)
+    return result.text
 
-if settings.gemini_api_key:
-    genai.configure(api_key=settings.gemini_api_key)
 
 EXTRACTION_PROMPT = """Analisa a mensagem do usuário e, se ela descrever um gasto, receita ou transação financeira, extrai os dados em JSON.
 
@@ -42,7 +151,8 @@ def _extract_braces(s: str) -> Optional[str]:
     return None
 
 
-def _parse_extract(raw: str) -> Optional[dict[str, Any]]:
+def _load_json(raw: str) -> Optional[dict[str, Any]]:
+    """Extrai o objeto JSON da resposta do modelo (tolera ```json``` e texto em volta)."""
     raw = raw.strip()
     for pattern in (r"```json\s*([\s\S]*?)\s*```", r"```\s*([\s\S]*?)\s*```"):
         m = re.search(pattern, raw)
@@ -55,27 +165,29 @@ def _parse_extract(raw: str) -> Optional[dict[str, Any]]:
             raw = extracted
     try:
         data = json.loads(raw)
-        return data.get("extract")
     except json.JSONDecodeError:
         return None
+    return data if isinstance(data, dict) else None
+
+
+def _parse_extract(raw: str) -> Optional[dict[str, Any]]:
+    data = _load_json(raw)
+    if data is None:
+        return None
+    return data.get("extract")
 
 
-def _extract_sync(message: str) -> Tuple[Optional[dict[str, Any]], str, str]:
-    model = genai.GenerativeModel(settings.gemini_model)
+async def _extract_tx(message: str) -> Tuple[Optional[dict[str, Any]], str, str]:
     today = date.today().isoformat()
     prompt = f"{EXTRACTION_PROMPT}\n\nData de hoje: {today}\n\nMensagem: {message}"
-    r = model.generate_content(
-        prompt,
-        generation_config={"temperature": 0.1},
-    )
-    text = (r.text or "").strip()
+    text = await _generate("extraction_tx", prompt, 0.1)
     return _parse_extract(text), prompt, text
 
 
 async def extract_transaction(message: str) -> Tuple[Optional[dict[str, Any]], str, str]:
-    if not settings.gemini_api_key:
+    if not get_provider().available():
         return None, "", ""
-    return await asyncio.to_thread(_extract_sync, message)
+    return await _cached_extract("extraction_tx", _extract_tx, message)
 
 
 SHOPPING_INTENT_PROMPT = """Analisa a mensagem do usuário sobre LISTA DE COMPRAS.
@@ -100,46 +212,34 @@ Regras:
 """
 
 
+def _shopping_from_json(data: dict[str, Any]) -> Optional[dict[str, Any]]:
+    action = data.get("action")
+    if action not in ("create_list", "add_items", "check_items", None):
+        return None
+    return {
+        "action": action,
+        "list_name": data.get("list_name") or None,
+        "items": data.get("items") if isinstance(data.get("items"), list) else [],
+    }
+
+
 def _parse_shopping_intent(raw: str) -> Optional[dict[str, Any]]:
-    raw = raw.strip()
-    for pattern in (r"```json\s*([\s\S]*?)\s*```", r"```\s*([\s\S]*?)\s*```"):
-        m = re.search(pattern, raw)
-        if m:
-            raw = m.group(1).strip()
-            break
-    if not raw.strip().startswith("{"):
-        extracted = _extract_braces(raw)
-        if extracted:
-            raw = extracted
-    try:
-        data = json.loads(raw)
-        action = data.get("action")
-        if action not in ("create_list", "add_items", "check_items", None):
-            return None
-        return {
-            "action": action,
-            "list_name": data.get("list_name") or None,
-            "items": data.get("items") if isinstance(data.get("items"), list) else [],
-        }
-    except json.JSONDecodeError:
+    data = _load_json(raw)
+    if data is None:
         return None
+    return _shopping_from_json(data)
 
 
-def _shopping_intent_sync(message: str) -> Tuple[Optional[dict[str, Any]], str, str]:
-    model = genai.GenerativeModel(settings.gemini_model)
+async def _shopping_intent(message: str) -> Tuple[Optional[dict[str, Any]], str, str]:
     prompt = f"{SHOPPING_INTENT_PROMPT}\n\nMensagem: {message}"
-    r = model.generate_content(
-        prompt,
-        generation_config={"temperature": 0.1},
-    )
-    text = (r.text or "").strip()
+    text = await _generate("extraction_shopping", prompt, 0.1)
     return _parse_shopping_intent(text), prompt, text
 
 
 async def extract_shopping_intent(message: str) -> Tuple[Optional[dict[str, Any]], str, str]:
-    if not settings.gemini_api_key:
+    if not get_provider().available():
         return None, "", ""
-    return await asyncio.to_thread(_shopping_intent_sync, message)
+    return await _cached_extract("extraction_shopping", _shopping_intent, message)
 
 
 PRODUCT_PRICE_PROMPT = """Analisa a mensagem do usuário. Se ela REPORTAR o preço de um produto em um mercado/supermercado, extrai os dados.
@@ -161,52 +261,159 @@ Regras:
 """
 
 
-def _parse_product_price(raw: str) -> Optional[dict[str, Any]]:
-    raw = raw.strip()
-    for pattern in (r"```json\s*([\s\S]*?)\s*```", r"```\s*([\s\S]*?)\s*```"):
-        m = re.search(pattern, raw)
-        if m:
-            raw = m.group(1).strip()
-            break
-    if not raw.strip().startswith("{"):
-        extracted = _extract_braces(raw)
-        if extracted:
-            raw = extracted
+def _product_price_from_json(data: dict[str, Any]) -> Optional[dict[str, Any]]:
+    p = data.get("product")
+    m = data.get("market")
+    pr = data.get("price")
+    if p is None and m is None and pr is None:
+        return None
+    if not isinstance(p, str) or not p or not isinstance(m, str) or not m:
+        return None
     try:
-        data = json.loads(raw)
-        p = data.get("product")
-        m = data.get("market")
-        pr = data.get("price")
-        if p is None and m is None and pr is None:
-            return None
-        if not isinstance(p, str) or not p or not isinstance(m, str) or not m:
-            return None
-        try:
-            price = float(pr)
-        except (TypeError, ValueError):
-            return None
-        if price <= 0:
-            return None
-        return {"product": p.strip(), "market": m.strip(), "price": price}
-    except json.JSONDecodeError:
+        price = float(pr)
+    except (TypeError, ValueError):
         return None
+    if price <= 0:
+        return None
+    return {"product": p.strip(), "market": m.strip(), "price": price}
+
 
+def _parse_product_price(raw: str) -> Optional[dict[str, Any]]:
+    data = _load_json(raw)
+    if data is None:
+        return None
+    return _product_price_from_json(data)
 
-def _product_price_sync(message: str) -> Tuple[Optional[dict[str, Any]], str, str]:
-    model = genai.GenerativeModel(settings.gemini_model)
+
+async def _product_price(message: str) -> Tuple[Optional[dict[str, Any]], str, str]:
     prompt = f"{PRODUCT_PRICE_PROMPT}\n\nMensagem: {message}"
-    r = model.generate_content(
-        prompt,
-        generation_config={"temperature": 0.1},
-    )
-    text = (r.text or "").strip()
+    text = await _generate("extraction_product_price", prompt, 0.1)
     return _parse_product_price(text), prompt, text
 
 
 async def extract_product_price(message: str) -> Tuple[Optional[dict[str, Any]], str, str]:
-    if not settings.gemini_api_key:
+    if not get_provider().available():
         return None, "", ""
-    return await asyncio.to_thread(_product_price_sync, message)
+    return await _cached_extract("extraction_product_price", _product_price, message)
+
+
+UNIFIED_EXTRACTION_PROMPT = """Classifica a mensagem do usuário e extrai os dados em JSON, numa única resposta.
+
+Intenções possíveis (escolha UMA):
+- "transaction": descreve um gasto, receita ou transação financeira (ex: "gastei 50 no mercado ontem").
+- "shopping": é sobre LISTA DE COMPRAS — criar lista, adicionar itens ou dizer que pegou itens
+  (ex: "cria uma lista", "adiciona leite e pão", "peguei o leite").
+- "product_price": REPORTA o preço de um produto em um mercado (ex: "leite piracanjuba guanabara 5,90").
+- null: qualquer outra coisa (pergunta, cumprimento, etc).
+
+Responde APENAS em JSON, sem outro texto:
+{"intent": "transaction"|"shopping"|"product_price"|null,
+ "transaction": {"amount": número, "description": "...", "category": "...", "account": "..." ou null, "tx_date": "YYYY-MM-DD"} ou null,
+ "shopping": {"action": "create_list"|"add_items"|"check_items", "list_name": "nome ou null", "items": ["item1"]} ou null,
+ "product_price": {"product": "nome do produto", "market": "nome do mercado", "price": número} ou null}
+
+Regras:
+- Preencha só o campo da intenção escolhida; os outros ficam null.
+- transaction.amount: sempre positivo. transaction.category: UMA das categorias: Alimentação, Transporte, Moradia, Saúde, Educação, Lazer, Compras, Serviços, Salário, Investimentos, Outros.
+- transaction.tx_date: data da transação em YYYY-MM-DD. Se não informada, use hoje.
+- shopping: "peguei o leite" -> check_items, items ["leite"]; "cria uma lista e põe leite, pão" -> create_list, list_name null, items ["leite","pão"].
+- product_price.price: valor numérico (use . como decimal). Ex: 5.90, 12.50.
+"""
+
+
+def _parse_unified(raw: str) -> dict[str, Optional[dict[str, Any]]]:
+    """Resposta do prompt unificado -> {"transaction", "shopping", "product_price"} (no máximo um preenchido)."""
+    out: dict[str, Optional[dict[str, Any]]] = {
+        "transaction": None,
+        "shopping": None,
+        "product_price": None,
+    }
+    data = _load_json(raw)
+    if data is None:
+        return out
+    intent = data.get("intent")
+    payload = data.get(intent) if isinstance(intent, str) else None
+    if not isinstance(payload, dict):
+        return out
+    if intent == "transaction":
+        if payload.get("amount") is not None:
+            out["transaction"] = payload
+    elif intent == "shopping":
+        out["shopping"] = _shopping_from_json(payload)
+    elif intent == "product_price":
+        out["product_price"] = _product_price_from_json(payload)
+    return out
+
+
+async def _unified(message: str) -> Tuple[dict[str, Optional[dict[str, Any]]], str, str]:
+    today = date.today().isoformat()
+    prompt = f"{UNIFIED_EXTRACTION_PROMPT}\n\nData de hoje: {today}\n\nMensagem: {message}"
+    text = await _generate("extraction_unified", prompt, 0.1)
+    return _parse_unified(text), prompt, text
+
+
+async def extract_unified(message: str) -> Tuple[dict[str, Optional[dict[str, Any]]], str, str]:
+    if not get_provider().available():
+        return _parse_unified(""), "", ""
+    return await _cached_extract("extraction_unified", _unified, message)
+
+
+class Extraction(NamedTuple):
+    """Resultado do estágio de extração: payloads por tipo (as chamadas já ficam em prompt_logs).
+    failed indica que algum extrator falhou ou estourou o timeout."""
+    transaction: Optional[dict[str, Any]]
+    shopping: Optional[dict[str, Any]]
+    product_price: Optional[dict[str, Any]]
+    failed: bool = False
+
+
+async def _guarded(extractor, message: str) -> Optional[Tuple[Optional[dict[str, Any]], str, str]]:
+    """Roda um extrator com timeout; erro ou timeout viram None ("sem extração")."""
+    try:
+        return await _with_extract_timeout(extractor, message)
+    except Exception:
+        return None
+
+
+async def _extract_all_unified(message: str) -> Extraction:
+    try:
+        data, _, _ = await _with_extract_timeout(extract_unified, message)
+    except Exception:
+        return Extraction(None, None, None, failed=True)
+    return Extraction(data["transaction"], data["shopping"], data["product_price"])
+
+
+async def extract_all(
+    message: str,
+    mode: Optional[str] = None,
+    list_items: Optional[list[str]] = None,
+) -> Extraction:
+    """Extrai transação, lista e preço da mensagem.
+    Modo "separate": três prompts em paralelo (se a request for cancelada, os três são cancelados).
+    Modo "unified": um único prompt que classifica e extrai.
+    mode None usa settings.extraction_mode.
+    Com settings.fastpath_enabled, mensagens reconhecidas pelo parser local não chamam o LLM;
+    list_items (itens pendentes da lista ativa, None sem lista) vai para fastpath.parse_message."""
+    unified = (mode or settings.extraction_mode) == "unified"
+    if settings.fastpath_enabled:
+        hit = fastpath.parse_message(message, list_items=list_items)
+        fastpath.record(hit is not None, llm_calls_saved=1 if unified else 3)
+        if hit:
+            kind, payload = hit
+            return Extraction(
+                payload if kind == "transaction" else None,
+                payload if kind == "shopping" else None,
+                payload if kind == "product_price" else None,
+            )
+    if unified:
+        return await _extract_all_unified(message)
+    results = await asyncio.gather(
+        _guarded(extract_transaction, message),
+        _guarded(extract_shopping_intent, message),
+        _guarded(extract_product_price, message),
+    )
+    tx, sh, pp = (r[0] if r else None for r in results)
+    return Extraction(tx, sh, pp, failed=None in results)
 
 
 def build_context(
@@ -244,34 +451,129 @@ def build_context(
     return block
 
 
-def _chat_sync(
-    user_message: str, context: str, recent: list[tuple[str, str]]
-) -> Tuple[str, str, str]:
-    model = genai.GenerativeModel(settings.gemini_model)
+CHAT_KEY_MISSING = "Configure GEMINI_API_KEY para usar o chat da DIANE."
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa grosseira (~4 caracteres por token), suficiente para orçar o prompt."""
+    return (len(text) + 3) // 4
+
+
+def _chat_prompt(
+    user_message: str,
+    context: str,
+    recent: list[tuple[str, str]],
+    summary: str = "",
+) -> str:
     system = f"""Você é a DIANE, assistente de finanças pessoais. Você guarda gastos, receitas e contas em SQLite local.
 
 {context}
 
 Responda sempre em português."""
     parts = [system, "\n\n---\n\n"]
-    for role, content in recent[-10:]:
+    if summary:
+        parts.append(f"Resumo da conversa até aqui:\n{summary}\n\n---\n\n")
+    for role, content in recent:
         parts.append(f"{'Usuário' if role == 'user' else 'DIANE'}: {content}\n\n")
     parts.append(f"Usuário: {user_message}")
     prompt = "".join(parts)
-    r = model.generate_content(
-        prompt,
-        generation_config={"temperature": 0.5},
+    logger.info(
+        "chat prompt: ~%d tokens (contexto ~%d, resumo ~%d, %d mensagens recentes)",
+        estimate_tokens(prompt),
+        estimate_tokens(context),
+        estimate_tokens(summary),
+        len(recent),
     )
-    response = (r.text or "").strip()
-    return response, prompt, response
+    return prompt
 
 
 async def chat_reply(
     user_message: str,
     context: str,
     recent_messages: list[tuple[str, str]],
+    summary: str = "",
 ) -> Tuple[str, str, str]:
-    if not settings.gemini_api_key:
-        err = "Configure GEMINI_API_KEY para usar o chat da DIANE."
-        return err, "", ""
-    return await asyncio.to_thread(_chat_sync, user_message, context, recent_messages)
+    """recent_messages já vem recortado pela memória do chat (app/memory.py)."""
+    if not get_provider().available():
+        return CHAT_KEY_MISSING, "", ""
+    prompt = _chat_prompt(user_message, context, recent_messages, summary)
+    response = await _generate("chat", prompt, 0.5)
+    return response, prompt, response
+
+
+async def _stream_chunks(prompt: str) -> AsyncIterator[str]:
+    provider = get_provider()
+    result = LLMResult()
+    t0 = time.perf_counter()
+    started: Optional[float] = None
+
+    async def open_stream() -> tuple[AsyncExitStack, AsyncIterator[str]]:
+        # como no run_sync: o rate limit envolve cada tentativa e a vaga só é pega dentro dela,
+        # então espera do token bucket e backoff entre retries não seguram vaga nenhuma
+        nonlocal started
+        slot = AsyncExitStack()
+        await slot.enter_async_context(llm_slot())
+        try:
+            started = time.perf_counter()
+            return slot, await provider.open_stream("chat", settings.gemini_model, prompt, 0.5, result)
+        except BaseException as e:
+            await slot.__aexit__(type(e), e, e.__traceback__)
+            raise
+
+    try:
+        # só a abertura do stream tem retry; um erro no meio da resposta sobe para o chamador
+        slot, chunks = await call_with_limits(open_stream)
+        async with slot:  # a vaga fica com o stream até o último trecho
+            async for text in chunks:
+                yield text
+    except (asyncio.CancelledError, GeneratorExit):
+        # cliente desconectou no meio do stream
+        fields = _call_fields(t0, started, result, "cancelled", None)
+        log_prompt_nowait("chat", prompt, result.text, model_label(), **fields)
+        raise
+    except Exception as e:
+        fields = _call_fields(t0, started, result, *_outcome(e))
+        await log_prompt("chat", prompt, result.text, model_label(), **fields)
+        raise
+    fields = _call_fields(t0, started, result, "ok", None)
+    await log_prompt("chat", prompt, result.text, model_label(), **fields)
+
+
+async def _single_chunk(text: str) -> AsyncIterator[str]:
+    yield text
+
+
+def chat_reply_stream(
+    user_message: str,
+    context: str,
+    recent_messages: list[tuple[str, str]],
+    summary: str = "",
+) -> Tuple[str, AsyncIterator[str]]:
+    """Versão em streaming de chat_reply: retorna (prompt, trechos da resposta conforme o Gemini gera).
+    Prompt vazio quando não há chamada ao modelo (sem GEMINI_API_KEY)."""
+    if not get_provider().available():
+        return "", _single_chunk(CHAT_KEY_MISSING)
+    prompt = _chat_prompt(user_message, context, recent_messages, summary)
+    return prompt, _stream_chunks(prompt)
+
+
+SUMMARY_PROMPT = """Você mantém o resumo da conversa entre o usuário e a DIANE (assistente de finanças pessoais).
+Atualiza o resumo anterior com as mensagens novas. Guarde o que importa para conversas futuras:
+preferências, metas, contas e cartões citados, pendências e decisões. Não repita valores que já
+estão no banco (gastos, saldos), a menos que o usuário tenha comentado algo sobre eles.
+Responda só com o resumo, em português, em no máximo 10 linhas."""
+
+
+async def summarize_conversation(
+    previous_summary: str, messages: list[tuple[str, str]]
+) -> Tuple[str, str, str]:
+    """Novo resumo a partir do anterior + mensagens (role, content). Retorna (resumo, prompt, resposta)."""
+    if not get_provider().available():
+        return "", "", ""
+    lines = [f"{'Usuário' if role == 'user' else 'DIANE'}: {content}" for role, content in messages]
+    prompt = (
+        f"{SUMMARY_PROMPT}\n\nResumo anterior:\n{previous_summary or '(nenhum)'}"
+        f"\n\nMensagens novas:\n" + "\n".join(lines)
+    )
+    text = await _generate("chat_summary", prompt, 0.2)
+    return text, prompt, text
@@ -0,0 +1,112 @@
+"""Execução das chamadas ao LLM: pool de threads próprio e limite de concorrência.
+Toda chamada passa também pelo rate limit/circuit breaker de app/ratelimit.py; o backend
+(Gemini ou fake) fica em app/llm_providers.py.
+
+As funções síncronas do llm.py rodam em run_sync (executor dedicado, tamanho llm_max_concurrency)
+em vez do pool padrão do asyncio.to_thread; o streaming usa a API async do backend dentro de
+llm_slot. Em ambos os casos no máximo llm_max_concurrency chamadas ficam em andamento (contando as
+que ainda rodam no executor depois que quem chamou desistiu); as demais esperam na fila do semáforo.
+"""
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, TypeVar
+
+from app.config import settings
+from app.ratelimit import call_with_limits
+
+T = TypeVar("T")
+
+_executor = ThreadPoolExecutor(
+    max_workers=max(1, settings.llm_max_concurrency), thread_name_prefix="llm"
+)
+_slots = asyncio.Semaphore(max(1, settings.llm_max_concurrency))
+_metrics = {
+    "in_flight": 0, "waiting": 0, "max_waiting": 0, "calls": 0, "errors": 0, "orphaned": 0,
+}
+
+
+async def _acquire_slot() -> None:
+    _metrics["waiting"] += 1
+    _metrics["max_waiting"] = max(_metrics["max_waiting"], _metrics["waiting"])
+    try:
+        await _slots.acquire()
+    finally:
+        _metrics["waiting"] -= 1
+    _metrics["in_flight"] += 1
+    _metrics["calls"] += 1
+
+
+def _release_slot() -> None:
+    _metrics["in_flight"] -= 1
+    _slots.release()
+
+
+@asynccontextmanager
+async def llm_slot():
+    """Reserva uma das llm_max_concurrency vagas de chamada ao modelo."""
+    await _acquire_slot()
+    try:
+        yield
+    except Exception:
+        _metrics["errors"] += 1
+        raise
+    finally:
+        _release_slot()
+
+
+async def run_sync(fn: Callable[..., T], *args: Any) -> T:
+    """Roda uma chamada síncrona ao modelo no executor dedicado, respeitando o limite de concorrência
+    e o rate limit/circuit breaker (app/ratelimit.py).
+
+    A vaga só é devolvida quando a thread termina: se quem chamou desistir (ex. timeout do
+    wait_for da extração), a chamada bloqueante continua rodando no executor e segue contando em
+    in_flight, e em orphaned até acabar; assim nunca há mais de llm_max_concurrency em andamento."""
+
+    async def attempt() -> T:
+        await _acquire_slot()
+        loop = asyncio.get_running_loop()
+        orphaned = [False]
+
+        def finished(fut: Future) -> None:
+            if orphaned[0]:
+                _metrics["orphaned"] -= 1
+            if not fut.cancelled() and fut.exception() is not None:
+                _metrics["errors"] += 1
+            _release_slot()
+
+        try:
+            fut = _executor.submit(fn, *args)
+        except BaseException:
+            _release_slot()
+            raise
+        fut.add_done_callback(lambda f: _call_soon(loop, finished, f))
+        try:
+            return await asyncio.wrap_future(fut)
+        except asyncio.CancelledError:
+            if not fut.done():  # já estava rodando na thread: não dá para interromper
+                orphaned[0] = True
+                _metrics["orphaned"] += 1
+            raise
+
+    return await call_with_limits(attempt)
+
+
+def _call_soon(loop: asyncio.AbstractEventLoop, fn: Callable[..., Any], *args: Any) -> None:
+    """Agenda fn no loop a partir da thread do executor (ignora loop já fechado, no shutdown)."""
+    try:
+        loop.call_soon_threadsafe(fn, *args)
+    except RuntimeError:
+        pass
+
+
+def llm_client_stats() -> dict[str, Any]:
+    return {
+        **_metrics,
+        "max_concurrency": settings.llm_max_concurrency,
+        "provider": settings.llm_provider,
+    }
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,228 @@
+"""Backends de LLM usados pelo llm.py, escolhidos por settings.llm_provider.
+
+- "gemini": Google Gemini (google-generativeai), com um GenerativeModel reaproveitado por
+  (modelo, temperatura).
+- "fake": respostas prontas, local e determinístico, com latência e taxa de erro configuráveis
+  (inclusive 429). Serve para benchmark e teste de carga do pipeline sem rede nem cota.
+
+`generate` é síncrono (roda no executor do llm_client) e devolve um LLMResult com o texto e o uso
+de tokens; `open_stream` é async e preenche o LLMResult recebido conforme o stream avança.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import google.generativeai as genai
+
+from app.config import settings
+
+
+@dataclass
+class LLMResult:
+    """Texto da resposta e uso de tokens (None quando o backend não informa)."""
+    text: str = ""
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+
+
+def _estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+class LLMProvider(ABC):
+    """Interface dos backends; provider sem generate/open_stream falha ao ser instanciado."""
+
+    name = "base"
+
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    def generate(self, kind: str, model: str, prompt: str, temperature: float) -> LLMResult:
+        ...
+
+    @abstractmethod
+    async def open_stream(
+        self, kind: str, model: str, prompt: str, temperature: float, result: LLMResult
+    ) -> AsyncIterator[str]:
+        """Abre o stream; os trechos vão sendo somados em result.text e o uso de tokens
+        é gravado em result quando o stream termina."""
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, api_key: str) -> None:
+        self.api_key = api_key
+        self._models: dict[tuple[str, float], genai.GenerativeModel] = {}
+        if api_key:
+            genai.configure(api_key=api_key)
+
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    def _model(self, model_name: str, temperature: float) -> genai.GenerativeModel:
+        key = (model_name, temperature)
+        model = self._models.get(key)
+        if model is None:
+            model = genai.GenerativeModel(
+                model_name, generation_config={"temperature": temperature}
+            )
+            self._models[key] = model
+        return model
+
+    @staticmethod
+    def _usage(response, result: LLMResult) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        result.input_tokens = getattr(usage, "prompt_token_count", None) or result.input_tokens
+        result.output_tokens = getattr(usage, "candidates_token_count", None) or result.output_tokens
+
+    def generate(self, kind: str, model: str, prompt: str, temperature: float) -> LLMResult:
+        r = self._model(model, temperature).generate_content(prompt)
+        result = LLMResult((r.text or "").strip())
+        self._usage(r, result)
+        return result
+
+    async def open_stream(
+        self, kind: str, model: str, prompt: str, temperature: float, result: LLMResult
+    ) -> AsyncIterator[str]:
+        r = await self._model(model, temperature).generate_content_async(prompt, stream=True)
+        return self._iter_text(r, result)
+
+    @classmethod
+    async def _iter_text(cls, r, result: LLMResult) -> AsyncIterator[str]:
+        async for chunk in r:
+            cls._usage(chunk, result)  # o último chunk traz o total
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # chunk sem texto (ex. só metadados de segurança)
+            if text:
+                result.text += text
+                yield text
+
+
+FAKE_RESPONSES: dict[str, str] = {
+    "extraction_tx": '{"extract": null}',
+    "extraction_shopping": '{"action": null, "list_name": null, "items": []}',
+    "extraction_product_price": '{"product": null, "market": null, "price": null}',
+    "extraction_unified": '{"intent": null, "transaction": null, "shopping": null, "product_price": null}',
+    "chat": "Certo! Anotado por aqui. (resposta simulada)",
+    "chat_summary": "Conversa simulada sobre finanças pessoais.",
+}
+
+
+class FakeProvider(LLMProvider):
+    """LLM local para carga/benchmark. Respostas por kind (FAKE_RESPONSES, sobrescritas pelo JSON
+    em fake_llm_responses_path: {"kind": "texto" ou ["texto", ...]}); listas são usadas em rodízio.
+    O uso de tokens é estimado (~4 caracteres por token)."""
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        error_rate: float = 0.0,
+        quota_error_rate: float = 0.0,
+        responses: Optional[dict[str, object]] = None,
+        seed: int = 0,
+    ) -> None:
+        self.latency = max(0.0, latency_ms) / 1000.0
+        self.error_rate = error_rate
+        self.quota_error_rate = quota_error_rate
+        self.responses: dict[str, list[str]] = {k: [v] for k, v in FAKE_RESPONSES.items()}
+        for k, v in (responses or {}).items():
+            self.responses[k] = [str(x) for x in v] if isinstance(v, list) else [str(v)]
+        self._rng = random.Random(seed)
+        self._turn: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _next(self, kind: str) -> tuple[float, Optional[Exception], str]:
+        """Sorteia (latência, erro, resposta) de forma determinística para a semente."""
+        with self._lock:
+            latency = self.latency * self._rng.uniform(0.5, 1.5)
+            roll = self._rng.random()
+            error: Optional[Exception] = None
+            if roll < self.quota_error_rate:
+                error = RuntimeError("429 Resource exhausted: quota exceeded (fake provider)")
+            elif roll < self.quota_error_rate + self.error_rate:
+                error = RuntimeError("500 Internal error (fake provider)")
+            options = self.responses.get(kind) or ["{}"]
+            i = self._turn.get(kind, 0)
+            self._turn[kind] = i + 1
+            return latency, error, options[i % len(options)]
+
+    def generate(self, kind: str, model: str, prompt: str, temperature: float) -> LLMResult:
+        latency, error, text = self._next(kind)
+        time.sleep(latency)
+        if error:
+            raise error
+        return LLMResult(text, _estimate_tokens(prompt), _estimate_tokens(text))
+
+    async def open_stream(
+        self, kind: str, model: str, prompt: str, temperature: float, result: LLMResult
+    ) -> AsyncIterator[str]:
+        latency, error, text = self._next(kind)
+        await asyncio.sleep(latency)
+        if error:
+            raise error
+        result.input_tokens = _estimate_tokens(prompt)
+        return self._iter_words(text, result)
+
+    async def _iter_words(self, text: str, result: LLMResult) -> AsyncIterator[str]:
+        words = text.split(" ")
+        for i, w in enumerate(words):
+            await asyncio.sleep(self.latency / 20)
+            chunk = w if i == len(words) - 1 else f"{w} "
+            result.text += chunk
+            yield chunk
+        result.output_tokens = _estimate_tokens(result.text)
+
+
+def _load_fake_responses(path: str) -> dict[str, object]:
+    if not path:
+        return {}
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+_provider: Optional[LLMProvider] = None
+
+
+def get_provider() -> LLMProvider:
+    global _provider
+    if _provider is None:
+        if settings.llm_provider == "fake":
+            _provider = FakeProvider(
+                latency_ms=settings.fake_llm_latency_ms,
+                error_rate=settings.fake_llm_error_rate,
+                quota_error_rate=settings.fake_llm_quota_error_rate,
+                responses=_load_fake_responses(settings.fake_llm_responses_path),
+                seed=settings.fake_llm_seed,
+            )
+        elif settings.llm_provider == "gemini":
+            _provider = GeminiProvider(settings.gemini_api_key)
+        else:
+            raise ValueError(f"LLM_PROVIDER desconhecido: {settings.llm_provider!r}")
+    return _provider
+
+
+def model_label() -> str:
+    """Nome do modelo gravado nos prompt logs."""
+    provider = get_provider()
+    if provider.name == "gemini":
+        return settings.gemini_model or "gemini"
+    return provider.name
+
+
+def set_provider(provider: LLMProvider) -> None:
+    """Troca o backend em tempo de execução (benchmarks e scripts)."""
+    global _provider
+    _provider = provider
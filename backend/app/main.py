@@ -3,7 +3,9 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.database import init_db
+from app import llm_client, prompt_log_writer
+from app.memory import stop_summary_refresh
+from app.database import close_pool, init_db, open_pool
 from app.routers import (
     accounts,
     categories,
@@ -13,13 +15,20 @@ from app.routers import (
     shopping,
     prompt_logs,
     product_prices,
+    export,
 )
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    await open_pool()
+    await prompt_log_writer.start()
     yield
+    await stop_summary_refresh()
+    await prompt_log_writer.stop()
+    await close_pool()
+    llm_client.shutdown()
 
 
 app = FastAPI(title="DIANE", description="Assistente de finanças pessoais", lifespan=lifespan)
@@ -39,6 +48,7 @@ app.include_router(chat.router, prefix="/api")
 app.include_router(shopping.router, prefix="/api")
 app.include_router(prompt_logs.router, prefix="/api")
 app.include_router(product_prices.router, prefix="/api")
+app.include_router(export.router, prefix="/api")
 
 
 @app.get("/")
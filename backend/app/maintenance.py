@@ -0,0 +1,193 @@
+"""Tabelas derivadas (mantidas junto com as escritas): conferência e reconstrução.
+
+monthly_category_totals e accounts.spending são atualizadas por create_transaction, e
+product_price_latest por insert/update/delete_product_price, na mesma transação da escrita. Carga
+feita por fora dos repositórios (ex. import direto no SQLite, bench/chat_pipeline.py) precisa de um
+rebuild depois. O SQL de reconstrução daqui é o único: as migrações que criam essas tabelas o usam
+para o preenchimento inicial, e repositories usa o da product_price_latest.
+
+    python -m app.maintenance verify    # compara com o recalculado a partir de transactions
+    python -m app.maintenance rebuild   # recalcula tudo
+"""
+import argparse
+import asyncio
+import sys
+from typing import Awaitable, Callable, NamedTuple
+
+import aiosqlite
+
+# mesma chave (ano, mês) que repositories._add_to_monthly_totals
+_MONTHLY_FROM_TRANSACTIONS = """
+    SELECT CAST(substr(tx_date, 1, 4) AS INTEGER) AS year,
+           CAST(substr(tx_date, 6, 2) AS INTEGER) AS month,
+           category_id, SUM(amount) AS total, COUNT(*) AS tx_count
+    FROM transactions
+    GROUP BY 1, 2, 3
+"""
+
+
+async def rebuild_monthly_totals(conn: aiosqlite.Connection) -> int:
+    """Recalcula monthly_category_totals a partir de transactions. Retorna o número de linhas.
+    Não faz commit (rodar dentro de transaction()/write_session())."""
+    await conn.execute("DELETE FROM monthly_category_totals")
+    cur = await conn.execute(
+        "INSERT INTO monthly_category_totals (year, month, category_id, total, tx_count) "
+        + _MONTHLY_FROM_TRANSACTIONS
+    )
+    return cur.rowcount
+
+
+async def verify_monthly_totals(
+    conn: aiosqlite.Connection, tolerance: float = 0.005
+) -> list[tuple[int, int, int, float, float]]:
+    """Linhas divergentes: (ano, mês, categoria, total gravado, total recalculado).
+    Meses com tx_count zerado contam como ausentes."""
+    cur = await conn.execute(f"""
+        WITH expected AS ({_MONTHLY_FROM_TRANSACTIONS}),
+        stored AS (SELECT * FROM monthly_category_totals WHERE tx_count <> 0)
+        SELECT e.year, e.month, e.category_id, COALESCE(s.total, 0), e.total
+        FROM expected e
+        LEFT JOIN stored s USING (year, month, category_id)
+        WHERE s.total IS NULL OR abs(s.total - e.total) > ?1 OR s.tx_count <> e.tx_count
+        UNION ALL
+        SELECT s.year, s.month, s.category_id, s.total, 0
+        FROM stored s
+        LEFT JOIN expected e USING (year, month, category_id)
+        WHERE e.total IS NULL
+        ORDER BY 1, 2, 3
+    """, (tolerance,))
+    return [tuple(r) for r in await cur.fetchall()]
+
+
+async def rebuild_account_spending(conn: aiosqlite.Connection) -> int:
+    """Recalcula accounts.spending a partir de transactions. Retorna o número de contas.
+    Não faz commit (rodar dentro de transaction()/write_session())."""
+    cur = await conn.execute("""
+        UPDATE accounts SET spending = COALESCE(
+            (SELECT SUM(amount) FROM transactions t WHERE t.account_id = accounts.id), 0
+        )
+    """)
+    return cur.rowcount
+
+
+async def verify_account_spending(
+    conn: aiosqlite.Connection, tolerance: float = 0.005
+) -> list[tuple[int, float, float]]:
+    """Contas divergentes: (conta, spending gravado, soma recalculada)."""
+    cur = await conn.execute("""
+        SELECT a.id, a.spending, COALESCE(t.total, 0)
+        FROM accounts a
+        LEFT JOIN (
+            SELECT account_id, SUM(amount) AS total FROM transactions
+            WHERE account_id IS NOT NULL GROUP BY account_id
+        ) t ON t.account_id = a.id
+        WHERE abs(a.spending - COALESCE(t.total, 0)) > ?
+        ORDER BY a.id
+    """, (tolerance,))
+    return [tuple(r) for r in await cur.fetchall()]
+
+
+def latest_prices_query(where: str = "") -> str:
+    """SELECT do registro mais recente por (produto, mercado) em product_prices, com as colunas de
+    product_price_latest (sem is_best); `where` filtra antes da janela (ex. um só par de chaves)."""
+    return f"""
+    SELECT product_key, market_key, id AS price_id, TRIM(product_name) AS product_name,
+           TRIM(market_name) AS market_name, price, recorded_at
+    FROM (
+        SELECT *, ROW_NUMBER() OVER (
+            PARTITION BY product_key, market_key ORDER BY recorded_at DESC, id DESC
+        ) AS rn
+        FROM product_prices
+        WHERE product_key <> '' AND market_key <> '' {f"AND {where}" if where else ""}
+    )
+    WHERE rn = 1
+"""
+
+
+INSERT_PRICE_LATEST = (
+    "INSERT INTO product_price_latest "
+    "(product_key, market_key, price_id, product_name, market_name, price, recorded_at) "
+)
+
+# is_best = menor preço do produto entre os mercados; com " WHERE product_key = ?", um produto só
+MARK_BEST_PRICES = """
+    UPDATE product_price_latest SET is_best = price <= (
+        SELECT MIN(price) FROM product_price_latest l WHERE l.product_key = product_price_latest.product_key
+    )
+"""
+
+
+async def rebuild_price_latest(conn: aiosqlite.Connection) -> int:
+    """Recalcula product_price_latest (e is_best) a partir de product_prices. Não faz commit."""
+    await conn.execute("DELETE FROM product_price_latest")
+    cur = await conn.execute(INSERT_PRICE_LATEST + latest_prices_query())
+    await conn.execute(MARK_BEST_PRICES)
+    return cur.rowcount
+
+
+async def verify_price_latest(conn: aiosqlite.Connection) -> list[tuple]:
+    """Pares divergentes: (produto, mercado, price_id gravado, price_id esperado, is_best gravado,
+    is_best esperado). None onde a linha falta de um dos lados."""
+    cur = await conn.execute(f"""
+        WITH expected AS (
+            SELECT *, price <= MIN(price) OVER (PARTITION BY product_key) AS is_best
+            FROM ({latest_prices_query()})
+        ),
+        pairs AS (
+            SELECT product_key, market_key FROM expected
+            UNION
+            SELECT product_key, market_key FROM product_price_latest
+        )
+        SELECT p.product_key, p.market_key, s.price_id, e.price_id, s.is_best, e.is_best
+        FROM pairs p
+        LEFT JOIN product_price_latest s USING (product_key, market_key)
+        LEFT JOIN expected e USING (product_key, market_key)
+        WHERE s.price_id IS NOT e.price_id OR s.is_best IS NOT e.is_best OR s.price IS NOT e.price
+        ORDER BY 1, 2
+    """)
+    return [tuple(r) for r in await cur.fetchall()]
+
+
+class Derived(NamedTuple):
+    name: str
+    verify: Callable[[aiosqlite.Connection], Awaitable[list[tuple]]]
+    rebuild: Callable[[aiosqlite.Connection], Awaitable[int]]
+
+
+DERIVED: list[Derived] = [
+    Derived("monthly_category_totals", verify_monthly_totals, rebuild_monthly_totals),
+    Derived("accounts.spending", verify_account_spending, rebuild_account_spending),
+    Derived("product_price_latest", verify_price_latest, rebuild_price_latest),
+]
+
+
+async def rebuild_all(conn: aiosqlite.Connection) -> dict[str, int]:
+    """Recalcula todas as tabelas derivadas (linhas por tabela). Não faz commit."""
+    return {d.name: await d.rebuild(conn) for d in DERIVED}
+
+
+async def main(args: argparse.Namespace) -> int:
+    from app.database import get_db, init_db, transaction
+
+    await init_db()
+    async with get_db() as conn:
+        if args.command == "rebuild":
+            async with transaction(conn):
+                counts = await rebuild_all(conn)
+            for name, rows in counts.items():
+                print(f"{name}: {rows} linhas recalculadas")
+            return 0
+        failed = False
+        for d in DERIVED:
+            diffs = await d.verify(conn)
+            for diff in diffs:
+                print(f"{d.name}: divergência {diff}")
+            print(f"{d.name}: {len(diffs)} divergências")
+            failed = failed or bool(diffs)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,109 @@
+"""Memória do chat: resumo persistente da conversa + janela recente limitada por tokens.
+
+O prompt do chat leva o último resumo (tabela chat_summaries) e as mensagens mais recentes ainda
+não resumidas que cabem em chat_history_token_budget. A cada chat_summary_every_turns turnos (pergunta + resposta)
+ainda não resumidos, um novo resumo é gerado em segundo plano, fora do caminho da resposta.
+"""
+import asyncio
+import logging
+from typing import Any, Optional
+
+import aiosqlite
+
+from app.config import settings
+from app.database import get_db, write_session
+from app.llm import estimate_tokens, summarize_conversation
+from app.repositories import (
+    get_chat_messages_after,
+    get_latest_chat_summary,
+    get_recent_chat,
+    insert_chat_summary,
+)
+
+logger = logging.getLogger(__name__)
+
+_refresh_task: Optional[asyncio.Task] = None
+_stats = {"summaries": 0, "summary_errors": 0, "last_window_tokens": 0, "last_window_messages": 0}
+
+
+def token_window(messages: list[tuple[str, str]], budget: int) -> list[tuple[str, str]]:
+    """Mensagens mais recentes (em ordem cronológica) cuja soma estimada de tokens cabe no budget.
+    A última mensagem sempre entra, mesmo que sozinha estoure o orçamento."""
+    out: list[tuple[str, str]] = []
+    used = 0
+    for role, content in reversed(messages):
+        cost = estimate_tokens(content) + 2
+        if out and used + cost > budget:
+            break
+        out.append((role, content))
+        used += cost
+    out.reverse()
+    return out
+
+
+async def load_history(conn: aiosqlite.Connection) -> tuple[str, list[tuple[str, str]]]:
+    """(resumo da conversa, janela recente) para montar o prompt do chat. A janela só leva
+    mensagens posteriores às que o resumo já cobre."""
+    summary, last_id = await get_latest_chat_summary(conn)
+    recent = await get_recent_chat(
+        conn, limit=settings.chat_history_max_messages, after_id=last_id
+    )
+    window = token_window(recent, settings.chat_history_token_budget)
+    _stats["last_window_messages"] = len(window)
+    _stats["last_window_tokens"] = sum(estimate_tokens(c) for _, c in window)
+    return summary, window
+
+
+async def _refresh_summary() -> None:
+    async with get_db() as conn:
+        previous, last_id = await get_latest_chat_summary(conn)
+        pending = await get_chat_messages_after(conn, last_id)
+    if len(pending) < 2 * settings.chat_summary_every_turns:
+        return
+    summary, _, _ = await summarize_conversation(
+        previous, [(role, content) for _, role, content in pending]
+    )
+    if not summary:
+        return
+    async with write_session() as conn:
+        await insert_chat_summary(conn, summary, pending[-1][0])
+    _stats["summaries"] += 1
+    logger.info(
+        "resumo do chat atualizado até a mensagem %d (~%d tokens)",
+        pending[-1][0],
+        estimate_tokens(summary),
+    )
+
+
+async def _run_refresh() -> None:
+    try:
+        await _refresh_summary()
+    except Exception:
+        _stats["summary_errors"] += 1
+        logger.exception("falha ao atualizar o resumo do chat")
+
+
+def schedule_summary_refresh() -> None:
+    """Dispara (sem esperar) a atualização do resumo, se não houver uma em andamento."""
+    global _refresh_task
+    if settings.chat_summary_every_turns <= 0:
+        return
+    if _refresh_task is not None and not _refresh_task.done():
+        return
+    _refresh_task = asyncio.create_task(_run_refresh())
+
+
+async def stop_summary_refresh(cancel: bool = True) -> None:
+    """Encerra a atualização do resumo em andamento: cancela (shutdown) ou, com cancel=False,
+    espera terminar. Chamar antes de parar o prompt_log_writer e fechar o pool/writer, que ela usa."""
+    global _refresh_task
+    task, _refresh_task = _refresh_task, None
+    if task is None or task.done():
+        return
+    if cancel:
+        task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def memory_stats() -> dict[str, Any]:
+    return {**_stats, "token_budget": settings.chat_history_token_budget}
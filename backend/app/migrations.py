@@ -0,0 +1,372 @@
+"""Migrações do schema SQLite, versionadas por PRAGMA user_version.
+
+Cada Migration leva o banco da versão anterior para `version` e roda numa transação própria
+(BEGIN IMMEDIATE), junto com a atualização do user_version: ou o passo inteiro entra, ou nada.
+O BEGIN IMMEDIATE também serve de trava entre processos: com vários workers subindo juntos,
+só um aplica cada passo; os outros esperam (busy_timeout) e, ao entrar, relêem a versão.
+
+Com o banco em dia, a subida faz só a leitura do user_version. Para mudar o schema, acrescente
+um passo no fim de MIGRATIONS (nunca edite um passo já publicado).
+
+Os passos 1 a 5 reproduzem o schema criado antes do versionamento e usam IF NOT EXISTS, para
+que bancos antigos (user_version 0, tabelas já existentes) sejam adotados sem erro.
+"""
+import logging
+import re
+import unicodedata
+from typing import Awaitable, Callable, NamedTuple
+
+import aiosqlite
+
+from app import maintenance, prompt_store
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[aiosqlite.Connection], Awaitable[None]]
+    vacuum: bool = False  # compactar o arquivo depois (fora da transação)
+
+
+async def _ensure_columns(db: aiosqlite.Connection, table: str, columns: dict[str, str]) -> None:
+    """ALTER TABLE ADD COLUMN para as colunas que ainda não existem."""
+    cur = await db.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in await cur.fetchall()}
+    for name, decl in columns.items():
+        if name not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+
+async def _base_schema(db: aiosqlite.Connection) -> None:
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            balance REAL NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            amount REAL NOT NULL,
+            description TEXT NOT NULL,
+            category_id INTEGER NOT NULL REFERENCES categories(id),
+            account_id INTEGER REFERENCES accounts(id),
+            tx_date TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_tx_date ON transactions(tx_date)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_tx_account ON transactions(account_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_tx_category ON transactions(category_id)")
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS shopping_lists (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            active INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS shopping_list_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            list_id INTEGER NOT NULL REFERENCES shopping_lists(id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            checked INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_shopping_items_list ON shopping_list_items(list_id)")
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS prompt_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            prompt_text TEXT NOT NULL,
+            response_text TEXT NOT NULL,
+            model TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_prompt_logs_created ON prompt_logs(created_at)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_prompt_logs_kind ON prompt_logs(kind)")
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS product_prices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_name TEXT NOT NULL,
+            market_name TEXT NOT NULL,
+            price REAL NOT NULL,
+            recorded_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_product_prices_product ON product_prices(product_name)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_product_prices_recorded ON product_prices(recorded_at)")
+    default_cats = [
+        "Alimentação", "Transporte", "Moradia", "Saúde", "Educação",
+        "Lazer", "Compras", "Serviços", "Salário", "Investimentos", "Outros",
+    ]
+    await db.executemany(
+        "INSERT OR IGNORE INTO categories (name) VALUES (?)", [(name,) for name in default_cats]
+    )
+
+
+async def _chat_summaries(db: aiosqlite.Connection) -> None:
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS chat_summaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            summary TEXT NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+
+
+async def _context_change_counter(db: aiosqlite.Connection) -> None:
+    # Contador incrementado por trigger a cada escrita nas tabelas que entram no contexto do chat
+    # (contas, transações, listas). Usado para invalidar o snapshot de contexto em cache.
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS change_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    await db.execute("INSERT OR IGNORE INTO change_counters (name, value) VALUES ('context', 0)")
+    for table in ("accounts", "transactions", "shopping_lists", "shopping_list_items"):
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            await db.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_context_{table}_{op.lower()}
+                AFTER {op} ON {table}
+                BEGIN
+                    UPDATE change_counters SET value = value + 1 WHERE name = 'context';
+                END
+            """)
+
+
+async def _prompt_log_metrics(db: aiosqlite.Connection) -> None:
+    await _ensure_columns(db, "prompt_logs", {
+        "duration_ms": "REAL",
+        "queue_ms": "REAL",
+        "input_tokens": "INTEGER",
+        "output_tokens": "INTEGER",
+        "status": "TEXT NOT NULL DEFAULT 'ok'",
+        "error": "TEXT",
+    })
+
+
+async def _prompt_blobs(db: aiosqlite.Connection) -> None:
+    """Texto dos prompt logs por parágrafo, deduplicado por hash (app/prompt_store.py).
+    Converte as linhas com texto inline (prompt_text/response_text), mantendo os ids."""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS prompt_blobs (
+            hash BLOB PRIMARY KEY,
+            data BLOB NOT NULL
+        ) WITHOUT ROWID
+    """)
+    cur = await db.execute("PRAGMA table_info(prompt_logs)")
+    if "prompt_text" not in {row[1] for row in await cur.fetchall()}:
+        return
+    await db.execute("DROP TABLE IF EXISTS prompt_logs_new")
+    await db.execute("""
+        CREATE TABLE prompt_logs_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            model TEXT NOT NULL,
+            prompt_refs BLOB NOT NULL,
+            response_refs BLOB NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            duration_ms REAL,
+            queue_ms REAL,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            status TEXT NOT NULL DEFAULT 'ok',
+            error TEXT
+        )
+    """)
+    cur = await db.execute("""
+        SELECT id, kind, model, prompt_text, response_text, created_at,
+               duration_ms, queue_ms, input_tokens, output_tokens, status, error
+        FROM prompt_logs ORDER BY id
+    """)
+    migrated = 0
+    while rows := await cur.fetchmany(1000):
+        blobs: dict[bytes, bytes] = {}
+        batch = [
+            (r[0], r[1], r[2], prompt_store.encode(r[3], blobs), prompt_store.encode(r[4], blobs), *r[5:])
+            for r in rows
+        ]
+        await prompt_store.save_blobs(db, blobs)
+        await db.executemany(
+            """INSERT INTO prompt_logs_new
+               (id, kind, model, prompt_refs, response_refs, created_at,
+                duration_ms, queue_ms, input_tokens, output_tokens, status, error)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            batch,
+        )
+        migrated += len(batch)
+    await db.execute("DROP TABLE prompt_logs")
+    await db.execute("ALTER TABLE prompt_logs_new RENAME TO prompt_logs")
+    await db.execute("CREATE INDEX idx_prompt_logs_created ON prompt_logs(created_at)")
+    await db.execute("CREATE INDEX idx_prompt_logs_kind ON prompt_logs(kind)")
+    logger.info("prompt_logs convertido para prompt_blobs: %d linhas", migrated)
+
+
+async def _monthly_category_totals(db: aiosqlite.Connection) -> None:
+    # Totais por (ano, mês, categoria), mantidos por create_transaction; preenchido aqui a partir
+    # do histórico. app/maintenance.py confere e reconstrói a tabela.
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS monthly_category_totals (
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            category_id INTEGER NOT NULL REFERENCES categories(id),
+            total REAL NOT NULL DEFAULT 0,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (year, month, category_id)
+        ) WITHOUT ROWID
+    """)
+    await maintenance.rebuild_monthly_totals(db)
+
+
+async def _account_spending(db: aiosqlite.Connection) -> None:
+    # Soma dos gastos por conta, mantida por create_transaction (conferida por app/maintenance.py).
+    await _ensure_columns(db, "accounts", {"spending": "REAL NOT NULL DEFAULT 0"})
+    await maintenance.rebuild_account_spending(db)
+
+
+def _fold_key(name: str) -> str:
+    # cópia de repositories.price_key na versão deste passo
+    s = unicodedata.normalize("NFKD", name or "")
+    s = "".join(c for c in s if not unicodedata.combining(c)).lower()
+    return re.sub(r"\s+", " ", s).strip()
+
+
+async def _product_price_keys(db: aiosqlite.Connection) -> None:
+    # Nome de produto/mercado normalizado (sem acento, minúsculas, espaços colapsados), gravado
+    # por insert/update_product_price; o índice composto atende a busca do último preço por mercado.
+    await _ensure_columns(db, "product_prices", {
+        "product_key": "TEXT NOT NULL DEFAULT ''",
+        "market_key": "TEXT NOT NULL DEFAULT ''",
+    })
+    cur = await db.execute("SELECT id, product_name, market_name FROM product_prices")
+    while rows := await cur.fetchmany(1000):
+        await db.executemany(
+            "UPDATE product_prices SET product_key = ?, market_key = ? WHERE id = ?",
+            [(_fold_key(r[1]), _fold_key(r[2]), r[0]) for r in rows],
+        )
+    await db.execute("DROP INDEX IF EXISTS idx_product_prices_product")
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_product_prices_keys
+        ON product_prices(product_key, market_key, recorded_at DESC)
+    """)
+
+
+async def _product_price_latest(db: aiosqlite.Connection) -> None:
+    # Último preço por (produto, mercado), com o menor preço do produto já marcado (is_best);
+    # mantida por insert/update/delete_product_price, lida por GET /api/product-prices.
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS product_price_latest (
+            product_key TEXT NOT NULL,
+            market_key TEXT NOT NULL,
+            price_id INTEGER NOT NULL,
+            product_name TEXT NOT NULL,
+            market_name TEXT NOT NULL,
+            price REAL NOT NULL,
+            recorded_at TEXT NOT NULL,
+            is_best INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (product_key, market_key)
+        ) WITHOUT ROWID
+    """)
+    await maintenance.rebuild_price_latest(db)
+
+
+async def _keyset_indexes(db: aiosqlite.Connection) -> None:
+    # Paginação por keyset: (tx_date, id) e (created_at, id) já saem de idx_tx_date e
+    # idx_prompt_logs_created (o rowid vai junto no índice). Os filtros por conta, categoria e kind
+    # ganham índices compostos com a data, para filtrar e paginar sem ordenar à parte.
+    await db.execute("DROP INDEX IF EXISTS idx_tx_account")
+    await db.execute("DROP INDEX IF EXISTS idx_tx_category")
+    await db.execute("DROP INDEX IF EXISTS idx_prompt_logs_kind")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_tx_account_date ON transactions(account_id, tx_date)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_tx_category_date ON transactions(category_id, tx_date)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_prompt_logs_kind_created ON prompt_logs(kind, created_at)")
+
+
+async def _product_price_covering_index(db: aiosqlite.Connection) -> None:
+    # Mais recente por mercado (ROW_NUMBER por market_key, recorded_at DESC, id DESC) direto do
+    # índice: mesma ordem da janela e com as colunas lidas, sem ordenar à parte nem ir à tabela.
+    await db.execute("DROP INDEX IF EXISTS idx_product_prices_keys")
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_product_prices_latest
+        ON product_prices(product_key, market_key, recorded_at DESC, id DESC, market_name, price)
+    """)
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "base_schema", _base_schema),
+    Migration(2, "chat_summaries", _chat_summaries),
+    Migration(3, "context_change_counter", _context_change_counter),
+    Migration(4, "prompt_log_metrics", _prompt_log_metrics),
+    Migration(5, "prompt_blobs", _prompt_blobs, vacuum=True),
+    Migration(6, "monthly_category_totals", _monthly_category_totals),
+    Migration(7, "account_spending", _account_spending),
+    Migration(8, "product_price_keys", _product_price_keys),
+    Migration(9, "product_price_latest", _product_price_latest),
+    Migration(10, "keyset_indexes", _keyset_indexes),
+    Migration(11, "product_price_covering_index", _product_price_covering_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def _user_version(db: aiosqlite.Connection) -> int:
+    cur = await db.execute("PRAGMA user_version")
+    return (await cur.fetchone())[0]
+
+
+async def migrate(path: str, lock_timeout_ms: int = 60_000) -> int:
+    """Aplica os passos pendentes e retorna a versão final do schema."""
+    # isolation_level=None: as transações são abertas/fechadas aqui, explicitamente
+    async with aiosqlite.connect(path, isolation_level=None) as db:
+        version = await _user_version(db)
+        if version >= LATEST_VERSION:
+            return version
+        await db.execute(f"PRAGMA busy_timeout = {int(lock_timeout_ms)}")
+        # WAL fica gravado no arquivo: leitores deixam de bloquear o escritor (e vice-versa)
+        await db.execute("PRAGMA journal_mode=WAL")
+        vacuum = False
+        while True:
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                version = await _user_version(db)  # outro worker pode ter migrado enquanto esperávamos
+                step = next((m for m in MIGRATIONS if m.version > version), None)
+                if step is None:
+                    await db.execute("ROLLBACK")
+                    break
+                logger.info("migração %d (%s)", step.version, step.name)
+                await step.apply(db)
+                await db.execute(f"PRAGMA user_version = {step.version}")
+                await db.execute("COMMIT")
+            except BaseException:
+                await db.execute("ROLLBACK")
+                raise
+            vacuum = vacuum or step.vacuum
+        if vacuum:
+            await db.execute("VACUUM")
+        return version
@@ -52,6 +52,12 @@ class Transaction(BaseModel):
     created_at: str
 
 
+class TransactionPage(BaseModel):
+    """Página de transações; next_cursor vai no parâmetro cursor da próxima (None: acabou)."""
+    items: list[Transaction]
+    next_cursor: Optional[str] = None
+
+
 class ChatMessage(BaseModel):
     role: str
     content: str
@@ -67,6 +73,21 @@ class ChatResponse(BaseModel):
     error_type: Optional[str] = None  # "quota" | "llm" quando reply é mensagem de erro
 
 
+class ChatBatchRequest(BaseModel):
+    messages: list[str]
+
+
+class ChatBatchItem(BaseModel):
+    message: str
+    reply: str = ""  # blocos de lista/preço, como o prefixo do chat
+    extracted_transaction: Optional[Transaction] = None
+    error_type: Optional[str] = None  # "extraction" | "invalid"
+
+
+class ChatBatchResponse(BaseModel):
+    results: list[ChatBatchItem]
+
+
 class CategoryTotal(BaseModel):
     category_name: str
     total: float
@@ -109,3 +130,29 @@ class PromptLog(BaseModel):
     response_text: str
     model: str
     created_at: str
+    duration_ms: Optional[float] = None
+    queue_ms: Optional[float] = None
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    status: str = "ok"
+    error: Optional[str] = None
+
+
+class PromptLogPage(BaseModel):
+    items: list[PromptLog]
+    next_cursor: Optional[str] = None
+
+
+class PromptLogStats(BaseModel):
+    kind: str
+    model: str
+    calls: int
+    errors: int
+    timeouts: int = 0
+    p50_ms: Optional[float] = None
+    p95_ms: Optional[float] = None
+    p99_ms: Optional[float] = None
+    max_ms: Optional[float] = None
+    avg_queue_ms: Optional[float] = None
+    input_tokens: int = 0
+    output_tokens: int = 0
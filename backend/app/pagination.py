@@ -0,0 +1,34 @@
+"""Cursores da paginação por keyset (GET /api/transactions e /api/prompt-logs).
+
+O cursor guarda a chave de ordenação do último item da página, ex. (tx_date, id), e a próxima
+página começa logo depois dela (WHERE (tx_date, id) < (?, ?)), pelo índice, sem OFFSET: o custo
+por página não depende de quão fundo se está no histórico. Para o cliente o cursor é opaco
+(base64 de um JSON); só se devolve o next_cursor recebido.
+"""
+import base64
+import binascii
+import json
+from typing import Any, Optional
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], types: tuple[type, ...]) -> Optional[tuple]:
+    """Valores do cursor, conferidos contra `types`; None sem cursor. Cursor inválido: ValueError."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise ValueError("Cursor inválido") from None
+    if (
+        not isinstance(values, list)
+        or len(values) != len(types)
+        or not all(type(v) is t for v, t in zip(values, types))
+    ):
+        raise ValueError("Cursor inválido")
+    return tuple(values)
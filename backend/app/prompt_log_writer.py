@@ -0,0 +1,159 @@
+"""Gravação dos prompt logs fora do caminho da resposta (write-behind).
+
+log_prompt só enfileira; uma task iniciada no lifespan grava em lotes (executemany numa
+write_session, que entra no group commit do writer do banco).
+A fila tem tamanho máximo (prompt_log_queue_size): cheia, log_prompt espera abrir espaço.
+No shutdown, stop() grava o que ainda estiver na fila. log_prompt_nowait não espera (serve para
+registrar chamadas canceladas); com a fila cheia o registro é descartado e contado em "dropped".
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from app.config import settings
+from app.database import write_session
+from app.repositories import insert_prompt_logs
+
+logger = logging.getLogger(__name__)
+
+_queue: Optional[asyncio.Queue] = None
+_task: Optional[asyncio.Task] = None
+_stats = {"enqueued": 0, "written": 0, "batches": 0, "failed": 0, "dropped": 0, "max_queue": 0}
+
+
+def _now() -> str:
+    # mesmo formato do datetime('now') do SQLite (UTC)
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _row(
+    kind: str,
+    prompt_text: str,
+    response_text: str,
+    model: str,
+    duration_ms: Optional[float],
+    queue_ms: Optional[float],
+    input_tokens: Optional[int],
+    output_tokens: Optional[int],
+    status: str,
+    error: Optional[str],
+) -> tuple:
+    return (
+        kind, prompt_text, response_text, model, _now(),
+        duration_ms, queue_ms, input_tokens, output_tokens, status, error,
+    )
+
+
+async def log_prompt(
+    kind: str,
+    prompt_text: str,
+    response_text: str,
+    model: str,
+    *,
+    duration_ms: Optional[float] = None,
+    queue_ms: Optional[float] = None,
+    input_tokens: Optional[int] = None,
+    output_tokens: Optional[int] = None,
+    status: str = "ok",
+    error: Optional[str] = None,
+) -> None:
+    row = _row(
+        kind, prompt_text, response_text, model,
+        duration_ms, queue_ms, input_tokens, output_tokens, status, error,
+    )
+    if _queue is None:
+        # writer não iniciado (ex.: scripts fora do app): grava direto
+        async with write_session() as conn:
+            await insert_prompt_logs(conn, [row])
+        return
+    await _queue.put(row)
+    _stats["enqueued"] += 1
+    _stats["max_queue"] = max(_stats["max_queue"], _queue.qsize())
+
+
+def log_prompt_nowait(
+    kind: str,
+    prompt_text: str,
+    response_text: str,
+    model: str,
+    *,
+    duration_ms: Optional[float] = None,
+    queue_ms: Optional[float] = None,
+    input_tokens: Optional[int] = None,
+    output_tokens: Optional[int] = None,
+    status: str = "ok",
+    error: Optional[str] = None,
+) -> None:
+    """Como log_prompt, sem await: descarta o registro se a fila estiver cheia ou o writer parado."""
+    row = _row(
+        kind, prompt_text, response_text, model,
+        duration_ms, queue_ms, input_tokens, output_tokens, status, error,
+    )
+    if _queue is None:
+        _stats["dropped"] += 1
+        return
+    try:
+        _queue.put_nowait(row)
+    except asyncio.QueueFull:
+        _stats["dropped"] += 1
+        return
+    _stats["enqueued"] += 1
+
+
+async def _flush(batch: list[tuple]) -> None:
+    try:
+        async with write_session() as conn:
+            await insert_prompt_logs(conn, batch)
+    except Exception:
+        _stats["failed"] += len(batch)
+        logger.exception("falha ao gravar %d prompt logs", len(batch))
+        return
+    _stats["written"] += len(batch)
+    _stats["batches"] += 1
+
+
+async def _run(queue: asyncio.Queue) -> None:
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        row = await queue.get()
+        if row is None:
+            break
+        batch = [row]
+        deadline = loop.time() + settings.prompt_log_flush_interval
+        while len(batch) < settings.prompt_log_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if row is None:
+                stopping = True
+                break
+            batch.append(row)
+        await _flush(batch)
+
+
+async def start() -> None:
+    global _queue, _task
+    if _task is not None:
+        return
+    _queue = asyncio.Queue(maxsize=max(1, settings.prompt_log_queue_size))
+    _task = asyncio.create_task(_run(_queue))
+
+
+async def stop() -> None:
+    """Grava o que estiver na fila e encerra a task."""
+    global _queue, _task
+    if _task is None or _queue is None:
+        return
+    await _queue.put(None)
+    await _task
+    _queue, _task = None, None
+
+
+def prompt_log_writer_stats() -> dict[str, Any]:
+    return {**_stats, "queued": _queue.qsize() if _queue is not None else 0}
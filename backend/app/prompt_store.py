@@ -0,0 +1,64 @@
+"""Texto dos prompt logs guardado por conteúdo, sem repetição.
+
+Cada prompt/resposta é cortado em parágrafos ("\\n\\n"). Cada parágrafo vira um blob em
+prompt_blobs, endereçado pelo hash (blake2b de 16 bytes) e comprimido com zlib; a linha de
+prompt_logs guarda só a sequência de hashes (16 bytes por parágrafo). Os templates fixos
+(EXTRACTION_PROMPT etc.), o bloco de contexto e as mensagens recentes do chat se repetem entre
+chamadas e por isso são gravados uma vez só.
+"""
+import hashlib
+import zlib
+from typing import Iterable
+
+import aiosqlite
+
+SEPARATOR = "\n\n"
+HASH_SIZE = 16
+
+
+def _hash(segment: str) -> bytes:
+    return hashlib.blake2b(segment.encode("utf-8"), digest_size=HASH_SIZE).digest()
+
+
+def encode(text: str, blobs: dict[bytes, bytes]) -> bytes:
+    """Refs (hashes concatenados) do texto; os blobs dos parágrafos são acrescentados em `blobs`."""
+    if not text:
+        return b""
+    refs = []
+    for segment in text.split(SEPARATOR):
+        h = _hash(segment)
+        if h not in blobs:
+            blobs[h] = zlib.compress(segment.encode("utf-8"))
+        refs.append(h)
+    return b"".join(refs)
+
+
+def split_refs(refs: bytes) -> list[bytes]:
+    return [refs[i:i + HASH_SIZE] for i in range(0, len(refs), HASH_SIZE)]
+
+
+def decode(refs: bytes, segments: dict[bytes, str]) -> str:
+    return SEPARATOR.join(segments[h] for h in split_refs(refs))
+
+
+async def save_blobs(conn: aiosqlite.Connection, blobs: dict[bytes, bytes]) -> None:
+    """Grava os blobs que ainda não existem (não faz commit)."""
+    if blobs:
+        await conn.executemany(
+            "INSERT OR IGNORE INTO prompt_blobs (hash, data) VALUES (?, ?)", list(blobs.items())
+        )
+
+
+async def load_segments(conn: aiosqlite.Connection, refs: Iterable[bytes]) -> dict[bytes, str]:
+    """Texto de cada parágrafo referenciado em `refs` (várias sequências de hashes)."""
+    wanted = list({h for r in refs for h in split_refs(r)})
+    segments: dict[bytes, str] = {}
+    for i in range(0, len(wanted), 500):
+        chunk = wanted[i:i + 500]
+        cur = await conn.execute(
+            f"SELECT hash, data FROM prompt_blobs WHERE hash IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        for h, data in await cur.fetchall():
+            segments[h] = zlib.decompress(data).decode("utf-8")
+    return segments
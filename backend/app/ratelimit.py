@@ -0,0 +1,192 @@
+"""Proteção da cota do Gemini, compartilhada por todas as chamadas do llm.py.
+
+- Token bucket: no máximo llm_rate_per_minute chamadas por minuto (rajadas de até llm_rate_burst);
+  com llm_rate_per_minute = 0 (default) não há limite local.
+- Retry com backoff exponencial e jitter para erros transitórios (429, 5xx, timeout).
+- Circuit breaker: depois de llm_breaker_threshold erros de cota seguidos, recusa as chamadas
+  na hora (QuotaExceededError) por llm_breaker_cooldown segundos, em vez de insistir na API.
+"""
+import asyncio
+import random
+import re
+import time
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from google.api_core import exceptions as gexc
+
+from app.config import settings
+
+T = TypeVar("T")
+
+# Classificação dos erros: pelo tipo (google.api_core) ou pelo código HTTP (atributo code/status_code
+# ou número no início da mensagem, como em "500 Internal error"); as palavras-chave são frases,
+# nunca números soltos, para "R$ 500" ou "gemini-1500" numa mensagem não virarem erro transitório.
+QUOTA_ERRORS = (gexc.TooManyRequests, gexc.ResourceExhausted)
+TRANSIENT_ERRORS = (
+    gexc.InternalServerError,
+    gexc.BadGateway,
+    gexc.ServiceUnavailable,
+    gexc.GatewayTimeout,
+    gexc.DeadlineExceeded,
+    TimeoutError,
+)
+QUOTA_KEYWORDS = ("quota", "resource exhausted", "rate limit", "rate_limit", "resource_exhausted")
+TRANSIENT_KEYWORDS = ("unavailable", "deadline exceeded", "internal error")
+
+_LEADING_STATUS = re.compile(r"^\s*([1-5]\d\d)\b")
+
+
+class QuotaExceededError(Exception):
+    """Chamada recusada localmente (circuit breaker aberto ou fila do rate limit longa demais)."""
+
+
+def _status_code(e: BaseException) -> Optional[int]:
+    for attr in ("code", "status_code"):
+        code = getattr(e, attr, None)
+        if isinstance(code, int):
+            return code
+    m = _LEADING_STATUS.match(str(e))
+    return int(m.group(1)) if m else None
+
+
+def is_quota_error(e: BaseException) -> bool:
+    if isinstance(e, (QuotaExceededError, *QUOTA_ERRORS)):
+        return True
+    if _status_code(e) == 429:
+        return True
+    s = str(e).lower()
+    return any(k in s for k in QUOTA_KEYWORDS)
+
+
+def is_retryable(e: BaseException) -> bool:
+    if isinstance(e, QuotaExceededError):
+        return False
+    if is_quota_error(e) or isinstance(e, TRANSIENT_ERRORS):
+        return True
+    code = _status_code(e)
+    if code is not None:
+        return 500 <= code <= 599
+    s = str(e).lower()
+    return any(k in s for k in TRANSIENT_KEYWORDS)
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst: int) -> None:
+        self.enabled = rate_per_minute > 0
+        self.rate = max(rate_per_minute, 0.001) / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, max_wait: float) -> None:
+        """Consome um token, esperando a reposição; se a espera passar de max_wait, recusa."""
+        if not self.enabled:
+            return
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+                if wait > max_wait:
+                    raise QuotaExceededError(
+                        f"quota: limite local de {settings.llm_rate_per_minute:g} chamadas/min atingido"
+                    )
+                await asyncio.sleep(wait)
+                self._refill()
+            self.tokens -= 1
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = 0.0
+        self.state = "closed"  # closed | open | half_open
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = "half_open"  # deixa passar uma chamada de teste
+            return True
+        if self.state == "half_open":
+            return False  # já há uma chamada de teste em andamento
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.state = "closed"
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def record_other(self) -> None:
+        """Erro que não diz nada sobre a cota: só libera o half_open."""
+        if self.state == "half_open":
+            self.state = "closed"
+
+
+_bucket = TokenBucket(settings.llm_rate_per_minute, settings.llm_rate_burst)
+_breaker = CircuitBreaker(settings.llm_breaker_threshold, settings.llm_breaker_cooldown)
+_stats = {"calls": 0, "retries": 0, "rejected": 0, "quota_errors": 0}
+
+
+def _backoff(attempt: int) -> float:
+    """Backoff exponencial com "full jitter"."""
+    cap = min(settings.llm_backoff_max, settings.llm_backoff_base * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+async def call_with_limits(call: Callable[[], Awaitable[T]]) -> T:
+    """Executa call() passando por breaker, token bucket e retries com backoff."""
+    attempt = 0
+    while True:
+        if not _breaker.allow():
+            _stats["rejected"] += 1
+            raise QuotaExceededError("quota: Gemini recusando chamadas; circuito aberto temporariamente")
+        try:
+            await _bucket.acquire(settings.llm_rate_max_wait)
+        except QuotaExceededError:
+            _stats["rejected"] += 1
+            _breaker.record_other()
+            raise
+        _stats["calls"] += 1
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            _breaker.record_other()
+            raise
+        except Exception as e:
+            if is_quota_error(e):
+                _stats["quota_errors"] += 1
+                _breaker.record_failure()
+            else:
+                _breaker.record_other()
+            if not is_retryable(e) or attempt >= settings.llm_max_retries or _breaker.state == "open":
+                raise
+            _stats["retries"] += 1
+            await asyncio.sleep(_backoff(attempt))
+            attempt += 1
+            continue
+        _breaker.record_success()
+        return result
+
+
+def rate_limit_stats() -> dict[str, Any]:
+    _bucket._refill()
+    return {
+        **_stats,
+        "breaker_state": _breaker.state,
+        "consecutive_quota_errors": _breaker.failures,
+        "tokens_available": round(_bucket.tokens, 2) if _bucket.enabled else None,
+        "rate_per_minute": settings.llm_rate_per_minute,
+    }
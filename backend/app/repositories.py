@@ -1,16 +1,25 @@
-from typing import Optional
+"""Acesso ao banco. As funções de escrita não fazem commit: quem chama agrupa as escritas de uma
+operação com app.database.transaction() (um commit só, ou rollback de tudo em caso de erro)."""
+import re
+import unicodedata
+from typing import AsyncIterator, Optional
 
 import aiosqlite
 
+from app import maintenance, prompt_store
+from app.pagination import decode_cursor, encode_cursor
 from app.models import (
     Account,
     AccountWithStats,
     Category,
     CategoryTotal,
     PromptLog,
+    PromptLogPage,
+    PromptLogStats,
     ShoppingList,
     ShoppingListItem,
     Transaction,
+    TransactionPage,
 )
 
 
@@ -25,7 +34,6 @@ async def get_or_create_category(conn: aiosqlite.Connection, name: str) -> int:
     await conn.execute(
         "INSERT INTO categories (name) VALUES (?)", (name,)
     )
-    await conn.commit()
     cur = await conn.execute("SELECT last_insert_rowid()")
     row = await cur.fetchone()
     return row[0]
@@ -44,7 +52,6 @@ async def get_or_create_account(conn: aiosqlite.Connection, name: str) -> Option
     await conn.execute(
         "INSERT INTO accounts (name, balance) VALUES (?, 0)", (name,)
     )
-    await conn.commit()
     cur = await conn.execute("SELECT last_insert_rowid()")
     row = await cur.fetchone()
     return row[0]
@@ -58,7 +65,6 @@ async def create_account(conn: aiosqlite.Connection, name: str, balance: float =
     await conn.execute(
         "INSERT INTO accounts (name, balance) VALUES (?, ?)", (name, balance)
     )
-    await conn.commit()
     cur = await conn.execute("SELECT last_insert_rowid()")
     row = await cur.fetchone()
     aid = row[0]
@@ -80,34 +86,22 @@ async def list_accounts(conn: aiosqlite.Connection) -> list[Account]:
     ]
 
 
-async def get_spending_by_account(conn: aiosqlite.Connection) -> dict[int, float]:
-    """Gastos totais por account_id (soma dos amount das transações)."""
+async def list_accounts_with_stats(conn: aiosqlite.Connection) -> list[AccountWithStats]:
     cur = await conn.execute(
-        """SELECT account_id, COALESCE(SUM(amount), 0) FROM transactions
-           WHERE account_id IS NOT NULL GROUP BY account_id"""
+        "SELECT id, name, balance, created_at, spending FROM accounts ORDER BY name"
     )
     rows = await cur.fetchall()
-    return {r[0]: r[1] for r in rows}
-
-
-async def list_accounts_with_stats(conn: aiosqlite.Connection) -> list[AccountWithStats]:
-    accounts = await list_accounts(conn)
-    spending = await get_spending_by_account(conn)
-    out: list[AccountWithStats] = []
-    for a in accounts:
-        s = spending.get(a.id, 0.0)
-        ef = a.balance - s
-        out.append(
-            AccountWithStats(
-                id=a.id,
-                name=a.name,
-                balance=a.balance,
-                created_at=a.created_at,
-                spending=s,
-                effective_balance=ef,
-            )
+    return [
+        AccountWithStats(
+            id=r[0],
+            name=r[1],
+            balance=r[2],
+            created_at=r[3],
+            spending=r[4],
+            effective_balance=r[2] - r[4],
         )
-    return out
+        for r in rows
+    ]
 
 
 async def update_account(
@@ -142,7 +136,6 @@ async def update_account(
     await conn.execute(
         f"UPDATE accounts SET {', '.join(updates)} WHERE id = ?", params
     )
-    await conn.commit()
     cur = await conn.execute(
         "SELECT id, name, balance, created_at FROM accounts WHERE id = ?", (account_id,)
     )
@@ -157,7 +150,6 @@ async def delete_account(conn: aiosqlite.Connection, account_id: int) -> None:
     if await cur.fetchone():
         raise ValueError("Não é possível excluir conta com transações vinculadas.")
     await conn.execute("DELETE FROM accounts WHERE id = ?", (account_id,))
-    await conn.commit()
 
 
 async def list_categories(conn: aiosqlite.Connection) -> list[Category]:
@@ -171,6 +163,29 @@ async def list_categories(conn: aiosqlite.Connection) -> list[Category]:
     ]
 
 
+async def _add_to_monthly_totals(
+    conn: aiosqlite.Connection, tx_date: str, category_id: int, amount: float, count: int
+) -> None:
+    """Mantém monthly_category_totals junto com a escrita em transactions (mesma transação).
+    Inclusão: (valor, 1); exclusão: (-valor, -1). Mês e ano saem do tx_date (YYYY-MM-DD), como
+    no rebuild de app/maintenance.py."""
+    await conn.execute(
+        """INSERT INTO monthly_category_totals (year, month, category_id, total, tx_count)
+           VALUES (CAST(substr(?1, 1, 4) AS INTEGER), CAST(substr(?1, 6, 2) AS INTEGER), ?2, ?3, ?4)
+           ON CONFLICT (year, month, category_id) DO UPDATE SET
+               total = total + excluded.total,
+               tx_count = tx_count + excluded.tx_count""",
+        (tx_date, category_id, amount, count),
+    )
+
+
+async def _add_to_account_spending(conn: aiosqlite.Connection, account_id: int, amount: float) -> None:
+    """Mantém accounts.spending (soma dos amount da conta) na mesma transação da escrita."""
+    await conn.execute(
+        "UPDATE accounts SET spending = spending + ? WHERE id = ?", (amount, account_id)
+    )
+
+
 async def create_transaction(
     conn: aiosqlite.Connection,
     amount: float,
@@ -184,10 +199,12 @@ async def create_transaction(
            VALUES (?, ?, ?, ?, ?)""",
         (amount, description, category_id, account_id, tx_date),
     )
-    await conn.commit()
     cur = await conn.execute("SELECT last_insert_rowid()")
     row = await cur.fetchone()
     tid = row[0]
+    await _add_to_monthly_totals(conn, tx_date, category_id, amount, 1)
+    if account_id is not None:
+        await _add_to_account_spending(conn, account_id, amount)
     cur = await conn.execute(
         """SELECT t.id, t.amount, t.description, t.category_id, c.name,
                   t.account_id, a.name, t.tx_date, t.created_at
@@ -214,18 +231,15 @@ async def create_transaction(
 async def get_monthly_spending(
     conn: aiosqlite.Connection, year: int, month: int
 ) -> tuple[float, list[CategoryTotal]]:
-    start = f"{year:04d}-{month:02d}-01"
-    if month == 12:
-        end = f"{year + 1:04d}-01-01"
-    else:
-        end = f"{year:04d}-{month + 1:02d}-01"
+    """Totais do mês por categoria, lidos de monthly_category_totals (uma linha por categoria com
+    gasto no mês, independente do tamanho do histórico)."""
     cur = await conn.execute(
-        """SELECT c.name, SUM(t.amount) as total
-           FROM transactions t
-           JOIN categories c ON c.id = t.category_id
-           WHERE t.tx_date >= ? AND t.tx_date < ?
-           GROUP BY c.id, c.name""",
-        (start, end),
+        """SELECT c.name, m.total
+           FROM monthly_category_totals m
+           JOIN categories c ON c.id = m.category_id
+           WHERE m.year = ? AND m.month = ? AND m.tx_count > 0
+           ORDER BY m.category_id""",
+        (year, month),
     )
     rows = await cur.fetchall()
     by_cat = [CategoryTotal(category_name=r[0], total=r[1]) for r in rows]
@@ -238,7 +252,16 @@ async def get_transactions(
     limit: int = 100,
     year: Optional[int] = None,
     month: Optional[int] = None,
-) -> list[Transaction]:
+    *,
+    account_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    cursor: Optional[str] = None,
+) -> TransactionPage:
+    """Transações da mais recente para a mais antiga, por keyset em (tx_date, id): a página
+    seguinte começa depois do cursor. Cursor inválido: ValueError."""
+    after = decode_cursor(cursor, (str, int))
     q = """SELECT t.id, t.amount, t.description, t.category_id, c.name,
                    t.account_id, a.name, t.tx_date, t.created_at
             FROM transactions t
@@ -254,11 +277,26 @@ async def get_transactions(
             end = f"{year:04d}-{month + 1:02d}-01"
         q += " AND t.tx_date >= ? AND t.tx_date < ?"
         params.extend([start, end])
+    if account_id is not None:
+        q += " AND t.account_id = ?"
+        params.append(account_id)
+    if category_id is not None:
+        q += " AND t.category_id = ?"
+        params.append(category_id)
+    if min_amount is not None:
+        q += " AND t.amount >= ?"
+        params.append(min_amount)
+    if max_amount is not None:
+        q += " AND t.amount <= ?"
+        params.append(max_amount)
+    if after is not None:
+        q += " AND (t.tx_date, t.id) < (?, ?)"
+        params.extend(after)
     q += " ORDER BY t.tx_date DESC, t.id DESC LIMIT ?"
-    params.append(limit)
+    params.append(limit + 1)  # uma a mais para saber se há próxima página
     cur = await conn.execute(q, params)
     rows = await cur.fetchall()
-    return [
+    items = [
         Transaction(
             id=r[0],
             amount=r[1],
@@ -270,8 +308,37 @@ async def get_transactions(
             tx_date=r[7],
             created_at=r[8],
         )
-        for r in rows
+        for r in rows[:limit]
     ]
+    next_cursor = encode_cursor(items[-1].tx_date, items[-1].id) if len(rows) > limit else None
+    return TransactionPage(items=items, next_cursor=next_cursor)
+
+
+async def iter_transactions_export(
+    conn: aiosqlite.Connection,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[list[tuple]]:
+    """Transações de tx_date entre start e end (YYYY-MM-DD, inclusivos), em ordem (tx_date, id),
+    em lotes de batch_size lidos com fetchmany: a memória usada não depende do tamanho da tabela.
+    Linhas: (id, tx_date, amount, description, categoria, conta, created_at)."""
+    q = """SELECT t.id, t.tx_date, t.amount, t.description, c.name, a.name, t.created_at
+           FROM transactions t
+           JOIN categories c ON c.id = t.category_id
+           LEFT JOIN accounts a ON a.id = t.account_id
+           WHERE 1=1"""
+    params: list = []
+    if start:
+        q += " AND t.tx_date >= ?"
+        params.append(start)
+    if end:
+        q += " AND t.tx_date <= ?"
+        params.append(end)
+    q += " ORDER BY t.tx_date, t.id"
+    async with conn.execute(q, params) as cur:
+        while rows := await cur.fetchmany(batch_size):
+            yield [tuple(r) for r in rows]
 
 
 async def append_chat_message(conn: aiosqlite.Connection, role: str, content: str) -> None:
@@ -279,55 +346,186 @@ async def append_chat_message(conn: aiosqlite.Connection, role: str, content: st
         "INSERT INTO chat_messages (role, content) VALUES (?, ?)",
         (role, content),
     )
-    await conn.commit()
 
 
-async def get_recent_chat(conn: aiosqlite.Connection, limit: int = 20) -> list[tuple[str, str]]:
+async def get_chat_messages_after(
+    conn: aiosqlite.Connection, after_id: int, limit: int = 200
+) -> list[tuple[int, str, str]]:
+    """(id, role, content) das mensagens com id > after_id, em ordem cronológica."""
+    cur = await conn.execute(
+        "SELECT id, role, content FROM chat_messages WHERE id > ? ORDER BY id LIMIT ?",
+        (after_id, limit),
+    )
+    rows = await cur.fetchall()
+    return [(r[0], r[1], r[2]) for r in rows]
+
+
+async def get_latest_chat_summary(conn: aiosqlite.Connection) -> tuple[str, int]:
+    """(resumo, id da última mensagem coberta) ou ("", 0) se ainda não há resumo."""
+    cur = await conn.execute(
+        "SELECT summary, last_message_id FROM chat_summaries ORDER BY id DESC LIMIT 1"
+    )
+    row = await cur.fetchone()
+    if not row:
+        return "", 0
+    return row[0], row[1]
+
+
+async def insert_chat_summary(
+    conn: aiosqlite.Connection, summary: str, last_message_id: int
+) -> None:
+    await conn.execute(
+        "INSERT INTO chat_summaries (summary, last_message_id) VALUES (?, ?)",
+        (summary, last_message_id),
+    )
+
+
+async def get_change_counter(conn: aiosqlite.Connection, name: str) -> int:
+    """Valor do contador de alterações (incrementado por triggers; ver init_db)."""
+    cur = await conn.execute("SELECT value FROM change_counters WHERE name = ?", (name,))
+    row = await cur.fetchone()
+    return row[0] if row else 0
+
+
+async def get_recent_chat(
+    conn: aiosqlite.Connection, limit: int = 20, after_id: int = 0
+) -> list[tuple[str, str]]:
+    """(role, content) das últimas `limit` mensagens com id > after_id, em ordem cronológica."""
     cur = await conn.execute(
-        "SELECT role, content FROM chat_messages ORDER BY id DESC LIMIT ?",
-        (limit,),
+        "SELECT role, content FROM chat_messages WHERE id > ? ORDER BY id DESC LIMIT ?",
+        (after_id, limit),
     )
     rows = await cur.fetchall()
     return [(r[0], r[1]) for r in reversed(rows)]
 
 
-async def insert_prompt_log(
+async def insert_prompt_logs(
     conn: aiosqlite.Connection,
-    kind: str,
-    prompt_text: str,
-    response_text: str,
-    model: str,
+    rows: list[tuple],
 ) -> None:
-    await conn.execute(
-        "INSERT INTO prompt_logs (kind, prompt_text, response_text, model) VALUES (?, ?, ?, ?)",
-        (kind, prompt_text, response_text, model),
+    """Insere vários logs de uma vez. Cada linha: (kind, prompt_text, response_text, model,
+    created_at, duration_ms, queue_ms, input_tokens, output_tokens, status, error).
+    Os textos vão para prompt_blobs (app/prompt_store.py); a linha guarda só as referências."""
+    if not rows:
+        return
+    blobs: dict[bytes, bytes] = {}
+    encoded = [
+        (kind, model, prompt_store.encode(prompt, blobs), prompt_store.encode(response, blobs), *rest)
+        for kind, prompt, response, model, *rest in rows
+    ]
+    await prompt_store.save_blobs(conn, blobs)
+    await conn.executemany(
+        """INSERT INTO prompt_logs
+           (kind, model, prompt_refs, response_refs, created_at,
+            duration_ms, queue_ms, input_tokens, output_tokens, status, error)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        encoded,
     )
-    await conn.commit()
 
 
 async def list_prompt_logs(
     conn: aiosqlite.Connection,
     limit: int = 100,
-    offset: int = 0,
     kind: Optional[str] = None,
-) -> list[PromptLog]:
-    q = "SELECT id, kind, prompt_text, response_text, model, created_at FROM prompt_logs WHERE 1=1"
+    cursor: Optional[str] = None,
+) -> PromptLogPage:
+    """Logs do mais recente para o mais antigo, por keyset em (created_at, id); ver get_transactions."""
+    after = decode_cursor(cursor, (str, int))
+    q = """SELECT id, kind, prompt_refs, response_refs, model, created_at,
+                  duration_ms, queue_ms, input_tokens, output_tokens, status, error
+           FROM prompt_logs WHERE 1=1"""
     params: list = []
     if kind:
         q += " AND kind = ?"
         params.append(kind)
-    q += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-    params.extend([limit, offset])
+    if after is not None:
+        q += " AND (created_at, id) < (?, ?)"
+        params.extend(after)
+    q += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
     cur = await conn.execute(q, params)
     rows = await cur.fetchall()
-    return [
+    more = len(rows) > limit
+    rows = rows[:limit]
+    segments = await prompt_store.load_segments(conn, [ref for r in rows for ref in (r[2], r[3])])
+    items = [
         PromptLog(
             id=r[0],
             kind=r[1],
-            prompt_text=r[2],
-            response_text=r[3],
+            prompt_text=prompt_store.decode(r[2], segments),
+            response_text=prompt_store.decode(r[3], segments),
             model=r[4],
             created_at=r[5],
+            duration_ms=r[6],
+            queue_ms=r[7],
+            input_tokens=r[8],
+            output_tokens=r[9],
+            status=r[10],
+            error=r[11],
+        )
+        for r in rows
+    ]
+    next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if more else None
+    return PromptLogPage(items=items, next_cursor=next_cursor)
+
+
+async def prompt_log_stats(
+    conn: aiosqlite.Connection,
+    since: str,
+    until: Optional[str] = None,
+    kind: Optional[str] = None,
+) -> list[PromptLogStats]:
+    """Latência (p50/p95/p99 por nearest-rank) e tokens por (kind, model) no intervalo
+    [since, until) de created_at. Tudo agregado no SQLite, com funções de janela."""
+    where = "created_at >= ?"
+    params: list = [since]
+    if until:
+        where += " AND created_at < ?"
+        params.append(until)
+    if kind:
+        where += " AND kind = ?"
+        params.append(kind)
+    cur = await conn.execute(
+        f"""
+        WITH ranked AS (
+            SELECT kind, model, status, duration_ms, queue_ms, input_tokens, output_tokens,
+                   ROW_NUMBER() OVER (PARTITION BY kind, model ORDER BY duration_ms NULLS LAST) AS rn,
+                   COUNT(duration_ms) OVER (PARTITION BY kind, model) AS n
+            FROM prompt_logs
+            WHERE {where}
+        )
+        SELECT kind, model,
+               COUNT(*),
+               SUM(status != 'ok'),
+               SUM(status = 'timeout'),
+               MIN(CASE WHEN rn >= 0.50 * n THEN duration_ms END),
+               MIN(CASE WHEN rn >= 0.95 * n THEN duration_ms END),
+               MIN(CASE WHEN rn >= 0.99 * n THEN duration_ms END),
+               MAX(duration_ms),
+               AVG(queue_ms),
+               COALESCE(SUM(input_tokens), 0),
+               COALESCE(SUM(output_tokens), 0)
+        FROM ranked
+        GROUP BY kind, model
+        ORDER BY kind, model
+        """,
+        params,
+    )
+    rows = await cur.fetchall()
+    return [
+        PromptLogStats(
+            kind=r[0],
+            model=r[1],
+            calls=r[2],
+            errors=r[3] or 0,
+            timeouts=r[4] or 0,
+            p50_ms=r[5],
+            p95_ms=r[6],
+            p99_ms=r[7],
+            max_ms=r[8],
+            avg_queue_ms=round(r[9], 3) if r[9] is not None else None,
+            input_tokens=r[10],
+            output_tokens=r[11],
         )
         for r in rows
     ]
@@ -348,7 +546,6 @@ async def _touch_list(conn: aiosqlite.Connection, list_id: int) -> None:
         "UPDATE shopping_lists SET updated_at = datetime('now') WHERE id = ?",
         (list_id,),
     )
-    await conn.commit()
 
 
 async def create_shopping_list(conn: aiosqlite.Connection, name: str) -> ShoppingList:
@@ -357,7 +554,6 @@ async def create_shopping_list(conn: aiosqlite.Connection, name: str) -> Shoppin
     await conn.execute(
         "INSERT INTO shopping_lists (name, active) VALUES (?, 1)", (name,)
     )
-    await conn.commit()
     cur = await conn.execute("SELECT last_insert_rowid()")
     row = await cur.fetchone()
     lid = row[0]
@@ -398,10 +594,21 @@ async def get_active_shopping_list(conn: aiosqlite.Connection) -> Optional[Shopp
     )
 
 
+async def get_active_list_item_names(conn: aiosqlite.Connection) -> Optional[list[str]]:
+    """Nomes dos itens não marcados da lista ativa; None se não houver lista ativa."""
+    cur = await conn.execute("SELECT id FROM shopping_lists WHERE active = 1 LIMIT 1")
+    row = await cur.fetchone()
+    if not row:
+        return None
+    cur = await conn.execute(
+        "SELECT name FROM shopping_list_items WHERE list_id = ? AND checked = 0", (row[0],)
+    )
+    return [r[0] for r in await cur.fetchall()]
+
+
 async def set_active_shopping_list(conn: aiosqlite.Connection, list_id: int) -> None:
     await conn.execute("UPDATE shopping_lists SET active = 0")
     await conn.execute("UPDATE shopping_lists SET active = 1 WHERE id = ?", (list_id,))
-    await conn.commit()
 
 
 async def add_shopping_items(
@@ -415,7 +622,6 @@ async def add_shopping_items(
             "INSERT INTO shopping_list_items (list_id, name) VALUES (?, ?)",
             (list_id, n),
         )
-    await conn.commit()
     await _touch_list(conn, list_id)
 
 
@@ -441,7 +647,6 @@ async def check_shopping_items_by_names(
                     "UPDATE shopping_list_items SET checked = 1 WHERE id = ?",
                     (iid,),
                 )
-    await conn.commit()
     await _touch_list(conn, list_id)
     return len(updated)
 
@@ -508,7 +713,6 @@ async def toggle_shopping_item_checked(
     await conn.execute(
         "UPDATE shopping_list_items SET checked = ? WHERE id = ?", (new_val, item_id)
     )
-    await conn.commit()
     await _touch_list(conn, list_id)
     return bool(new_val)
 
@@ -523,7 +727,6 @@ async def update_shopping_list(
     if not await cur.fetchone():
         raise ValueError("Lista não encontrada")
     await conn.execute("UPDATE shopping_lists SET name = ?, updated_at = datetime('now') WHERE id = ?", (name, list_id))
-    await conn.commit()
 
 
 async def delete_shopping_list(conn: aiosqlite.Connection, list_id: int) -> None:
@@ -532,7 +735,6 @@ async def delete_shopping_list(conn: aiosqlite.Connection, list_id: int) -> None
         raise ValueError("Lista não encontrada")
     await conn.execute("DELETE FROM shopping_list_items WHERE list_id = ?", (list_id,))
     await conn.execute("DELETE FROM shopping_lists WHERE id = ?", (list_id,))
-    await conn.commit()
 
 
 async def update_shopping_item(
@@ -551,7 +753,6 @@ async def update_shopping_item(
         "UPDATE shopping_list_items SET name = ? WHERE id = ? AND list_id = ?",
         (name, item_id, list_id),
     )
-    await conn.commit()
     await _touch_list(conn, list_id)
 
 
@@ -565,12 +766,43 @@ async def delete_shopping_item(
     if not await cur.fetchone():
         raise ValueError("Item não encontrado")
     await conn.execute("DELETE FROM shopping_list_items WHERE id = ? AND list_id = ?", (item_id, list_id))
-    await conn.commit()
     await _touch_list(conn, list_id)
 
 
 # --- Product prices (banco de preços por mercado) ---
 
+def price_key(name: str) -> str:
+    """Forma de comparação de produto/mercado (colunas product_key e market_key): sem acento,
+    minúsculas e espaços colapsados. "Pão  Francês" e "pao francês" caem na mesma chave."""
+    s = unicodedata.normalize("NFKD", name or "")
+    s = "".join(c for c in s if not unicodedata.combining(c)).lower()
+    return re.sub(r"\s+", " ", s).strip()
+
+
+async def _refresh_price_latest(conn: aiosqlite.Connection, product_key: str, market_key: str) -> None:
+    """Refaz a linha (produto, mercado) de product_price_latest a partir do registro mais recente
+    em product_prices (some se não houver nenhum) e recalcula is_best dos mercados do produto.
+    Chamado por insert/update/delete_product_price na mesma transação da escrita."""
+    await conn.execute(
+        "DELETE FROM product_price_latest WHERE product_key = ? AND market_key = ?",
+        (product_key, market_key),
+    )
+    await conn.execute(
+        maintenance.INSERT_PRICE_LATEST
+        + maintenance.latest_prices_query("product_key = ?1 AND market_key = ?2"),
+        (product_key, market_key),
+    )
+    await conn.execute(maintenance.MARK_BEST_PRICES + " WHERE product_key = ?", (product_key,))
+
+
+async def _price_keys(conn: aiosqlite.Connection, row_id: int) -> Optional[tuple[str, str]]:
+    cur = await conn.execute(
+        "SELECT product_key, market_key FROM product_prices WHERE id = ?", (row_id,)
+    )
+    row = await cur.fetchone()
+    return (row[0], row[1]) if row else None
+
+
 async def insert_product_price(
     conn: aiosqlite.Connection,
     product_name: str,
@@ -582,10 +814,11 @@ async def insert_product_price(
     if not p or not m:
         raise ValueError("Produto e mercado são obrigatórios")
     await conn.execute(
-        "INSERT INTO product_prices (product_name, market_name, price) VALUES (?, ?, ?)",
-        (p, m, float(price)),
+        """INSERT INTO product_prices (product_name, market_name, price, product_key, market_key)
+           VALUES (?, ?, ?, ?, ?)""",
+        (p, m, float(price), price_key(p), price_key(m)),
     )
-    await conn.commit()
+    await _refresh_price_latest(conn, price_key(p), price_key(m))
 
 
 async def get_other_market_prices_for_product(
@@ -595,80 +828,87 @@ async def get_other_market_prices_for_product(
 ) -> list[tuple[str, float, str]]:
     """Retorna (market_name, price, recorded_at) para o mesmo produto em outros mercados.
     Um registro por mercado (o mais recente). Ordenado por recorded_at DESC."""
-    p = (product_name or "").strip()
-    ex = (exclude_market or "").strip().lower()
-    if not p:
+    pk = price_key(product_name)
+    if not pk:
         return []
+    # mais recente por mercado com o mesmo desempate (recorded_at DESC, id DESC) de
+    # product_price_latest. A janela sai pronta de idx_product_prices_latest (índice de cobertura,
+    # na ordem da partição): sem ordenar à parte nem ler a tabela; só a ordem final, sobre uma
+    # linha por mercado, usa uma B-tree temporária.
     cur = await conn.execute(
-        """SELECT market_name, price, recorded_at FROM product_prices
-           WHERE LOWER(TRIM(product_name)) = LOWER(TRIM(?))
-             AND LOWER(TRIM(market_name)) != ?
-           ORDER BY recorded_at DESC""",
-        (p, ex if ex else "__none__"),
+        """SELECT market_name, price, recorded_at FROM (
+               SELECT id, market_name, price, recorded_at, ROW_NUMBER() OVER (
+                   PARTITION BY market_key ORDER BY recorded_at DESC, id DESC
+               ) AS rn
+               FROM product_prices
+               WHERE product_key = ? AND market_key != ?
+           )
+           WHERE rn = 1
+           ORDER BY recorded_at DESC, id DESC""",
+        (pk, price_key(exclude_market)),
     )
     rows = await cur.fetchall()
-    seen: set[str] = set()
-    out: list[tuple[str, float, str]] = []
-    for r in rows:
-        m = (r[0] or "").strip()
-        mk = m.lower()
-        if mk and mk not in seen:
-            seen.add(mk)
-            out.append((m, float(r[1]), r[2] or ""))
-    return out
-
-
-def _norm(s: str) -> str:
-    return (s or "").strip().lower()
+    return [((r[0] or "").strip(), float(r[1]), r[2] or "") for r in rows]
 
 
 async def list_product_prices_grouped(
     conn: aiosqlite.Connection,
 ) -> list[dict]:
     """Lista preços agrupados por mercado. Um item por (produto, mercado) — o mais recente.
-    Cada item tem is_best_price=True se for o menor preço desse produto em todos os mercados."""
+    Cada item tem is_best_price=True se for o menor preço desse produto em todos os mercados.
+    Lê só product_price_latest (tamanho do catálogo atual, não do histórico).
+    Agrupa por market_key, como is_best: grafias do mesmo mercado ("Assaí"/"assai") ficam juntas,
+    com o nome do registro mais recente do mercado."""
     cur = await conn.execute(
-        """SELECT id, product_name, market_name, price, recorded_at
-           FROM product_prices ORDER BY market_name, recorded_at DESC"""
+        """SELECT price_id, product_name, market_key, price, recorded_at, is_best,
+                  FIRST_VALUE(market_name) OVER (
+                      PARTITION BY market_key ORDER BY recorded_at DESC, price_id DESC
+                  ) AS market_name
+           FROM product_price_latest"""
     )
     rows = await cur.fetchall()
-    # (norm_product, norm_market) -> (id, product_name, market_name, price, recorded_at)
-    latest: dict[tuple[str, str], tuple[int, str, str, float, str]] = {}
-    for r in rows:
-        np = _norm(r[1])
-        nm = _norm(r[2])
-        if not np or not nm:
-            continue
-        key = (np, nm)
-        if key not in latest:
-            latest[key] = (r[0], (r[1] or "").strip(), (r[2] or "").strip(), float(r[3]), r[4] or "")
-    items_list = list(latest.values())
-    # min price per product (norm_product)
-    by_product: dict[str, float] = {}
-    for _id, pname, mname, price, _at in items_list:
-        np = _norm(pname)
-        by_product[np] = min(by_product.get(np, price), price)
-    # build grouped: market -> [items]
-    by_market: dict[str, list[dict]] = {}
-    for _id, pname, mname, price, rec_at in items_list:
-        np = _norm(pname)
-        is_best = np in by_product and price <= by_product[np]
+    # build grouped: market_key -> (nome exibido, [items])
+    by_market: dict[str, tuple[str, list[dict]]] = {}
+    for _id, pname, mkey, price, rec_at, is_best, mname in rows:
         item = {
             "id": _id,
             "product_name": pname,
             "market_name": mname,
-            "price": price,
-            "recorded_at": rec_at,
-            "is_best_price": is_best,
+            "price": float(price),
+            "recorded_at": rec_at or "",
+            "is_best_price": bool(is_best),
         }
-        mk = mname
-        if mk not in by_market:
-            by_market[mk] = []
-        by_market[mk].append(item)
-    for lst in by_market.values():
+        if mkey not in by_market:
+            by_market[mkey] = (mname, [])
+        by_market[mkey][1].append(item)
+    for _, lst in by_market.values():
         lst.sort(key=lambda x: x["product_name"].lower())
-    markets_sorted = sorted(by_market.keys(), key=str.lower)
-    return [{"market_name": m, "items": by_market[m]} for m in markets_sorted]
+    markets_sorted = sorted(by_market.values(), key=lambda m: m[0].lower())
+    return [{"market_name": name, "items": items} for name, items in markets_sorted]
+
+
+async def iter_product_prices_export(
+    conn: aiosqlite.Connection,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[list[tuple]]:
+    """Histórico completo de preços com recorded_at entre os dias start e end (inclusivos), em ordem
+    (recorded_at, id), em lotes lidos com fetchmany (ver iter_transactions_export).
+    Linhas: (id, recorded_at, product_name, market_name, price)."""
+    q = """SELECT id, recorded_at, product_name, market_name, price
+           FROM product_prices WHERE 1=1"""
+    params: list = []
+    if start:
+        q += " AND recorded_at >= ?"
+        params.append(start)
+    if end:
+        q += " AND recorded_at < date(?, '+1 day')"
+        params.append(end)
+    q += " ORDER BY recorded_at, id"
+    async with conn.execute(q, params) as cur:
+        while rows := await cur.fetchmany(batch_size):
+            yield [tuple(r) for r in rows]
 
 
 async def get_product_price(
@@ -691,8 +931,8 @@ async def update_product_price(
     product_name: Optional[str] = None,
     price: Optional[float] = None,
 ) -> None:
-    cur = await conn.execute("SELECT id FROM product_prices WHERE id = ?", (row_id,))
-    if not await cur.fetchone():
+    old_keys = await _price_keys(conn, row_id)
+    if old_keys is None:
         raise ValueError("Preço não encontrado")
     updates = []
     params = []
@@ -700,8 +940,8 @@ async def update_product_price(
         p = (product_name or "").strip()
         if not p:
             raise ValueError("Nome do produto não pode ser vazio")
-        updates.append("product_name = ?")
-        params.append(p)
+        updates.append("product_name = ?, product_key = ?")
+        params.extend((p, price_key(p)))
     if price is not None:
         if price <= 0:
             raise ValueError("Preço deve ser positivo")
@@ -714,12 +954,15 @@ async def update_product_price(
         f"UPDATE product_prices SET {', '.join(updates)} WHERE id = ?",
         tuple(params),
     )
-    await conn.commit()
+    new_keys = await _price_keys(conn, row_id)
+    await _refresh_price_latest(conn, *old_keys)
+    if new_keys != old_keys:
+        await _refresh_price_latest(conn, *new_keys)
 
 
 async def delete_product_price(conn: aiosqlite.Connection, row_id: int) -> None:
-    cur = await conn.execute("SELECT id FROM product_prices WHERE id = ?", (row_id,))
-    if not await cur.fetchone():
+    keys = await _price_keys(conn, row_id)
+    if keys is None:
         raise ValueError("Preço não encontrado")
     await conn.execute("DELETE FROM product_prices WHERE id = ?", (row_id,))
-    await conn.commit()
+    await _refresh_price_latest(conn, *keys)
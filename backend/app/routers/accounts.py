@@ -3,7 +3,7 @@ from typing import Optional
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
-from app.database import get_db
+from app.database import get_db, write_session
 from app.repositories import (
     create_account,
     delete_account,
@@ -33,7 +33,7 @@ async def list_accounts_route():
 
 @router.post("", response_model=Account, status_code=201)
 async def create_account_route(body: AccountCreateBody):
-    async with get_db() as conn:
+    async with write_session() as conn:
         try:
             return await create_account(conn, body.name, body.balance)
         except ValueError as e:
@@ -42,7 +42,7 @@ async def create_account_route(body: AccountCreateBody):
 
 @router.patch("/{account_id:int}", response_model=Account)
 async def update_account_route(account_id: int, body: AccountUpdateBody):
-    async with get_db() as conn:
+    async with write_session() as conn:
         cur = await conn.execute("SELECT id FROM accounts WHERE id = ?", (account_id,))
         if not await cur.fetchone():
             raise HTTPException(404, "Conta não encontrada")
@@ -56,7 +56,7 @@ async def update_account_route(account_id: int, body: AccountUpdateBody):
 
 @router.delete("/{account_id:int}", status_code=204)
 async def delete_account_route(account_id: int):
-    async with get_db() as conn:
+    async with write_session() as conn:
         cur = await conn.execute("SELECT id FROM accounts WHERE id = ?", (account_id,))
         if not await cur.fetchone():
             raise HTTPException(404, "Conta não encontrada")
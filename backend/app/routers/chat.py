@@ -1,49 +1,59 @@
+import asyncio
+import json
 from datetime import date
 from typing import Optional, Tuple
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 
 from app.config import settings
-from app.database import get_db
+from app.fastpath import fastpath_stats
+from app.llm_client import llm_client_stats
+from app.memory import load_history, memory_stats, schedule_summary_refresh
+from app.prompt_log_writer import prompt_log_writer_stats
+from app.database import db_pool_stats, get_db, transaction, write_session
 from app.repositories import (
     add_shopping_items,
     append_chat_message,
     check_shopping_items_by_names,
     create_shopping_list,
     create_transaction,
+    get_active_list_item_names,
     get_active_shopping_list,
+    get_change_counter,
     get_monthly_spending,
     get_or_create_account,
     get_or_create_category,
     get_other_market_prices_for_product,
-    get_recent_chat,
     get_shopping_list,
     insert_product_price,
-    insert_prompt_log,
     list_accounts_with_stats,
 )
 from app.llm import (
+    Extraction,
     build_context,
     chat_reply,
-    extract_product_price,
-    extract_shopping_intent,
-    extract_transaction as llm_extract,
+    chat_reply_stream,
+    extract_all,
+    extraction_cache_stats,
 )
-from app.models import ChatRequest, ChatResponse, Transaction
+from app.models import (
+    ChatBatchItem,
+    ChatBatchRequest,
+    ChatBatchResponse,
+    ChatRequest,
+    ChatResponse,
+    Transaction,
+)
+from app.ratelimit import is_quota_error, rate_limit_stats
+from app.timing import stage
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
-QUOTA_KEYWORDS = ("429", "quota", "resource exhausted", "rate limit", "rate_limit", "resource_exhausted")
-
-
-def _is_quota_error(e: BaseException) -> bool:
-    s = str(e).lower()
-    return any(k in s for k in QUOTA_KEYWORDS)
-
 
 def _llm_error_reply(exc: BaseException) -> Tuple[str, str]:
     """Retorna (reply, error_type) para exibir ao usuário."""
-    if _is_quota_error(exc):
+    if is_quota_error(exc):
         return (
             "⚠️ A cota da API do Gemini foi excedida (limite de uso ou taxa). "
             "Tente novamente em alguns minutos. Se o problema persistir, verifique seu plano e limites em Google AI Studio.",
@@ -88,131 +98,127 @@ def _build_price_reply(
     return "\n".join(parts)
 
 
-@router.post("", response_model=ChatResponse)
-async def chat_route(body: ChatRequest):
-    async with get_db() as conn:
-        model_name = settings.gemini_model or "gemini"
-
-        # 1. Extract transaction from message (if any)
-        extracted = None
-        prompt_tx, response_tx = "", ""
-        try:
-            extracted, prompt_tx, response_tx = await llm_extract(body.message)
-        except Exception:
-            pass  # segue sem extração; erros de LLM surfam no chat
-        if prompt_tx and response_tx:
-            await insert_prompt_log(
-                conn, "extraction_tx", prompt_tx, response_tx, model_name
-            )
-        created_tx: Optional[Transaction] = None
-        if extracted:
-            cat_name = extracted.get("category") or "Outros"
-            acc_name = extracted.get("account")
-            tx_date = extracted.get("tx_date") or date.today().isoformat()
-            cat_id = await get_or_create_category(conn, cat_name)
-            acc_id = await get_or_create_account(conn, acc_name) if acc_name else None
-            created_tx = await create_transaction(
-                conn,
-                amount=float(extracted["amount"]),
-                description=str(extracted.get("description", " ") or " ").strip() or "Sem descrição",
-                category_id=cat_id,
-                account_id=acc_id,
-                tx_date=tx_date,
-            )
+async def _apply_extraction(
+    conn, ext: Extraction
+) -> Tuple[Optional[Transaction], Optional[str], Optional[str]]:
+    """Aplica os efeitos em ordem fixa: transação, lista de compras, preço.
+    Retorna (transação criada, bloco da lista, bloco do preço)."""
+    # 1. Transaction
+    created_tx: Optional[Transaction] = None
+    extracted = ext.transaction
+    if extracted:
+        cat_name = extracted.get("category") or "Outros"
+        acc_name = extracted.get("account")
+        tx_date = extracted.get("tx_date") or date.today().isoformat()
+        cat_id = await get_or_create_category(conn, cat_name)
+        acc_id = await get_or_create_account(conn, acc_name) if acc_name else None
+        created_tx = await create_transaction(
+            conn,
+            amount=float(extracted["amount"]),
+            description=str(extracted.get("description", " ") or " ").strip() or "Sem descrição",
+            category_id=cat_id,
+            account_id=acc_id,
+            tx_date=tx_date,
+        )
 
-        # 1b. Shopping list intents
-        intent = None
-        prompt_sh, response_sh = "", ""
-        try:
-            intent, prompt_sh, response_sh = await extract_shopping_intent(body.message)
-        except Exception:
-            pass
-        if prompt_sh and response_sh:
-            await insert_prompt_log(
-                conn, "extraction_shopping", prompt_sh, response_sh, model_name
-            )
-        shopping_reply: Optional[str] = None
-        if intent and intent.get("action"):
-            act = intent["action"]
+    # 1b. Shopping list intents
+    intent = ext.shopping
+    shopping_reply: Optional[str] = None
+    if intent and intent.get("action"):
+        act = intent["action"]
+        active = await get_active_shopping_list(conn)
+        if act == "create_list":
+            name = (intent.get("list_name") or "").strip() or "Nova lista"
+            _ = await create_shopping_list(conn, name)
             active = await get_active_shopping_list(conn)
-            if act == "create_list":
-                name = (intent.get("list_name") or "").strip() or "Nova lista"
-                _ = await create_shopping_list(conn, name)
-                active = await get_active_shopping_list(conn)
-                initial = [x.strip() for x in (intent.get("items") or []) if x and x.strip()]
-                if initial and active:
-                    await add_shopping_items(conn, active.id, initial)
+            initial = [x.strip() for x in (intent.get("items") or []) if x and x.strip()]
+            if initial and active:
+                await add_shopping_items(conn, active.id, initial)
+                lst = await get_shopping_list(conn, active.id)
+                if lst:
+                    shopping_reply = _format_list_state(
+                        lst.name, [(it.name, it.checked) for it in lst.items]
+                    )
+        elif act == "add_items":
+            items = [x.strip() for x in (intent.get("items") or []) if x and x.strip()]
+            if items:
+                if not active:
+                    await create_shopping_list(conn, "Nova lista")
+                    active = await get_active_shopping_list(conn)
+                if active:
+                    await add_shopping_items(conn, active.id, items)
                     lst = await get_shopping_list(conn, active.id)
                     if lst:
                         shopping_reply = _format_list_state(
                             lst.name, [(it.name, it.checked) for it in lst.items]
                         )
-            elif act == "add_items":
-                items = [x.strip() for x in (intent.get("items") or []) if x and x.strip()]
-                if items:
-                    if not active:
-                        await create_shopping_list(conn, "Nova lista")
-                        active = await get_active_shopping_list(conn)
-                    if active:
-                        await add_shopping_items(conn, active.id, items)
-                        lst = await get_shopping_list(conn, active.id)
-                        if lst:
-                            shopping_reply = _format_list_state(
-                                lst.name, [(it.name, it.checked) for it in lst.items]
-                            )
-            elif act == "check_items":
-                names = [x.strip() for x in (intent.get("items") or []) if x and x.strip()]
-                if names and active:
-                    await check_shopping_items_by_names(conn, active.id, names)
-
-        # 1c. Product price (banco de preços por mercado)
-        price_reply: Optional[str] = None
-        price_data = None
-        prompt_pp, response_pp = "", ""
+        elif act == "check_items":
+            names = [x.strip() for x in (intent.get("items") or []) if x and x.strip()]
+            if names and active:
+                await check_shopping_items_by_names(conn, active.id, names)
+
+    # 1c. Product price (banco de preços por mercado)
+    price_reply: Optional[str] = None
+    price_data = ext.product_price
+    if price_data:
         try:
-            price_data, prompt_pp, response_pp = await extract_product_price(body.message)
-        except Exception:
+            product = (price_data.get("product") or "").strip()
+            market = (price_data.get("market") or "").strip()
+            price = float(price_data.get("price") or 0)
+            if product and market and price > 0:
+                await insert_product_price(conn, product, market, price)
+                others = await get_other_market_prices_for_product(
+                    conn, product, market
+                )
+                price_reply = _build_price_reply(product, market, price, others)
+        except (ValueError, TypeError):
             pass
-        if prompt_pp and response_pp:
-            await insert_prompt_log(
-                conn, "extraction_product_price", prompt_pp, response_pp, model_name
-            )
-        if price_data:
-            try:
-                product = (price_data.get("product") or "").strip()
-                market = (price_data.get("market") or "").strip()
-                price = float(price_data.get("price") or 0)
-                if product and market and price > 0:
-                    await insert_product_price(conn, product, market, price)
-                    others = await get_other_market_prices_for_product(
-                        conn, product, market
-                    )
-                    price_reply = _build_price_reply(product, market, price, others)
-            except (ValueError, TypeError):
-                pass
 
-        # 2. Build context from DB
-        today = date.today()
+    return created_tx, shopping_reply, price_reply
+
+
+# Último contexto montado, válido enquanto o contador "context" e o mês não mudarem
+_context_snapshot: dict = {"key": None, "text": "", "hits": 0, "misses": 0}
+
+
+async def _load_context(conn) -> str:
+    """Bloco de contexto do chat (contas, gastos do mês, lista ativa).
+    Reaproveita o último snapshot se nenhuma conta, transação ou lista foi alterada desde então."""
+    today = date.today()
+    key = (await get_change_counter(conn, "context"), today.year, today.month)
+    if _context_snapshot["key"] == key:
+        _context_snapshot["hits"] += 1
+        return _context_snapshot["text"]
+    _context_snapshot["misses"] += 1
+    text = await _build_context_block(conn, today)
+    _context_snapshot["key"] = key
+    _context_snapshot["text"] = text
+    return text
+
+
+async def _build_context_block(conn, today: date) -> str:
+    with stage("context_queries"):
         accounts = await list_accounts_with_stats(conn)
         monthly_total, monthly_by_cat = await get_monthly_spending(
             conn, today.year, today.month
         )
-        acc_dicts = [
-            {"name": a.name, "balance": a.effective_balance, "spending": a.spending}
-            for a in accounts
-        ]
-        cat_dicts = [
-            {"category_name": c.category_name, "total": c.total}
-            for c in monthly_by_cat
-        ]
         active_list = await get_active_shopping_list(conn)
-        shopping_summary = ""
-        if active_list:
-            lines = [f"{active_list.name}:"]
-            for it in active_list.items:
-                lines.append(f"  - [{'x' if it.checked else ' '}] {it.name}")
-            shopping_summary = "\n".join(lines)
-        context = build_context(
+    acc_dicts = [
+        {"name": a.name, "balance": a.effective_balance, "spending": a.spending}
+        for a in accounts
+    ]
+    cat_dicts = [
+        {"category_name": c.category_name, "total": c.total}
+        for c in monthly_by_cat
+    ]
+    shopping_summary = ""
+    if active_list:
+        lines = [f"{active_list.name}:"]
+        for it in active_list.items:
+            lines.append(f"  - [{'x' if it.checked else ' '}] {it.name}")
+        shopping_summary = "\n".join(lines)
+    with stage("build_context"):
+        return build_context(
             acc_dicts,
             [],
             monthly_total,
@@ -222,34 +228,199 @@ async def chat_route(body: ChatRequest):
             shopping_summary=shopping_summary,
         )
 
-        # 3. Recent chat
-        recent = await get_recent_chat(conn, limit=20)
 
-        # 4. Get reply from LLM
-        reply: str
-        error_type: Optional[str] = None
-        try:
-            reply, prompt_chat, response_chat = await chat_reply(
-                body.message, context, recent
-            )
-            if prompt_chat and response_chat:
-                await insert_prompt_log(
-                    conn, "chat", prompt_chat, response_chat, model_name
-                )
-        except Exception as e:
-            reply, error_type = _llm_error_reply(e)
+def _with_prefix(prefix: str, reply: str) -> str:
+    """Junta os blocos de lista/preço (prefix) antes da resposta do modelo."""
+    if not prefix:
+        return reply
+    return f"{prefix}\n\n{reply}" if reply.strip() else prefix
 
-        extra = [s for s in (shopping_reply, price_reply) if s]
-        if extra:
-            block = "\n\n".join(extra)
-            reply = f"{block}\n\n{reply}" if reply.strip() else block
 
-        # 5. Persist chat
-        await append_chat_message(conn, "user", body.message)
-        await append_chat_message(conn, "assistant", reply)
+@router.post("", response_model=ChatResponse)
+async def chat_route(body: ChatRequest):
+    # Extrações (transação, lista, preço) em paralelo, sem conexão presa durante o LLM;
+    # os itens da lista ativa só servem ao parser local
+    async with get_db() as conn:
+        list_items = await get_active_list_item_names(conn)
+    with stage("extraction"):
+        ext = await extract_all(body.message, list_items=list_items)
+    # efeitos da mensagem numa sessão de escrita; a chamada ao chat fica fora dela
+    with stage("apply_extraction"):
+        async with write_session() as conn:
+            created_tx, shopping_reply, price_reply = await _apply_extraction(conn, ext)
+
+    async with get_db() as conn:
+        # 2. Build context from DB
+        with stage("context"):
+            context = await _load_context(conn)
+
+        # 3. Conversation memory (resumo + janela recente)
+        with stage("history"):
+            summary, recent = await load_history(conn)
+
+    # 4. Get reply from LLM
+    reply: str
+    error_type: Optional[str] = None
+    try:
+        with stage("chat_llm"):
+            reply, _, _ = await chat_reply(body.message, context, recent, summary)
+    except Exception as e:
+        reply, error_type = _llm_error_reply(e)
+
+    prefix = "\n\n".join(s for s in (shopping_reply, price_reply) if s)
+    reply = _with_prefix(prefix, reply)
+
+    # 5. Persist chat
+    with stage("persist"):
+        async with write_session() as conn:
+            await append_chat_message(conn, "user", body.message)
+            await append_chat_message(conn, "assistant", reply)
+    schedule_summary_refresh()
 
     return ChatResponse(
         reply=reply,
         extracted_transaction=created_tx,
         error_type=error_type,
     )
+
+
+# gravações do fim do stream em andamento (referência até terminarem, mesmo com a request cancelada)
+_persisting: set[asyncio.Future] = set()
+
+
+async def _persist_turn(message: str, reply: str) -> None:
+    """Grava a mensagem do usuário e a resposta (se houver alguma) e agenda o resumo."""
+    async with write_session() as conn:
+        await append_chat_message(conn, "user", message)
+        if reply:
+            await append_chat_message(conn, "assistant", reply)
+    schedule_summary_refresh()
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/stream")
+async def chat_stream_route(body: ChatRequest):
+    """Mesmo fluxo de POST /chat, com a resposta em Server-Sent Events:
+    `prefix` (blocos de lista/preço), `token` (trechos da resposta), `error` e por fim `done`
+    com o ChatResponse completo. A conversa é persistida quando o stream termina, inclusive se o
+    cliente desconectar no meio (com a parte da resposta já gerada)."""
+
+    async def events():
+        async with get_db() as conn:
+            list_items = await get_active_list_item_names(conn)
+        ext = await extract_all(body.message, list_items=list_items)
+        async with write_session() as conn:
+            created_tx, shopping_reply, price_reply = await _apply_extraction(conn, ext)
+        prefix = "\n\n".join(s for s in (shopping_reply, price_reply) if s)
+
+        reply: Optional[str] = None
+        error_type: Optional[str] = None
+        parts: list[str] = []
+        try:
+            if prefix:
+                yield _sse("prefix", {"text": prefix})
+
+            async with get_db() as conn:
+                context = await _load_context(conn)
+                summary, recent = await load_history(conn)
+
+            try:
+                _, chunks = chat_reply_stream(body.message, context, recent, summary)
+                async for chunk in chunks:
+                    parts.append(chunk)
+                    yield _sse("token", {"text": chunk})
+                reply = "".join(parts).strip()
+            except Exception as e:
+                reply, error_type = _llm_error_reply(e)
+                yield _sse("error", {"text": reply, "error_type": error_type})
+        finally:
+            # cliente desconectou no meio do stream: grava o que já foi gerado. A gravação roda
+            # numa task à parte (shield), para não ser cancelada junto com a resposta.
+            if reply is None:
+                reply = "".join(parts).strip()
+            reply = _with_prefix(prefix, reply)
+            persist = asyncio.ensure_future(_persist_turn(body.message, reply))
+            _persisting.add(persist)
+            persist.add_done_callback(_persisting.discard)
+            await asyncio.shield(persist)
+
+        done = ChatResponse(
+            reply=reply,
+            extracted_transaction=created_tx,
+            error_type=error_type,
+        )
+        yield _sse("done", done.model_dump())
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/batch", response_model=ChatBatchResponse)
+async def chat_batch_route(body: ChatBatchRequest):
+    """Várias mensagens de uma vez (ex. importar os gastos da semana). As extrações rodam em paralelo
+    (até chat_batch_concurrency), no modo de extração do chat (ou chat_batch_extraction_mode, se
+    definido), e os efeitos são gravados numa única transação, na ordem das mensagens. Não chama o
+    chat nem entra no histórico da conversa."""
+    if len(body.messages) > settings.chat_batch_max_messages:
+        raise HTTPException(400, f"Máximo de {settings.chat_batch_max_messages} mensagens por lote")
+    slots = asyncio.Semaphore(max(1, settings.chat_batch_concurrency))
+    # lista ativa de antes do lote: o parser local não vê listas criadas pelas próprias mensagens
+    async with get_db() as conn:
+        list_items = await get_active_list_item_names(conn)
+
+    async def extract(message: str) -> Extraction:
+        if not message:
+            return Extraction(None, None, None)
+        async with slots:
+            return await extract_all(
+                message, mode=settings.chat_batch_extraction_mode or None, list_items=list_items
+            )
+
+    # mensagens repetidas no lote (ex. "uber 25" várias vezes) são extraídas uma vez só
+    unique = list(dict.fromkeys(m.strip() for m in body.messages))
+    by_message = dict(zip(unique, await asyncio.gather(*(extract(m) for m in unique))))
+    extractions = [by_message[m.strip()] for m in body.messages]
+
+    results: list[ChatBatchItem] = []
+    async with write_session() as conn:
+        for message, ext in zip(body.messages, extractions):
+            # savepoint por mensagem: um item inválido não desfaz os outros
+            try:
+                async with transaction(conn):
+                    created_tx, shopping_reply, price_reply = await _apply_extraction(conn, ext)
+            except (KeyError, ValueError, TypeError):
+                results.append(ChatBatchItem(message=message, error_type="invalid"))
+                continue
+            results.append(
+                ChatBatchItem(
+                    message=message,
+                    reply="\n\n".join(s for s in (shopping_reply, price_reply) if s),
+                    extracted_transaction=created_tx,
+                    error_type="extraction" if ext.failed else None,
+                )
+            )
+    return ChatBatchResponse(results=results)
+
+
+@router.get("/stats")
+async def chat_stats_route():
+    """Métricas do pipeline do chat (parser local, caches, fila de chamadas ao LLM)."""
+    return {
+        "fastpath": fastpath_stats(),
+        "extraction_cache": extraction_cache_stats(),
+        "llm": llm_client_stats(),
+        "rate_limit": rate_limit_stats(),
+        "memory": memory_stats(),
+        "prompt_log_writer": prompt_log_writer_stats(),
+        "db_pool": db_pool_stats(),
+        "context_snapshot": {
+            "hits": _context_snapshot["hits"],
+            "misses": _context_snapshot["misses"],
+        },
+    }
@@ -0,0 +1,87 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import date
+from typing import AsyncIterator, Callable, Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+from app.database import read_connection
+from app.repositories import iter_product_prices_export, iter_transactions_export
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+TRANSACTION_COLUMNS = ("id", "tx_date", "amount", "description", "category", "account", "created_at")
+PRODUCT_PRICE_COLUMNS = ("id", "recorded_at", "product_name", "market_name", "price")
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+# exportações em andamento (settings.export_max_concurrent); as demais esperam a vez já com a
+# resposta aberta
+_slots = asyncio.Semaphore(max(1, settings.export_max_concurrent))
+
+
+def _csv_chunk(rows: list[tuple]) -> str:
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    return buf.getvalue()
+
+
+def _ndjson_chunk(columns: tuple[str, ...], rows: list[tuple]) -> str:
+    return "".join(json.dumps(dict(zip(columns, r)), ensure_ascii=False) + "\n" for r in rows)
+
+
+def _export(
+    name: str,
+    columns: tuple[str, ...],
+    batches: Callable[..., AsyncIterator[list[tuple]]],
+    fmt: str,
+    start: Optional[date],
+    end: Optional[date],
+) -> StreamingResponse:
+    """Resposta em stream: um trecho de CSV/NDJSON por lote lido do banco. Cada stream tem sua
+    conexão de leitura, fora do pool (que fica para o resto da API), até o fim ou até o cliente
+    desconectar; no máximo export_max_concurrent streams leem ao mesmo tempo."""
+    if start and end and start > end:
+        raise HTTPException(400, "start deve ser anterior a end")
+
+    async def body() -> AsyncIterator[str]:
+        if fmt == "csv":
+            yield _csv_chunk([columns])
+        async with _slots, read_connection() as conn:
+            async for rows in batches(
+                conn,
+                start.isoformat() if start else None,
+                end.isoformat() if end else None,
+                batch_size=settings.export_batch_size,
+            ):
+                yield _csv_chunk(rows) if fmt == "csv" else _ndjson_chunk(columns, rows)
+
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
+
+
+@router.get("/transactions")
+async def export_transactions_route(
+    format: Literal["csv", "ndjson"] = Query("csv"),
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+):
+    """Todas as transações com tx_date entre start e end (inclusivos), em ordem de data."""
+    return _export("transactions", TRANSACTION_COLUMNS, iter_transactions_export, format, start, end)
+
+
+@router.get("/product-prices")
+async def export_product_prices_route(
+    format: Literal["csv", "ndjson"] = Query("csv"),
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+):
+    """Histórico completo de preços (todas as leituras, não só a mais recente) no período."""
+    return _export("product-prices", PRODUCT_PRICE_COLUMNS, iter_product_prices_export, format, start, end)
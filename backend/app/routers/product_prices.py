@@ -3,7 +3,7 @@ from typing import Optional
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
-from app.database import get_db
+from app.database import get_db, write_session
 from app.repositories import (
     delete_product_price,
     insert_product_price,
@@ -34,7 +34,7 @@ async def list_route():
 
 @router.post("", status_code=201)
 async def create_route(body: CreateProductPriceBody):
-    async with get_db() as conn:
+    async with write_session() as conn:
         try:
             await insert_product_price(
                 conn,
@@ -49,7 +49,7 @@ async def create_route(body: CreateProductPriceBody):
 
 @router.patch("/{row_id:int}")
 async def update_route(row_id: int, body: UpdateProductPriceBody):
-    async with get_db() as conn:
+    async with write_session() as conn:
         try:
             await update_product_price(
                 conn,
@@ -64,7 +64,7 @@ async def update_route(row_id: int, body: UpdateProductPriceBody):
 
 @router.delete("/{row_id:int}", status_code=204)
 async def delete_route(row_id: int):
-    async with get_db() as conn:
+    async with write_session() as conn:
         try:
             await delete_product_price(conn, row_id)
         except ValueError as e:
@@ -1,19 +1,35 @@
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query
 
 from app.database import get_db
-from app.repositories import list_prompt_logs
-from app.models import PromptLog
+from app.repositories import list_prompt_logs, prompt_log_stats
+from app.models import PromptLogPage, PromptLogStats
 
 router = APIRouter(prefix="/prompt-logs", tags=["prompt-logs"])
 
 
-@router.get("", response_model=list[PromptLog])
+@router.get("", response_model=PromptLogPage)
 async def list_route(
     limit: int = Query(100, ge=1, le=500),
-    offset: int = Query(0, ge=0),
     kind: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
 ):
     async with get_db() as conn:
-        return await list_prompt_logs(conn, limit=limit, offset=offset, kind=kind)
+        try:
+            return await list_prompt_logs(conn, limit=limit, kind=kind, cursor=cursor)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+
+@router.get("/stats", response_model=list[PromptLogStats])
+async def stats_route(
+    hours: float = Query(24, gt=0, le=24 * 365),
+    kind: Optional[str] = Query(None),
+):
+    """Latência (p50/p95/p99), espera na fila e tokens por kind e modelo nas últimas `hours` horas."""
+    # created_at é gravado em UTC no formato do datetime('now') do SQLite
+    since = (datetime.now(timezone.utc) - timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
+    async with get_db() as conn:
+        return await prompt_log_stats(conn, since, kind=kind)
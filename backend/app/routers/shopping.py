@@ -3,7 +3,7 @@ from typing import Optional
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
-from app.database import get_db
+from app.database import get_db, write_session
 from app.repositories import (
     add_shopping_items,
     check_shopping_items_by_names,
@@ -50,7 +50,7 @@ async def list_route():
 
 @router.post("", response_model=ShoppingList, status_code=201)
 async def create_route(body: CreateListBody):
-    async with get_db() as conn:
+    async with write_session() as conn:
         return await create_shopping_list(conn, body.name or "Nova lista")
 
 
@@ -65,7 +65,7 @@ async def get_route(list_id: int):
 
 @router.post("/{list_id:int}/items")
 async def add_items_route(list_id: int, body: AddItemsBody):
-    async with get_db() as conn:
+    async with write_session() as conn:
         lst = await get_shopping_list(conn, list_id)
         if not lst:
             raise HTTPException(404, "Lista não encontrada")
@@ -79,7 +79,7 @@ async def add_items_route(list_id: int, body: AddItemsBody):
 
 @router.patch("/{list_id:int}/items/check")
 async def check_items_route(list_id: int, body: CheckItemsBody):
-    async with get_db() as conn:
+    async with write_session() as conn:
         lst = await get_shopping_list(conn, list_id)
         if not lst:
             raise HTTPException(404, "Lista não encontrada")
@@ -90,7 +90,7 @@ async def check_items_route(list_id: int, body: CheckItemsBody):
 
 @router.patch("/{list_id:int}/items/{item_id:int}/toggle")
 async def toggle_item_route(list_id: int, item_id: int):
-    async with get_db() as conn:
+    async with write_session() as conn:
         try:
             checked = await toggle_shopping_item_checked(conn, list_id, item_id)
             return {"ok": True, "checked": checked}
@@ -100,7 +100,7 @@ async def toggle_item_route(list_id: int, item_id: int):
 
 @router.post("/{list_id:int}/activate")
 async def activate_route(list_id: int):
-    async with get_db() as conn:
+    async with write_session() as conn:
         lst = await get_shopping_list(conn, list_id)
         if not lst:
             raise HTTPException(404, "Lista não encontrada")
@@ -110,7 +110,7 @@ async def activate_route(list_id: int):
 
 @router.patch("/{list_id:int}")
 async def update_list_route(list_id: int, body: UpdateListBody):
-    async with get_db() as conn:
+    async with write_session() as conn:
         try:
             await update_shopping_list(conn, list_id, body.name or "")
         except ValueError as e:
@@ -120,7 +120,7 @@ async def update_list_route(list_id: int, body: UpdateListBody):
 
 @router.delete("/{list_id:int}", status_code=204)
 async def delete_list_route(list_id: int):
-    async with get_db() as conn:
+    async with write_session() as conn:
         try:
             await delete_shopping_list(conn, list_id)
         except ValueError as e:
@@ -129,7 +129,7 @@ async def delete_list_route(list_id: int):
 
 @router.patch("/{list_id:int}/items/{item_id:int}")
 async def update_item_route(list_id: int, item_id: int, body: UpdateItemBody):
-    async with get_db() as conn:
+    async with write_session() as conn:
         try:
             await update_shopping_item(conn, list_id, item_id, body.name or "")
         except ValueError as e:
@@ -139,7 +139,7 @@ async def update_item_route(list_id: int, item_id: int, body: UpdateItemBody):
 
 @router.delete("/{list_id:int}/items/{item_id:int}", status_code=204)
 async def delete_item_route(list_id: int, item_id: int):
-    async with get_db() as conn:
+    async with write_session() as conn:
         try:
             await delete_shopping_item(conn, list_id, item_id)
         except ValueError as e:
@@ -1,19 +1,39 @@
 from typing import Optional
 
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query
 
 from app.database import get_db
 from app.repositories import get_transactions
-from app.models import Transaction
+from app.models import TransactionPage
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
 
-@router.get("", response_model=list[Transaction])
+@router.get("", response_model=TransactionPage)
 async def list_transactions_route(
     limit: int = Query(100, ge=1, le=500),
     year: Optional[int] = Query(None),
     month: Optional[int] = Query(None),
+    account_id: Optional[int] = Query(None),
+    category_id: Optional[int] = Query(None),
+    min_amount: Optional[float] = Query(None),
+    max_amount: Optional[float] = Query(None),
+    cursor: Optional[str] = Query(None),
 ):
+    """Uma página de transações (mais recentes primeiro). Para a seguinte, repita os filtros e passe
+    o next_cursor recebido em cursor."""
     async with get_db() as conn:
-        return await get_transactions(conn, limit=limit, year=year, month=month)
+        try:
+            return await get_transactions(
+                conn,
+                limit=limit,
+                year=year,
+                month=month,
+                account_id=account_id,
+                category_id=category_id,
+                min_amount=min_amount,
+                max_amount=max_amount,
+                cursor=cursor,
+            )
+        except ValueError as e:
+            raise HTTPException(400, str(e))
@@ -0,0 +1,35 @@
+"""Tempo por etapa do pipeline do chat, para o benchmark (bench/chat_pipeline.py).
+
+Sem um record_stages() ativo, stage() não faz nada além de entrar/sair do bloco.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Iterator, Optional
+
+_timings: ContextVar[Optional[dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Soma a duração do bloco (ms) em `name`, se houver um record_stages() ativo nesta task."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    t0 = perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + (perf_counter() - t0) * 1000
+
+
+@contextmanager
+def record_stages() -> Iterator[dict[str, float]]:
+    """Coleta os tempos de stage() executados dentro do bloco: {etapa: ms}."""
+    timings: dict[str, float] = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
@@ -0,0 +1,271 @@
+"""Benchmark ponta a ponta do POST /api/chat (chat_route), com tempo por etapa.
+
+Roda chat_route direto (sem HTTP) contra bancos SQLite semeados com N transações, usando o
+provider "fake" (app/llm_providers.py) no lugar do Gemini, em vários níveis de concorrência.
+Para cada (tamanho, concorrência) mede p50/p95/p99 de cada etapa marcada com app.timing.stage
+e do total, além da vazão, e grava tudo em JSON para comparar entre versões.
+
+Uso (a partir de backend/):
+    python -m bench.chat_pipeline
+    python -m bench.chat_pipeline --sizes 1000,100000 --concurrency 1,8 --requests 200 \\
+        --llm-latency-ms 50 --output bench-results.json
+
+Os bancos ficam em --db-dir e são reaproveitados entre execuções quando já têm o tamanho pedido.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+MESSAGES = [
+    "Gastei 42,50 no mercado",
+    "quanto gastei este mês?",
+    "adiciona leite e pão",
+    "qual o saldo das contas?",
+    "peguei o leite",
+    "paguei 120 de luz",
+    "leite piracanjuba no guanabara 5,90",
+    "em que categoria eu mais gastei?",
+]
+
+ACCOUNTS = ["Nubank", "Itaú", "Carteira", "Inter", "Caixa"]
+DESCRIPTIONS = ["Mercado", "Uber", "Aluguel", "Farmácia", "Padaria", "Restaurante", "Luz", "Internet"]
+
+
+def _percentile(sorted_values: list[float], p: float) -> float:
+    """Percentil por nearest-rank (valores já ordenados)."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def _summarize(values: list[float]) -> dict[str, float]:
+    v = sorted(values)
+    return {
+        "p50": round(_percentile(v, 50), 3),
+        "p95": round(_percentile(v, 95), 3),
+        "p99": round(_percentile(v, 99), 3),
+        "mean": round(sum(v) / len(v), 3) if v else 0.0,
+        "max": round(v[-1], 3) if v else 0.0,
+    }
+
+
+def _seed(path: Path, n_transactions: int, seed: int) -> None:
+    """Preenche contas, transações (espalhadas pelos últimos ~3 anos), preços e histórico de chat."""
+    from app.repositories import price_key
+
+    rng = random.Random(seed)
+    db = sqlite3.connect(path)
+    try:
+        db.executemany(
+            "INSERT OR IGNORE INTO accounts (name, balance) VALUES (?, ?)",
+            [(name, rng.uniform(0, 5000)) for name in ACCOUNTS],
+        )
+        account_ids = [r[0] for r in db.execute("SELECT id FROM accounts")]
+        category_ids = [r[0] for r in db.execute("SELECT id FROM categories")]
+        today = date.today()
+        batch: list[tuple] = []
+        for i in range(n_transactions):
+            tx_date = (today - timedelta(days=rng.randrange(0, 3 * 365))).isoformat()
+            batch.append((
+                round(rng.uniform(2, 400), 2),
+                rng.choice(DESCRIPTIONS),
+                rng.choice(category_ids),
+                rng.choice(account_ids) if rng.random() < 0.8 else None,
+                tx_date,
+            ))
+            if len(batch) >= 50_000 or i == n_transactions - 1:
+                db.executemany(
+                    "INSERT INTO transactions (amount, description, category_id, account_id, tx_date) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    batch,
+                )
+                batch.clear()
+        prices = [
+            (rng.choice(["leite", "pão", "café", "arroz"]), rng.choice(["guanabara", "prezunic", "zona sul"]),
+             round(rng.uniform(3, 30), 2))
+            for _ in range(min(10_000, max(100, n_transactions // 100)))
+        ]
+        db.executemany(
+            "INSERT INTO product_prices (product_name, market_name, price, product_key, market_key) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(p, m, price, price_key(p), price_key(m)) for p, m, price in prices],
+        )
+        db.executemany(
+            "INSERT INTO chat_messages (role, content) VALUES (?, ?)",
+            [("user" if i % 2 == 0 else "assistant", rng.choice(MESSAGES)) for i in range(200)],
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _prepare_db(db_dir: Path, n_transactions: int, seed: int) -> Path:
+    from app import database, maintenance
+
+    path = db_dir / f"bench_{n_transactions}.db"
+    if path.exists():
+        with sqlite3.connect(path) as db:
+            if db.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == n_transactions:
+                database.DB_PATH = str(path)
+                await database.init_db()
+                return path
+        path.unlink()
+    database.DB_PATH = str(path)
+    await database.init_db()
+    t0 = time.perf_counter()
+    _seed(path, n_transactions, seed)
+    # o seed grava direto no SQLite: as tabelas derivadas são recalculadas no fim
+    async with database.get_db() as conn, database.transaction(conn):
+        await maintenance.rebuild_all(conn)
+    print(f"  seeded {n_transactions} transactions in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    return path
+
+
+async def _run_level(concurrency: int, n_requests: int, warmup: int) -> dict[str, Any]:
+    from app.models import ChatRequest
+    from app.routers.chat import chat_route
+    from app.timing import record_stages
+
+    samples: list[dict[str, float]] = []
+    errors = 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(i: int, keep: bool) -> None:
+        nonlocal errors
+        async with slots:
+            with record_stages() as timings:
+                t0 = time.perf_counter()
+                try:
+                    await chat_route(ChatRequest(message=MESSAGES[i % len(MESSAGES)]))
+                except Exception:
+                    errors += 1
+                    return
+                timings["total"] = (time.perf_counter() - t0) * 1000
+        if keep:
+            samples.append(timings)
+
+    await asyncio.gather(*(one(i, False) for i in range(warmup)))
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i, True) for i in range(n_requests)))
+    wall = time.perf_counter() - t0
+
+    stage_names = sorted({name for s in samples for name in s if name != "total"})
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(samples) / wall, 2) if wall > 0 else 0.0,
+        "total_ms": _summarize([s["total"] for s in samples]),
+        # etapa ausente numa requisição (ex. contexto em cache) conta como 0 ms
+        "stages_ms": {name: _summarize([s.get(name, 0.0) for s in samples]) for name in stage_names},
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+async def main(args: argparse.Namespace) -> dict[str, Any]:
+    from app import database, memory, prompt_log_writer
+    from app.config import settings
+    from app.llm_providers import FakeProvider, set_provider
+    from app.routers import chat
+
+    set_provider(FakeProvider(latency_ms=args.llm_latency_ms, seed=args.seed))
+    db_dir = Path(args.db_dir)
+    db_dir.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    for size in args.sizes:
+        print(f"size={size}", file=sys.stderr)
+        await _prepare_db(db_dir, size, args.seed)
+        chat._context_snapshot.update(key=None, text="")
+        await database.open_pool()
+        await prompt_log_writer.start()
+        try:
+            for concurrency in args.concurrency:
+                level = await _run_level(concurrency, args.requests, args.warmup)
+                print(
+                    f"  c={concurrency} {level['throughput_rps']} req/s "
+                    f"p50={level['total_ms']['p50']}ms p99={level['total_ms']['p99']}ms",
+                    file=sys.stderr,
+                )
+                results.append({"transactions": size, **level})
+        finally:
+            # resumo de conversa agendado em background termina antes de trocar de banco
+            await memory.stop_summary_refresh(cancel=False)
+            await prompt_log_writer.stop()
+            await database.close_pool()
+
+    return {
+        "benchmark": "chat_pipeline",
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "params": {
+            "sizes": args.sizes,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "llm_latency_ms": args.llm_latency_ms,
+            "seed": args.seed,
+            "llm_max_concurrency": settings.llm_max_concurrency,
+            "db_pool_size": settings.db_pool_size,
+            "extraction_mode": settings.extraction_mode,
+            "fastpath_enabled": settings.fastpath_enabled,
+        },
+        "results": results,
+    }
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(x) for x in value.split(",") if x.strip()]
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--sizes", type=_int_list, default=[1_000, 100_000, 1_000_000],
+                   help="quantidades de transações no banco (default: 1000,100000,1000000)")
+    p.add_argument("--concurrency", type=_int_list, default=[1, 4, 16],
+                   help="requisições simultâneas (default: 1,4,16)")
+    p.add_argument("--requests", type=int, default=200, help="requisições medidas por nível")
+    p.add_argument("--warmup", type=int, default=8, help="requisições descartadas antes de medir")
+    p.add_argument("--llm-latency-ms", type=float, default=20.0, help="latência média do LLM fake")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--db-dir", default="data/bench", help="onde ficam os bancos semeados")
+    p.add_argument("--output", default="bench-results.json", help="arquivo JSON de saída ('-' = stdout)")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # Antes de importar app: provider fake, sem rate limit local e sem cache de extração,
+    # para medir o pipeline e não a cota nem o cache.
+    os.environ.setdefault("LLM_PROVIDER", "fake")
+    os.environ.setdefault("LLM_RATE_PER_MINUTE", "1000000")
+    os.environ.setdefault("LLM_RATE_BURST", "1000000")
+    os.environ.setdefault("EXTRACTION_CACHE_SIZE", "0")
+    report = asyncio.run(main(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+        print(f"wrote {args.output}", file=sys.stderr)
@@ -0,0 +1,28 @@
+import os
+import tempfile
+
+import pytest
+
+# Antes de qualquer import de app: os testes nunca tocam no banco de verdade (data/diane.db).
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="diane-tests-"), "diane.db")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def conn(tmp_path, monkeypatch):
+    """Banco novo, migrado até a última versão, só deste teste; conexão de escrita em autocommit."""
+    from app import database
+    from app.migrations import migrate
+
+    path = str(tmp_path / "diane.db")
+    await migrate(path)
+    monkeypatch.setattr(database, "DB_PATH", path)
+    db = await database._connect()
+    try:
+        yield db
+    finally:
+        await db.close()
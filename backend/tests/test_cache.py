@@ -0,0 +1,40 @@
+from app.cache import TTLCache
+
+
+def test_none_e_valor_valido_e_ausencia_e_miss():
+    cache = TTLCache(maxsize=4, ttl=60)
+    assert cache.get("a") is TTLCache.MISS
+    cache.set("a", None)
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_descarta_o_menos_usado():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" passa a ser o mais recente
+    cache.set("c", 3)
+    assert cache.get("b") is TTLCache.MISS
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_expira_pela_idade(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.cache.time.monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=4, ttl=10)
+    cache.set("a", 1)
+    now[0] += 10
+    assert cache.get("a") == 1
+    now[0] += 0.5
+    assert cache.get("a") is TTLCache.MISS
+    assert cache.stats()["size"] == 0
+
+
+def test_maxsize_zero_desliga():
+    cache = TTLCache(maxsize=0, ttl=60)
+    cache.set("a", 1)
+    assert cache.get("a") is TTLCache.MISS
+    assert cache.stats()["size"] == 0
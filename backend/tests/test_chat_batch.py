@@ -0,0 +1,66 @@
+import httpx
+import pytest
+
+from app import database
+from app.llm import Extraction
+from app.main import app
+from app.routers import chat
+
+EXTRACTIONS = {
+    "uber 25": Extraction({"amount": 25, "description": "Uber", "category": "Transporte"}, None, None),
+    # categoria criada e depois valor inválido: o savepoint da mensagem desfaz a categoria também
+    "valor ruim": Extraction({"amount": "vinte", "description": "?", "category": "Fantasma"}, None, None),
+    "arroz 8 no atacadão": Extraction(
+        None, None, {"product": "Arroz", "market": "Atacadão", "price": 8}
+    ),
+    "nada": Extraction(None, None, None, failed=True),
+}
+
+
+@pytest.fixture
+async def client(conn, monkeypatch):
+    calls = []
+
+    async def fake_extract_all(message, mode=None, list_items=None):
+        calls.append(message)
+        return EXTRACTIONS[message]
+
+    monkeypatch.setattr(chat, "extract_all", fake_extract_all)
+    await database.open_pool()
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as c:
+            c.extract_calls = calls
+            yield c
+    finally:
+        await database.close_pool()
+
+
+@pytest.mark.anyio
+async def test_mensagem_invalida_nao_desfaz_as_outras(client, conn):
+    messages = ["uber 25", "valor ruim", "arroz 8 no atacadão", "nada", "uber 25"]
+    resp = await client.post("/api/chat/batch", json={"messages": messages})
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+
+    assert [r["message"] for r in results] == messages
+    assert [r["error_type"] for r in results] == [None, "invalid", None, "extraction", None]
+    assert results[0]["extracted_transaction"]["amount"] == 25
+    assert "Arroz" in results[2]["reply"]
+    assert sorted(client.extract_calls) == sorted(set(messages))  # repetidas extraídas uma vez
+
+    cur = await conn.execute("SELECT COUNT(*), SUM(amount) FROM transactions")
+    assert tuple(await cur.fetchone()) == (2, 50)
+    cur = await conn.execute("SELECT COUNT(*) FROM categories WHERE name = 'Fantasma'")
+    assert (await cur.fetchone())[0] == 0
+    cur = await conn.execute("SELECT COUNT(*) FROM product_prices")
+    assert (await cur.fetchone())[0] == 1
+
+
+@pytest.mark.anyio
+async def test_lote_acima_do_limite(client, monkeypatch):
+    monkeypatch.setattr(chat.settings, "chat_batch_max_messages", 2)
+    resp = await client.post("/api/chat/batch", json={"messages": ["nada"] * 3})
+    assert resp.status_code == 400
+    assert client.extract_calls == []
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from app.database import Writer
+
+
+@pytest.fixture
+async def writer(conn):
+    await conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT NOT NULL)")
+    w = Writer(batch_size=8)
+    await w.open()
+    try:
+        yield w
+    finally:
+        await w.close()
+
+
+async def _values(conn) -> list[str]:
+    cur = await conn.execute("SELECT v FROM t ORDER BY id")
+    return [r[0] for r in await cur.fetchall()]
+
+
+@pytest.mark.anyio
+async def test_sessoes_simultaneas_saem_em_poucos_commits(writer, conn):
+    async def write(i: int) -> None:
+        async with writer.session() as w:
+            await w.execute("INSERT INTO t (v) VALUES (?)", (f"v{i}",))
+
+    await asyncio.gather(*(write(i) for i in range(20)))
+
+    assert sorted(await _values(conn)) == sorted(f"v{i}" for i in range(20))
+    stats = writer.stats()
+    assert stats["sessions"] == 20
+    assert stats["commits"] < 20
+    assert 1 < stats["max_group"] <= 8
+
+
+@pytest.mark.anyio
+async def test_erro_desfaz_so_a_sessao_que_falhou(writer, conn):
+    async def write(v: str, fail: bool = False) -> None:
+        async with writer.session() as w:
+            await w.execute("INSERT INTO t (v) VALUES (?)", (v,))
+            await w.execute("INSERT INTO t (v) VALUES (?)", (v + "-2",))
+            if fail:
+                raise ValueError(v)
+
+    results = await asyncio.gather(
+        write("a"), write("b", fail=True), write("c"), return_exceptions=True
+    )
+
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], ValueError)
+    assert await _values(conn) == ["a", "a-2", "c", "c-2"]
+    assert writer.stats()["commits"] == 1
+
+
+@pytest.mark.anyio
+async def test_sessao_cancelada_na_fila_nao_trava_as_outras(writer, conn):
+    release = asyncio.Event()
+
+    async def slow() -> None:
+        async with writer.session() as w:
+            await w.execute("INSERT INTO t (v) VALUES ('lenta')")
+            await release.wait()
+
+    async def write(v: str) -> None:
+        async with writer.session() as w:
+            await w.execute("INSERT INTO t (v) VALUES (?)", (v,))
+
+    first = asyncio.create_task(slow())
+    await asyncio.sleep(0.05)  # "lenta" está com a conexão
+    cancelled = asyncio.create_task(write("cancelada"))
+    after = asyncio.create_task(write("depois"))
+    await asyncio.sleep(0.05)
+    cancelled.cancel()
+    release.set()
+    await asyncio.wait_for(asyncio.gather(first, after), timeout=5)
+
+    assert cancelled.cancelled()
+    assert await _values(conn) == ["lenta", "depois"]
@@ -0,0 +1,68 @@
+from datetime import date
+
+import pytest
+
+from app.fastpath import parse_message
+
+TODAY = date(2024, 5, 10)
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "comprei um tênis de cem reais",
+        "marca reunião amanhã",
+        "marquei consulta no dentista",
+        "coloca o nubank como conta principal",
+        "põe o cartão no débito automático",
+        "inclui o aluguel no orçamento",
+    ],
+)
+def test_sem_formato_de_lista_vai_para_o_llm(message):
+    assert parse_message(message, TODAY) is None
+    assert parse_message(message, TODAY, list_items=["leite", "pão"]) is None
+
+
+def test_comprei_sem_lista_ativa_vai_para_o_llm():
+    assert parse_message("comprei o leite", TODAY) is None
+    assert parse_message("peguei o leite", TODAY) is None
+
+
+def test_comprei_item_fora_da_lista_vai_para_o_llm():
+    assert parse_message("comprei um tênis", TODAY, list_items=["leite"]) is None
+    assert parse_message("peguei leite e café", TODAY, list_items=["leite"]) is None
+
+
+def test_peguei_itens_da_lista_ativa():
+    hit = parse_message("peguei o leite e o pão", TODAY, list_items=["Leite", "Pão"])
+    assert hit == ("shopping", {"action": "check_items", "list_name": None, "items": ["leite", "pão"]})
+
+
+def test_marca_na_lista():
+    hit = parse_message("marca o café na lista", TODAY)
+    assert hit == ("shopping", {"action": "check_items", "list_name": None, "items": ["café"]})
+
+
+def test_adiciona_sem_na_lista_exige_lista_ativa():
+    assert parse_message("adiciona leite e pão", TODAY) is None
+    hit = parse_message("adiciona leite e pão", TODAY, list_items=[])
+    assert hit == ("shopping", {"action": "add_items", "list_name": None, "items": ["leite", "pão"]})
+
+
+def test_coloca_na_lista():
+    hit = parse_message("coloca o leite e o pão na lista", TODAY)
+    assert hit == ("shopping", {"action": "add_items", "list_name": None, "items": ["leite", "pão"]})
+
+
+def test_preco_sem_artigo_no_produto():
+    hit = parse_message("o leite piracanjuba guanabara 5,90", TODAY)
+    assert hit == ("product_price", {"product": "leite piracanjuba", "market": "guanabara", "price": 5.9})
+
+
+def test_gasto_simples():
+    hit = parse_message("gastei 50 no mercado ontem", TODAY)
+    assert hit == (
+        "transaction",
+        {"amount": 50.0, "description": "Mercado", "category": "Alimentação",
+         "account": None, "tx_date": "2024-05-09"},
+    )
@@ -0,0 +1,57 @@
+import argparse
+
+import pytest
+
+from app import maintenance, repositories
+from app.database import transaction
+
+
+async def _divergences(conn) -> dict[str, list[tuple]]:
+    return {d.name: await d.verify(conn) for d in maintenance.DERIVED}
+
+
+async def _write_through_repositories(conn) -> None:
+    async with transaction(conn):
+        food = await repositories.get_or_create_category(conn, "Alimentação")
+        fun = await repositories.get_or_create_category(conn, "Lazer")
+        nubank = await repositories.get_or_create_account(conn, "Nubank")
+        for amount, cat, acc, day in [
+            (30.0, food, nubank, "2024-04-28"),
+            (12.5, food, None, "2024-05-02"),
+            (40.0, fun, nubank, "2024-05-03"),
+        ]:
+            await repositories.create_transaction(conn, amount, "gasto", cat, acc, day)
+        await repositories.insert_product_price(conn, "Arroz", "Mercado A", 10.0)
+        await repositories.insert_product_price(conn, "arroz", "Mercado B", 8.0)
+        await repositories.insert_product_price(conn, "Arroz", "mercado b", 11.0)
+
+
+@pytest.mark.anyio
+async def test_escritas_pelos_repositorios_mantem_as_derivadas(conn):
+    await _write_through_repositories(conn)
+    assert await _divergences(conn) == {d.name: [] for d in maintenance.DERIVED}
+    cur = await conn.execute("SELECT market_key, price, is_best FROM product_price_latest ORDER BY 1")
+    assert [tuple(r) for r in await cur.fetchall()] == [("mercado a", 10.0, 1), ("mercado b", 11.0, 0)]
+
+
+@pytest.mark.anyio
+async def test_verify_acha_divergencia_e_rebuild_corrige(conn):
+    await _write_through_repositories(conn)
+    # carga por fora dos repositórios: as derivadas ficam para trás
+    await conn.execute(
+        """INSERT INTO transactions (amount, description, category_id, account_id, tx_date)
+           VALUES (5, 'direto', 1, 1, '2024-06-01')"""
+    )
+    await conn.execute(
+        """INSERT INTO product_prices (product_name, market_name, price, product_key, market_key)
+           VALUES ('Arroz', 'Mercado C', 7, 'arroz', 'mercado c')"""
+    )
+    diffs = await _divergences(conn)
+    assert diffs["monthly_category_totals"] == [(2024, 6, 1, 0, 5.0)]
+    assert diffs["accounts.spending"] == [(1, 70.0, 75.0)]
+    assert {d[1] for d in diffs["product_price_latest"]} == {"mercado a", "mercado c"}
+
+    assert await maintenance.main(argparse.Namespace(command="verify")) == 1
+    assert await maintenance.main(argparse.Namespace(command="rebuild")) == 0
+    assert await maintenance.main(argparse.Namespace(command="verify")) == 0
+    assert await _divergences(conn) == {d.name: [] for d in maintenance.DERIVED}
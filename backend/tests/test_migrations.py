@@ -0,0 +1,99 @@
+import aiosqlite
+import pytest
+
+from app import maintenance, migrations, repositories
+from app.migrations import LATEST_VERSION, Migration, migrate
+
+
+async def _baseline(path: str) -> None:
+    """Banco como era antes do versionamento: schema do passo 1, user_version 0, com dados."""
+    async with aiosqlite.connect(path) as db:
+        await migrations._base_schema(db)
+        await db.execute("INSERT INTO accounts (name) VALUES ('Nubank'), ('Carteira')")
+        await db.executemany(
+            """INSERT INTO transactions (amount, description, category_id, account_id, tx_date)
+               VALUES (?, ?, (SELECT id FROM categories WHERE name = ?), ?, ?)""",
+            [
+                (30.0, "Mercado", "Alimentação", 1, "2024-04-28"),
+                (12.5, "Padaria", "Alimentação", 2, "2024-05-02"),
+                (20.0, "Uber", "Transporte", 1, "2024-05-03"),
+                (7.5, "Lanche", "Alimentação", None, "2024-05-10"),
+            ],
+        )
+        await db.executemany(
+            "INSERT INTO product_prices (product_name, market_name, price, recorded_at) VALUES (?, ?, ?, ?)",
+            [
+                ("Pão  Francês", "Padaria X", 15.0, "2024-05-01 10:00:00"),
+                ("pao francês", "padaria x", 16.0, "2024-05-05 10:00:00"),
+                ("Pão Francês", "Mercado Y", 14.0, "2024-05-02 10:00:00"),
+            ],
+        )
+        await db.executemany(
+            "INSERT INTO prompt_logs (kind, prompt_text, response_text, model) VALUES (?, ?, ?, ?)",
+            [
+                ("extract", "Template\n\nMensagem: uber 20", '{"amount": 20}', "gemini"),
+                ("chat", "Template\n\nMensagem: oi", "Olá!", "gemini"),
+            ],
+        )
+        await db.commit()
+
+
+@pytest.mark.anyio
+async def test_banco_antigo_sobe_ate_a_ultima_versao(tmp_path):
+    path = str(tmp_path / "antigo.db")
+    await _baseline(path)
+
+    assert await migrate(path) == LATEST_VERSION
+    assert await migrate(path) == LATEST_VERSION  # em dia: não faz nada
+
+    async with aiosqlite.connect(path) as db:
+        cur = await db.execute("PRAGMA journal_mode")
+        assert (await cur.fetchone())[0] == "wal"
+        for d in maintenance.DERIVED:
+            assert await d.verify(db) == [], d.name
+
+        cur = await db.execute(
+            "SELECT year, month, total, tx_count FROM monthly_category_totals ORDER BY year, month, tx_count"
+        )
+        assert [tuple(r) for r in await cur.fetchall()] == [
+            (2024, 4, 30.0, 1), (2024, 5, 20.0, 1), (2024, 5, 20.0, 2),
+        ]
+        cur = await db.execute("SELECT name, spending FROM accounts ORDER BY id")
+        assert [tuple(r) for r in await cur.fetchall()] == [("Nubank", 50.0), ("Carteira", 12.5)]
+
+        cur = await db.execute("SELECT DISTINCT product_key FROM product_prices")
+        assert [r[0] for r in await cur.fetchall()] == ["pao frances"]
+        cur = await db.execute(
+            "SELECT market_key, price, is_best FROM product_price_latest ORDER BY market_key"
+        )
+        assert [tuple(r) for r in await cur.fetchall()] == [("mercado y", 14.0, 1), ("padaria x", 16.0, 0)]
+
+        page = await repositories.list_prompt_logs(db)
+        assert [(p.id, p.prompt_text, p.response_text, p.status) for p in page.items] == [
+            (2, "Template\n\nMensagem: oi", "Olá!", "ok"),
+            (1, "Template\n\nMensagem: uber 20", '{"amount": 20}', "ok"),
+        ]
+        cur = await db.execute("SELECT COUNT(*) FROM prompt_blobs")
+        assert (await cur.fetchone())[0] == 5  # "Template" gravado uma vez só
+
+
+@pytest.mark.anyio
+async def test_passo_com_erro_nao_deixa_nada_pela_metade(tmp_path, monkeypatch):
+    path = str(tmp_path / "diane.db")
+    await migrate(path)
+
+    async def broken(db):
+        await db.execute("CREATE TABLE pela_metade (id INTEGER)")
+        raise RuntimeError("falhou no meio")
+
+    steps = [*migrations.MIGRATIONS, Migration(LATEST_VERSION + 1, "broken", broken)]
+    monkeypatch.setattr(migrations, "MIGRATIONS", steps)
+    monkeypatch.setattr(migrations, "LATEST_VERSION", LATEST_VERSION + 1)
+    with pytest.raises(RuntimeError):
+        await migrate(path)
+
+    async with aiosqlite.connect(path) as db:
+        cur = await db.execute("PRAGMA user_version")
+        assert (await cur.fetchone())[0] == LATEST_VERSION
+        cur = await db.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'pela_metade'")
+        assert (await cur.fetchone())[0] == 0
@@ -0,0 +1,81 @@
+import httpx
+import pytest
+
+from app import repositories
+from app.main import app
+from app.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_volta_igual():
+    cursor = encode_cursor("2024-05-10", 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, (str, int)) == ("2024-05-10", 42)
+    assert decode_cursor(None, (str, int)) is None
+    assert decode_cursor("", (str, int)) is None
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "não é base64!",
+        encode_cursor("2024-05-10"),           # faltando o id
+        encode_cursor("2024-05-10", "42"),     # id com tipo errado
+        encode_cursor("2024-05-10", True),     # bool não passa por int
+        encode_cursor(20240510, 42),
+        "eyJhIjoxfQ",                          # JSON válido, mas não é lista
+    ],
+)
+def test_cursor_invalido(cursor):
+    with pytest.raises(ValueError, match="Cursor inválido"):
+        decode_cursor(cursor, (str, int))
+
+
+async def _all_pages(fetch, limit):
+    ids, cursor, pages = [], None, 0
+    while True:
+        page = await fetch(limit=limit, cursor=cursor)
+        pages += 1
+        ids.extend(item.id for item in page.items)
+        if page.next_cursor is None:
+            return ids, pages
+        cursor = page.next_cursor
+
+
+@pytest.mark.anyio
+async def test_transacoes_no_mesmo_dia_nao_repetem_nem_somem(conn):
+    # vários itens empatados em tx_date: o id desempata, sem pular nem repetir na virada de página
+    days = ["2024-05-10"] * 5 + ["2024-05-09"] * 3 + ["2024-05-11"] * 2
+    for i, day in enumerate(days):
+        await repositories.create_transaction(conn, i + 1, f"t{i}", 1, None, day)
+
+    async def fetch(**kw):
+        return await repositories.get_transactions(conn, **kw)
+
+    ids, pages = await _all_pages(fetch, limit=3)
+    cur = await conn.execute("SELECT id FROM transactions ORDER BY tx_date DESC, id DESC")
+    assert ids == [r[0] for r in await cur.fetchall()]
+    assert pages == 4
+
+    ids, pages = await _all_pages(fetch, limit=10)  # página exata: sem página vazia no fim
+    assert len(ids) == 10 and pages == 1
+
+
+@pytest.mark.anyio
+async def test_prompt_logs_com_created_at_empatado(conn):
+    rows = [("extract", f"p{i}", f"r{i}", "fake", "2024-05-10 12:00:00", None, None, None, None, "ok", None)
+            for i in range(7)]
+    await repositories.insert_prompt_logs(conn, rows)
+
+    async def fetch(**kw):
+        return await repositories.list_prompt_logs(conn, **kw)
+
+    ids, _ = await _all_pages(fetch, limit=2)
+    assert ids == [7, 6, 5, 4, 3, 2, 1]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path", ["/api/transactions", "/api/prompt-logs"])
+async def test_cursor_invalido_vira_400(conn, path):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+        resp = await c.get(path, params={"cursor": "lixo"})
+    assert resp.status_code == 400
@@ -0,0 +1,49 @@
+import zlib
+
+import pytest
+
+from app import prompt_store, repositories
+
+TEMPLATE = "Você é um extrator de gastos.\n\nResponda só com JSON."
+
+
+def test_texto_volta_igual():
+    blobs: dict[bytes, bytes] = {}
+    text = TEMPLATE + "\n\nMensagem: gastei 30 no mercado\n\n\n\nfim"
+    refs = prompt_store.encode(text, blobs)
+    segments = {h: zlib.decompress(b).decode() for h, b in blobs.items()}
+    assert prompt_store.decode(refs, segments) == text
+
+
+def test_paragrafo_repetido_vira_um_blob():
+    blobs: dict[bytes, bytes] = {}
+    a = prompt_store.encode(TEMPLATE + "\n\nMensagem: oi", blobs)
+    b = prompt_store.encode(TEMPLATE + "\n\nMensagem: tchau", blobs)
+    assert len(blobs) == 4  # dois parágrafos do template, uma vez só, mais as duas mensagens
+    assert a[: 2 * prompt_store.HASH_SIZE] == b[: 2 * prompt_store.HASH_SIZE]
+    assert len(a) == 3 * prompt_store.HASH_SIZE
+
+
+def test_texto_vazio_nao_gera_blob():
+    blobs: dict[bytes, bytes] = {}
+    assert prompt_store.encode("", blobs) == b""
+    assert blobs == {}
+    assert prompt_store.decode(b"", {}) == ""
+
+
+@pytest.mark.anyio
+async def test_prompt_logs_gravados_e_lidos(conn):
+    rows = [
+        ("extract", TEMPLATE + f"\n\nMensagem: {i}", '{"valor": %d}' % i, "fake",
+         f"2024-05-10 12:00:0{i}", 10.0, 1.0, 100, 20, "ok", None)
+        for i in range(3)
+    ]
+    await repositories.insert_prompt_logs(conn, rows)
+    await repositories.insert_prompt_logs(conn, rows[:1])  # mesmo texto de novo: nenhum blob novo
+    cur = await conn.execute("SELECT COUNT(*) FROM prompt_blobs")
+    assert (await cur.fetchone())[0] == 2 + 3 + 3
+
+    page = await repositories.list_prompt_logs(conn, limit=10)
+    assert [(log.prompt_text, log.response_text) for log in page.items] == [
+        (r[1], r[2]) for r in (rows[2], rows[1], rows[0], rows[0])
+    ]
@@ -0,0 +1,138 @@
+import pytest
+from google.api_core import exceptions as gexc
+
+from app import ratelimit
+from app.config import settings
+from app.ratelimit import (
+    CircuitBreaker,
+    QuotaExceededError,
+    TokenBucket,
+    call_with_limits,
+    is_quota_error,
+    is_retryable,
+)
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        gexc.ResourceExhausted("sem cota"),
+        gexc.TooManyRequests("devagar"),
+        Exception("429 Too Many Requests"),
+        Exception("Quota exceeded for model"),
+    ],
+)
+def test_erro_de_cota(error):
+    assert is_quota_error(error)
+    assert is_retryable(error)
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        gexc.ServiceUnavailable("fora do ar"),
+        gexc.DeadlineExceeded("demorou"),
+        TimeoutError(),
+        Exception("500 Internal error"),
+        Exception("503 Service Unavailable"),
+    ],
+)
+def test_erro_transitorio(error):
+    assert not is_quota_error(error)
+    assert is_retryable(error)
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        Exception("valor 500 inválido"),
+        Exception("modelo gemini-1500 não encontrado"),
+        Exception("gastei R$ 429 no mercado"),
+        gexc.InvalidArgument("400 prompt inválido"),
+        Exception("404 Not Found"),
+        QuotaExceededError("quota: circuito aberto"),
+    ],
+)
+def test_erro_que_nao_se_repete(error):
+    assert not is_retryable(error)
+
+
+@pytest.mark.anyio
+async def test_bucket_desligado_nao_limita():
+    bucket = TokenBucket(0, burst=1)
+    for _ in range(100):
+        await bucket.acquire(max_wait=0)
+
+
+@pytest.mark.anyio
+async def test_bucket_recusa_quando_a_espera_passa_do_limite():
+    bucket = TokenBucket(60, burst=2)  # um token por segundo
+    await bucket.acquire(max_wait=0)
+    await bucket.acquire(max_wait=0)
+    with pytest.raises(QuotaExceededError):
+        await bucket.acquire(max_wait=0.5)
+
+
+def test_breaker_abre_e_deixa_passar_uma_chamada_de_teste(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.ratelimit.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(threshold=2, cooldown=30)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    now[0] += 30
+    assert breaker.allow()  # half_open: uma só
+    assert not breaker.allow()
+    breaker.record_failure()  # falhou de novo: volta a abrir
+    assert breaker.state == "open" and not breaker.allow()
+    now[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(ratelimit, "_bucket", TokenBucket(0, burst=1))
+    monkeypatch.setattr(ratelimit, "_breaker", CircuitBreaker(threshold=2, cooldown=60))
+    monkeypatch.setattr(ratelimit, "_backoff", lambda attempt: 0)
+    monkeypatch.setattr(settings, "llm_max_retries", 2)
+
+
+def _failing(*errors, result="ok"):
+    calls = []
+
+    async def call():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return call, calls
+
+
+@pytest.mark.anyio
+async def test_repete_erro_transitorio_ate_dar_certo(limits):
+    call, calls = _failing(gexc.ServiceUnavailable("x"), Exception("502 Bad Gateway"))
+    assert await call_with_limits(call) == "ok"
+    assert len(calls) == 3
+
+
+@pytest.mark.anyio
+async def test_nao_repete_erro_permanente(limits):
+    call, calls = _failing(ValueError("JSON inválido"))
+    with pytest.raises(ValueError):
+        await call_with_limits(call)
+    assert len(calls) == 1
+
+
+@pytest.mark.anyio
+async def test_erros_de_cota_abrem_o_circuito(limits):
+    call, calls = _failing(*[gexc.ResourceExhausted("quota")] * 5)
+    with pytest.raises(gexc.ResourceExhausted):
+        await call_with_limits(call)
+    assert len(calls) == 2  # threshold=2: o segundo erro abre o circuito e para os retries
+    with pytest.raises(QuotaExceededError):
+        await call_with_limits(call)
+    assert len(calls) == 2
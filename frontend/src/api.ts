@@ -17,6 +17,8 @@ export type Transaction = {
   tx_date: string
   created_at: string
 }
+// Página de uma listagem por cursor: para a próxima, repita os filtros com cursor = next_cursor
+export type Page<T> = { items: T[]; next_cursor: string | null }
 export type CategoryTotal = { category_name: string; total: number }
 export type MonthlySpending = {
   year: number
@@ -87,17 +89,45 @@ export async function getCategories(): Promise<Category[]> {
   return r.json()
 }
 
-export async function getTransactions(params?: { limit?: number; year?: number; month?: number }): Promise<Transaction[]> {
+export type TransactionFilters = {
+  limit?: number
+  year?: number
+  month?: number
+  account_id?: number
+  category_id?: number
+  min_amount?: number
+  max_amount?: number
+  cursor?: string
+}
+
+export async function getTransactions(params?: TransactionFilters): Promise<Page<Transaction>> {
   const sp = new URLSearchParams()
   if (params?.limit) sp.set('limit', String(params.limit))
   if (params?.year != null) sp.set('year', String(params.year))
   if (params?.month != null) sp.set('month', String(params.month))
+  if (params?.account_id != null) sp.set('account_id', String(params.account_id))
+  if (params?.category_id != null) sp.set('category_id', String(params.category_id))
+  if (params?.min_amount != null) sp.set('min_amount', String(params.min_amount))
+  if (params?.max_amount != null) sp.set('max_amount', String(params.max_amount))
+  if (params?.cursor) sp.set('cursor', params.cursor)
   const q = sp.toString()
   const r = await fetch(`${BASE}/transactions${q ? `?${q}` : ''}`)
   if (!r.ok) throw new Error('Erro ao buscar transações')
   return r.json()
 }
 
+// Download em stream (CSV ou NDJSON) de todas as linhas no período; datas YYYY-MM-DD, inclusivas
+export function exportUrl(
+  what: 'transactions' | 'product-prices',
+  params?: { format?: 'csv' | 'ndjson'; start?: string; end?: string },
+): string {
+  const sp = new URLSearchParams()
+  sp.set('format', params?.format ?? 'csv')
+  if (params?.start) sp.set('start', params.start)
+  if (params?.end) sp.set('end', params.end)
+  return `${BASE}/export/${what}?${sp.toString()}`
+}
+
 export async function getMonthlyStats(year?: number, month?: number): Promise<MonthlySpending> {
   const sp = new URLSearchParams()
   if (year != null) sp.set('year', String(year))
@@ -129,6 +159,54 @@ export async function sendChatMessage(message: string): Promise<ChatResponse> {
   return r.json()
 }
 
+export type ChatStreamHandlers = {
+  onPrefix?: (text: string) => void
+  onToken?: (text: string) => void
+  onError?: (text: string, errorType: string) => void
+}
+
+/** POST /chat/stream (SSE): chama os handlers conforme os eventos chegam e resolve com o evento `done`. */
+export async function streamChatMessage(
+  message: string,
+  handlers: ChatStreamHandlers = {}
+): Promise<ChatResponse> {
+  const r = await fetch(`${BASE}/chat/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ message }),
+  })
+  if (!r.ok || !r.body) throw new Error('Erro ao enviar mensagem')
+  const reader = r.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  let done: ChatResponse | null = null
+  for (;;) {
+    const { value, done: finished } = await reader.read()
+    if (finished) break
+    buffer += decoder.decode(value, { stream: true })
+    let sep = buffer.indexOf('\n\n')
+    while (sep >= 0) {
+      const raw = buffer.slice(0, sep)
+      buffer = buffer.slice(sep + 2)
+      sep = buffer.indexOf('\n\n')
+      let event = 'message'
+      let data = ''
+      for (const line of raw.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) data += line.slice(5).trim()
+      }
+      if (!data) continue
+      const payload = JSON.parse(data)
+      if (event === 'prefix') handlers.onPrefix?.(payload.text)
+      else if (event === 'token') handlers.onToken?.(payload.text)
+      else if (event === 'error') handlers.onError?.(payload.text, payload.error_type)
+      else if (event === 'done') done = payload as ChatResponse
+    }
+  }
+  if (!done) throw new Error('Resposta incompleta do servidor')
+  return done
+}
+
 export async function getShoppingLists(): Promise<ShoppingList[]> {
   const r = await fetch(`${BASE}/shopping-lists`)
   if (!r.ok) throw new Error('Erro ao buscar listas')
@@ -230,17 +308,23 @@ export type PromptLog = {
   response_text: string
   model: string
   created_at: string
+  duration_ms: number | null
+  queue_ms: number | null
+  input_tokens: number | null
+  output_tokens: number | null
+  status: string
+  error: string | null
 }
 
 export async function getPromptLogs(params?: {
   limit?: number
-  offset?: number
   kind?: string
-}): Promise<PromptLog[]> {
+  cursor?: string
+}): Promise<Page<PromptLog>> {
   const sp = new URLSearchParams()
   if (params?.limit != null) sp.set('limit', String(params.limit))
-  if (params?.offset != null) sp.set('offset', String(params.offset))
   if (params?.kind != null) sp.set('kind', params.kind)
+  if (params?.cursor) sp.set('cursor', params.cursor)
   const q = sp.toString()
   const r = await fetch(`${BASE}/prompt-logs${q ? `?${q}` : ''}`)
   if (!r.ok) throw new Error('Erro ao buscar logs de prompts')
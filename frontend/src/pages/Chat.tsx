@@ -1,5 +1,5 @@
 import { useState, useRef, useEffect } from 'react'
-import { sendChatMessage, type ChatResponse } from '../api'
+import { streamChatMessage, type ChatResponse } from '../api'
 
 export default function Chat() {
   const [input, setInput] = useState('')
@@ -25,20 +25,49 @@ export default function Chat() {
     setInput('')
     setMessages((m) => [...m, { role: 'user', content: msg }])
     setLoading(true)
+    let started = false
+    let prefix = ''
+    let streamed = ''
+    // Atualiza (ou cria, no primeiro evento) a mensagem da DIANE enquanto o stream chega
+    const render = (patch: { content: string; errorType?: string | null }) => {
+      const first = !started
+      started = true
+      setMessages((m) => {
+        if (first) return [...m, { role: 'assistant', ...patch }]
+        const copy = m.slice()
+        copy[copy.length - 1] = { ...copy[copy.length - 1], ...patch }
+        return copy
+      })
+    }
+    const join = () => (prefix && streamed ? `${prefix}\n\n${streamed}` : prefix || streamed)
     try {
-      const res = await sendChatMessage(msg)
-      setMessages((m) => [
-        ...m,
-        {
-          role: 'assistant',
-          content: res.reply,
-          tx: res.extracted_transaction ?? undefined,
-          errorType: res.error_type ?? undefined,
+      const res = await streamChatMessage(msg, {
+        onPrefix: (text) => {
+          prefix = text
+          render({ content: join() })
         },
-      ])
+        onToken: (text) => {
+          streamed += text
+          render({ content: join() })
+        },
+        onError: (text, errorType) => {
+          streamed = text
+          render({ content: join(), errorType })
+        },
+      })
+      const final = {
+        role: 'assistant' as const,
+        content: res.reply,
+        tx: res.extracted_transaction ?? undefined,
+        errorType: res.error_type ?? undefined,
+      }
+      const replace = started
+      started = true
+      setMessages((m) => (replace ? [...m.slice(0, -1), final] : [...m, final]))
     } catch (err) {
+      const replace = started
       setMessages((m) => [
-        ...m,
+        ...(replace ? m.slice(0, -1) : m),
         {
           role: 'assistant',
           content: `Erro ao enviar mensagem: ${(err as Error).message}`,
@@ -106,7 +135,7 @@ export default function Chat() {
             </div>
           </div>
         ))}
-        {loading && (
+        {loading && messages[messages.length - 1]?.role === 'user' && (
           <div className="max-w-2xl">
             <div className="rounded-2xl px-4 py-3 bg-diane-surface border border-diane-border">
               <span className="text-diane-mute animate-pulse font-mono">…</span>
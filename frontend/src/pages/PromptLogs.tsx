@@ -5,7 +5,9 @@ const KINDS: Record<string, string> = {
   extraction_tx: 'Extração (transação)',
   extraction_shopping: 'Extração (lista)',
   extraction_product_price: 'Extração (preço por mercado)',
+  extraction_unified: 'Extração (unificada)',
   chat: 'Chat',
+  chat_summary: 'Resumo do chat',
 }
 
 function fmtDate(s: string) {
@@ -34,8 +36,16 @@ function LogRow({ log }: { log: PromptLog }) {
             {KINDS[log.kind] ?? log.kind}
           </span>
           <span className="text-diane-mute ml-2">· {log.model}</span>
+          {log.status !== 'ok' && (
+            <span className="text-diane-danger ml-2">
+              · {log.status}
+              {log.error && ` (${log.error})`}
+            </span>
+          )}
           <p className="text-sm text-diane-mute mt-0.5 truncate">
             {fmtDate(log.created_at)}
+            {log.duration_ms != null && ` · ${Math.round(log.duration_ms)} ms`}
+            {log.input_tokens != null && ` · ${log.input_tokens} → ${log.output_tokens ?? '?'} tokens`}
           </p>
         </div>
         <span className="shrink-0 text-diane-mute">
@@ -68,7 +78,9 @@ function LogRow({ log }: { log: PromptLog }) {
 
 export default function PromptLogs() {
   const [logs, setLogs] = useState<PromptLog[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [err, setErr] = useState<string | null>(null)
   const [kind, setKind] = useState<string>('')
 
@@ -76,11 +88,26 @@ export default function PromptLogs() {
     setLoading(true)
     setErr(null)
     getPromptLogs({ limit: 200, kind: kind || undefined })
-      .then(setLogs)
+      .then((page) => {
+        setLogs(page.items)
+        setNextCursor(page.next_cursor)
+      })
       .catch((e) => setErr((e as Error).message))
       .finally(() => setLoading(false))
   }
 
+  function loadMore() {
+    if (!nextCursor) return
+    setLoadingMore(true)
+    getPromptLogs({ limit: 200, kind: kind || undefined, cursor: nextCursor })
+      .then((page) => {
+        setLogs((prev) => [...prev, ...page.items])
+        setNextCursor(page.next_cursor)
+      })
+      .catch((e) => setErr((e as Error).message))
+      .finally(() => setLoadingMore(false))
+  }
+
   useEffect(() => {
     load()
   }, [kind])
@@ -131,6 +158,19 @@ export default function PromptLogs() {
         ))}
       </div>
 
+      {nextCursor && (
+        <div className="mt-4 text-center">
+          <button
+            type="button"
+            onClick={loadMore}
+            disabled={loadingMore}
+            className="rounded-lg bg-diane-accent/20 text-diane-accent px-4 py-2 text-sm font-medium hover:bg-diane-accent/30 disabled:opacity-50"
+          >
+            {loadingMore ? 'Carregando…' : 'Carregar mais'}
+          </button>
+        </div>
+      )}
+
       {logs.length === 0 && !err && (
         <p className="mt-8 text-diane-mute">
           Nenhum log ainda. Use o chat para gerar prompts.
@@ -1,5 +1,14 @@
 import { useState, useEffect } from 'react'
-import { getTransactions } from '../api'
+import {
+  exportUrl,
+  getAccounts,
+  getCategories,
+  getTransactions,
+  type AccountWithStats,
+  type Category,
+  type Transaction,
+  type TransactionFilters,
+} from '../api'
 
 function fmtBrl(n: number) {
   return new Intl.NumberFormat('pt-BR', { style: 'currency', currency: 'BRL' }).format(n)
@@ -15,23 +24,64 @@ function fmtDate(s: string) {
 }
 
 export default function Transactions() {
-  const [txs, setTxs] = useState<Awaited<ReturnType<typeof getTransactions>>>([])
+  const [txs, setTxs] = useState<Transaction[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [err, setErr] = useState<string | null>(null)
   const [year, setYear] = useState<number | ''>('')
   const [month, setMonth] = useState<number | ''>('')
+  const [accountId, setAccountId] = useState<number | ''>('')
+  const [categoryId, setCategoryId] = useState<number | ''>('')
+  const [accounts, setAccounts] = useState<AccountWithStats[]>([])
+  const [categories, setCategories] = useState<Category[]>([])
 
   useEffect(() => {
-    setLoading(true)
-    setErr(null)
-    const params: { limit?: number; year?: number; month?: number } = { limit: 100 }
+    getAccounts().then(setAccounts).catch(() => {})
+    getCategories().then(setCategories).catch(() => {})
+  }, [])
+
+  function filters(): TransactionFilters {
+    const params: TransactionFilters = { limit: 100 }
     if (typeof year === 'number') params.year = year
     if (typeof month === 'number') params.month = month
-    getTransactions(params)
-      .then(setTxs)
+    if (typeof accountId === 'number') params.account_id = accountId
+    if (typeof categoryId === 'number') params.category_id = categoryId
+    return params
+  }
+
+  useEffect(() => {
+    setLoading(true)
+    setErr(null)
+    getTransactions(filters())
+      .then((page) => {
+        setTxs(page.items)
+        setNextCursor(page.next_cursor)
+      })
       .catch((e) => setErr((e as Error).message))
       .finally(() => setLoading(false))
-  }, [year, month])
+  }, [year, month, accountId, categoryId])
+
+  function loadMore() {
+    if (!nextCursor) return
+    setLoadingMore(true)
+    getTransactions({ ...filters(), cursor: nextCursor })
+      .then((page) => {
+        setTxs((prev) => [...prev, ...page.items])
+        setNextCursor(page.next_cursor)
+      })
+      .catch((e) => setErr((e as Error).message))
+      .finally(() => setLoadingMore(false))
+  }
+
+  // período da exportação: o ano/mês escolhido nos filtros (sem filtro, tudo)
+  function exportRange(): { start?: string; end?: string } {
+    if (typeof year !== 'number') return {}
+    if (typeof month !== 'number') return { start: `${year}-01-01`, end: `${year}-12-31` }
+    const mm = String(month).padStart(2, '0')
+    const lastDay = new Date(year, month, 0).getDate()
+    return { start: `${year}-${mm}-01`, end: `${year}-${mm}-${lastDay}` }
+  }
 
   const now = new Date()
   const years = [now.getFullYear(), now.getFullYear() - 1]
@@ -63,6 +113,32 @@ export default function Transactions() {
             <option key={m} value={m}>{m.toString().padStart(2, '0')}</option>
           ))}
         </select>
+        <select
+          value={accountId}
+          onChange={(e) => setAccountId(e.target.value ? Number(e.target.value) : '')}
+          className="rounded-lg bg-diane-surface border border-diane-border px-3 py-2 text-diane-cream"
+        >
+          <option value="">Todas as contas</option>
+          {accounts.map((a) => (
+            <option key={a.id} value={a.id}>{a.name}</option>
+          ))}
+        </select>
+        <select
+          value={categoryId}
+          onChange={(e) => setCategoryId(e.target.value ? Number(e.target.value) : '')}
+          className="rounded-lg bg-diane-surface border border-diane-border px-3 py-2 text-diane-cream"
+        >
+          <option value="">Todas as categorias</option>
+          {categories.map((c) => (
+            <option key={c.id} value={c.id}>{c.name}</option>
+          ))}
+        </select>
+        <a
+          href={exportUrl('transactions', exportRange())}
+          className="rounded-lg bg-diane-accent/20 text-diane-accent px-4 py-2 text-sm font-medium hover:bg-diane-accent/30"
+        >
+          Exportar CSV
+        </a>
       </div>
 
       {err && <p className="mt-4 text-diane-danger">Erro: {err}</p>}
@@ -95,6 +171,18 @@ export default function Transactions() {
           {txs.length === 0 && (
             <p className="py-8 text-center text-diane-mute">Nenhuma transação. Registre pelo chat.</p>
           )}
+          {nextCursor && (
+            <div className="mt-4 text-center">
+              <button
+                type="button"
+                onClick={loadMore}
+                disabled={loadingMore}
+                className="rounded-lg bg-diane-accent/20 text-diane-accent px-4 py-2 text-sm font-medium hover:bg-diane-accent/30 disabled:opacity-50"
+              >
+                {loadingMore ? 'Carregando…' : 'Carregar mais'}
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>